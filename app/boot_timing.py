@@ -0,0 +1,40 @@
+import array
+from utime import ticks_us, ticks_diff
+
+# Boot phase timing.
+#
+# Imported first by main.py; every phase is marked once with the microseconds since
+# then. The report is published to the device's $boot topic once the broker is
+# connected and all phases are marked, so boot time can be tracked per firmware build.
+
+IMPORTS = const(0)
+NODES = const(1)
+FIRST_SAMPLE = const(2)
+FIRST_VALVE_COMMAND = const(3)
+BROKER_CONNECTED = const(4)
+NAMES = ("imports", "nodes", "firstSample", "firstValveCommand", "brokerConnected")
+
+_start = ticks_us()
+_marks = array.array('i', [-1] * len(NAMES))
+
+
+def mark(phase: int):
+    if _marks[phase] < 0:
+        _marks[phase] = ticks_diff(ticks_us(), _start)
+
+
+def complete():
+    for us in _marks:
+        if us < 0:
+            return False
+    return True
+
+
+def elapsed(phase: int):
+    # microseconds since boot, -1 if not reached yet
+    return _marks[phase]
+
+
+def report():
+    # "imports=12345,nodes=...", microseconds since boot, -1 for phases not reached yet
+    return ",".join("%s=%d" % (NAMES[phase], _marks[phase]) for phase in range(len(NAMES)))
@@ -0,0 +1,16 @@
+import settings
+
+# One entry per heating circuit: (valve open pin, valve close pin, flow temperature ADC pin).
+# The first circuit keeps the node and property ids of a single circuit installation
+# ("pid", "flowTempValve", "TargetTempCalc", Floors/numberOfOpenValves,
+# Temperatures/flowTemperature), the others get the circuit number appended ("pid2",
+# "flowTempValve2", "TargetTempCalc2", Floors/numberOfOpenValves2, ...).
+CIRCUITS = getattr(settings, "HEATING_CIRCUITS", ((0, 1, 27),))
+
+
+def suffix(circuit: int):
+    return "" if circuit == 0 else str(circuit + 1)
+
+
+def circuitName(name: str, circuit: int):
+    return name if circuit == 0 else "%s %d" % (name, circuit + 1)
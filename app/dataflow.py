@@ -0,0 +1,67 @@
+from utime import ticks_ms, ticks_add, ticks_diff
+
+# Change-driven evaluation of a small graph of computations.
+#
+# A Stage computes a value, usually from the values of its input stages. evaluate()
+# goes through the stages in the order they were added (inputs are always added before
+# the stages that use them) and recomputes a stage only if it is dirty or its deadline
+# is due. A stage is dirty when an input changed or invalidate() was called for it, e.g.
+# by a message; its deadline is due every period ms on a fixed grid (0: on every
+# evaluation, None: never; a deadline missed by more than a period restarts the grid),
+# so a sampled computation like the PID keeps its rhythm no matter how often inputs
+# change in between. A new value only counts as a change, and marks the dependent
+# stages dirty, if it differs from the last propagated value by more than tolerance,
+# so small changes are not passed on until they add up.
+
+
+class Stage:
+
+    def __init__(self, compute, inputs, tolerance, period):
+        self.compute = compute
+        self.tolerance = tolerance
+        self.period = period
+        self.deadline = ticks_ms()
+        self.value = None
+        self.dirty = True
+        self.dependents = []
+        for stage in inputs:
+            stage.dependents.append(self)
+
+    def invalidate(self):
+        self.dirty = True
+
+
+class Dataflow:
+
+    def __init__(self):
+        self.stages = []
+        self.computations = 0
+
+    def add(self, compute, inputs=(), tolerance=0, period=None):
+        stage = Stage(compute, inputs, tolerance, period)
+        self.stages.append(stage)
+        return stage
+
+    def evaluate(self):
+        now = ticks_ms()
+        for stage in self.stages:
+            period = stage.period
+            due = period is not None and ticks_diff(now, stage.deadline) >= 0
+            if not (stage.dirty or due):
+                continue
+            if period:
+                if stage.value is None:
+                    # the first computation starts the grid
+                    stage.deadline = ticks_add(now, period)
+                elif due:
+                    stage.deadline = ticks_add(stage.deadline, period)
+                    if ticks_diff(now, stage.deadline) >= 0:
+                        stage.deadline = ticks_add(now, period)
+            stage.dirty = False
+            value = stage.compute()
+            self.computations += 1
+            previous = stage.value
+            if previous is None or abs(value - previous) > stage.tolerance:
+                stage.value = value
+                for dependent in stage.dependents:
+                    dependent.dirty = True
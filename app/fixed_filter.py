@@ -0,0 +1,148 @@
+# Integer kernels for the sampling callback.
+#
+# Filter states are ADC codes in fixed point with STATE_FRACTION_BITS fractional bits,
+# inputs are read_u16() scaled readings (4 fractional bits, hence the shift by 10) and coefficients are Q16 (65536 == 1.0).
+# All intermediate values stay below 2**30, so the kernels neither allocate on
+# MicroPython nor overflow the 32 bit viper integers, and the pure Python versions
+# below give bit-identical results on CPython.
+#
+# filterChannels() runs a selectable filter per channel, kinds[i] picks one of
+#
+#   LOWPASS      first order lowpass with coeff[i], the same as lowpass()
+#   MEDIAN       median of the last MEDIAN_WINDOW readings into a first order lowpass,
+#                removes single outliers, so the lowpass can be faster for the same noise
+#   BUTTERWORTH  second order lowpass, a state variable filter with frequency f and
+#                damping q - 1 (q = sqrt(2) for Butterworth)
+#   KALMAN       steady state Kalman filter of a constant velocity model (alpha-beta
+#                filter), follows ramps without lag
+#
+# with the Q16 parameters params[2i], params[2i + 1] (see filterParameters()) and
+# MEMORY_SIZE ints of memory[] per channel: the median window and its next index, the
+# band pass state of the state variable filter or the velocity of the Kalman filter in
+# state units with VELOCITY_BITS more fractional bits.
+import math
+import sys
+
+STATE_FRACTION_BITS = 14
+STATE_MAX = (4096 << 14) - 1
+COEFFICIENT_ONE = 65536
+
+LOWPASS, MEDIAN, BUTTERWORTH, KALMAN = (0, 1, 2, 3)
+FILTERS = ("lowpass", "median", "butterworth", "kalman")
+MEDIAN_WINDOW = 5
+MEMORY_SIZE = 6
+VELOCITY_BITS = 10
+VELOCITY_MAX = 1 << 27
+
+
+def coefficient(k: float):
+    return max(0, min(COEFFICIENT_ONE - 1, int(k * COEFFICIENT_ONE + 0.5)))
+
+
+def filterParameters(kind: int, timeConstant: float, samplePeriod: int):
+    # Q16 parameters for a time constant in seconds at samplePeriod ms; the Kalman beta
+    # only fits Q16 with VELOCITY_BITS for time constants of a few seconds and above
+    ratio = samplePeriod / 1000 / timeConstant
+    if kind == BUTTERWORTH:
+        # cutoff frequency 1 / (2 pi timeConstant)
+        return (coefficient(2 * math.sin(ratio / 2)), coefficient(math.sqrt(2) - 1))
+    alpha = 1 - math.exp(-ratio)
+    if kind == KALMAN:
+        beta = 2 * (2 - alpha) - 4 * math.sqrt(1 - alpha)
+        return (coefficient(alpha), coefficient(beta * (1 << VELOCITY_BITS)))
+    return (coefficient(alpha), 0)
+
+
+def resetMemory(kind: int, memory, base: int, state: int):
+    # start the filter memory from a settled state, so switching filters is bumpless
+    for i in range(MEMORY_SIZE):
+        memory[base + i] = 0
+    if kind == MEDIAN:
+        for i in range(MEDIAN_WINDOW):
+            memory[base + i] = state >> 10
+
+
+def trimmedSum(burst, samples, trim):
+    # insertion sort in place, then sum what is left after dropping trim samples at each end
+    for i in range(1, samples):
+        sample = burst[i]
+        j = i
+        while j > 0 and burst[j - 1] > sample:
+            burst[j] = burst[j - 1]
+            j -= 1
+        burst[j] = sample
+    total = 0
+    for i in range(trim, samples - trim):
+        total += burst[i]
+    return total
+
+
+def seed(state, inp, n):
+    for i in range(n):
+        state[i] = inp[i] << 10
+
+
+def lowpass(state, inp, coeff, n):
+    # state += round((input - state) * k), with the product split at bit 14 to stay within 30 bits
+    for i in range(n):
+        y = state[i]
+        d = (inp[i] << 10) - y
+        k = coeff[i]
+        state[i] = y + (((d >> 14) * k + (((d & 0x3FFF) * k + 0x8000) >> 14)) >> 2)
+
+
+
+def filterChannels(kinds, state, inp, coeff, params, memory, n):
+    for i in range(n):
+        kind = kinds[i]
+        x = inp[i] << 10
+        y = state[i]
+        k = coeff[i]
+        m = i * MEMORY_SIZE
+        if kind == MEDIAN:
+            # the newest reading replaces the oldest, the median is the value with two below it
+            j = memory[m + MEDIAN_WINDOW]
+            memory[m + j] = inp[i]
+            memory[m + MEDIAN_WINDOW] = j + 1 if j < MEDIAN_WINDOW - 1 else 0
+            a = 0
+            while a < MEDIAN_WINDOW:
+                v = memory[m + a]
+                below = 0
+                equal = 0
+                for b in range(MEDIAN_WINDOW):
+                    w = memory[m + b]
+                    if w < v:
+                        below += 1
+                    elif w == v:
+                        equal += 1
+                if below <= MEDIAN_WINDOW // 2 < below + equal:
+                    break
+                a += 1
+            x = v << 10
+            k = params[2 * i]
+        if kind == BUTTERWORTH:
+            f = params[2 * i]
+            q = params[2 * i + 1]
+            band = memory[m]
+            y += ((band >> 14) * f + (((band & 0x3FFF) * f + 0x8000) >> 14)) >> 2
+            high = x - y - band - (((band >> 14) * q + (((band & 0x3FFF) * q + 0x8000) >> 14)) >> 2)
+            band += ((high >> 14) * f + (((high & 0x3FFF) * f + 0x8000) >> 14)) >> 2
+            memory[m] = band
+        elif kind == KALMAN:
+            alpha = params[2 * i]
+            beta = params[2 * i + 1]
+            velocity = memory[m]
+            y += (velocity + (1 << (VELOCITY_BITS - 1))) >> VELOCITY_BITS
+            r = x - y
+            y += ((r >> 14) * alpha + (((r & 0x3FFF) * alpha + 0x8000) >> 14)) >> 2
+            velocity += ((r >> 14) * beta + (((r & 0x3FFF) * beta + 0x8000) >> 14)) >> 2
+            memory[m] = max(-VELOCITY_MAX, min(VELOCITY_MAX, velocity))
+        else:
+            d = x - y
+            y += ((d >> 14) * k + (((d & 0x3FFF) * k + 0x8000) >> 14)) >> 2
+        # the second order filters overshoot, keep the state within the lookup tables
+        state[i] = max(0, min(STATE_MAX, y))
+
+
+if sys.implementation.name == "micropython":
+    from fixed_filter_viper import trimmedSum, seed, lowpass, filterChannels
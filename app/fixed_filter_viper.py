@@ -0,0 +1,113 @@
+# Viper twins of the kernels in fixed_filter.py, keep both in sync.
+import micropython
+
+
+@micropython.viper
+def trimmedSum(burst: ptr16, samples: int, trim: int) -> int:
+    i = 1
+    while i < samples:
+        sample = burst[i]
+        j = i
+        while j > 0 and burst[j - 1] > sample:
+            burst[j] = burst[j - 1]
+            j -= 1
+        burst[j] = sample
+        i += 1
+    total = 0
+    i = trim
+    while i < samples - trim:
+        total += burst[i]
+        i += 1
+    return total
+
+
+@micropython.viper
+def seed(state: ptr32, inp: ptr16, n: int):
+    for i in range(n):
+        state[i] = inp[i] << 10
+
+
+@micropython.viper
+def lowpass(state: ptr32, inp: ptr16, coeff: ptr32, n: int):
+    for i in range(n):
+        y = state[i]
+        d = (inp[i] << 10) - y
+        k = coeff[i]
+        state[i] = y + (((d >> 14) * k + (((d & 0x3FFF) * k + 0x8000) >> 14)) >> 2)
+
+
+_STATE_MAX = const((4096 << 14) - 1)
+_MEDIAN = const(1)
+_BUTTERWORTH = const(2)
+_KALMAN = const(3)
+_MEDIAN_WINDOW = const(5)
+_MEDIAN_RANK = const(2)
+_MEMORY_SIZE = const(6)
+_VELOCITY_BITS = const(10)
+_VELOCITY_ROUND = const(1 << 9)
+_VELOCITY_MAX = const(1 << 27)
+
+
+@micropython.viper
+def filterChannels(kinds: ptr8, state: ptr32, inp: ptr16, coeff: ptr32, params: ptr32, memory: ptr32, n: int):
+    for i in range(n):
+        kind = kinds[i]
+        x = inp[i] << 10
+        y = state[i]
+        k = coeff[i]
+        m = i * _MEMORY_SIZE
+        if kind == _MEDIAN:
+            j = memory[m + _MEDIAN_WINDOW]
+            memory[m + j] = inp[i]
+            j += 1
+            if j == _MEDIAN_WINDOW:
+                j = 0
+            memory[m + _MEDIAN_WINDOW] = j
+            v = 0
+            a = 0
+            while a < _MEDIAN_WINDOW:
+                v = memory[m + a]
+                below = 0
+                equal = 0
+                b = 0
+                while b < _MEDIAN_WINDOW:
+                    w = memory[m + b]
+                    if w < v:
+                        below += 1
+                    elif w == v:
+                        equal += 1
+                    b += 1
+                if below <= _MEDIAN_RANK and below + equal > _MEDIAN_RANK:
+                    break
+                a += 1
+            x = v << 10
+            k = params[2 * i]
+        if kind == _BUTTERWORTH:
+            f = params[2 * i]
+            q = params[2 * i + 1]
+            band = memory[m]
+            y += ((band >> 14) * f + (((band & 0x3FFF) * f + 0x8000) >> 14)) >> 2
+            high = x - y - band - (((band >> 14) * q + (((band & 0x3FFF) * q + 0x8000) >> 14)) >> 2)
+            band += ((high >> 14) * f + (((high & 0x3FFF) * f + 0x8000) >> 14)) >> 2
+            memory[m] = band
+        elif kind == _KALMAN:
+            alpha = params[2 * i]
+            beta = params[2 * i + 1]
+            velocity = memory[m]
+            y += (velocity + _VELOCITY_ROUND) >> _VELOCITY_BITS
+            r = x - y
+            y += ((r >> 14) * alpha + (((r & 0x3FFF) * alpha + 0x8000) >> 14)) >> 2
+            velocity += ((r >> 14) * beta + (((r & 0x3FFF) * beta + 0x8000) >> 14)) >> 2
+            if velocity > _VELOCITY_MAX:
+                velocity = _VELOCITY_MAX
+            elif velocity < -_VELOCITY_MAX:
+                velocity = -_VELOCITY_MAX
+            memory[m] = velocity
+        else:
+            d = x - y
+            y += ((d >> 14) * k + (((d & 0x3FFF) * k + 0x8000) >> 14)) >> 2
+        if y < 0:
+            y = 0
+        elif y > _STATE_MAX:
+            y = _STATE_MAX
+        state[i] = y
@@ -1,7 +1,10 @@
-from homie.property import HomieProperty
+from publisher import PublishedProperty
 from homie.node import HomieNode
 from homie.constants import FLOAT, INTEGER
 from PID import PID
+from circuits import suffix, circuitName
+import log
+import state_store
 
 
 
@@ -19,14 +22,14 @@ class FlowTemperatureRegulatorNode(HomieNode):
     valveTarget = 0.0;
     valveCurrent = 0.0;
 
-    def __init__(self):
-        super().__init__(id="pid", name="Flow Temperature Regulator PID", type="Controller")
+    def __init__(self, circuit=0):
+        super().__init__(id="pid" + suffix(circuit), name=circuitName("Flow Temperature Regulator PID", circuit), type="Controller")
 
         self.pid = PID(self.kP, self.kI, self.kD, setpoint=self.targetFlowTemperature, scale='ms')
         self.pid.output_limits = (0, 100)
         self.pid.sample_time = self.sampleTime
 
-        self.kPProperty = HomieProperty(
+        self.kPProperty = PublishedProperty(
             id="kP",
             name="kP",
             settable=True,
@@ -36,7 +39,7 @@ class FlowTemperatureRegulatorNode(HomieNode):
         )
         self.add_property(self.kPProperty)
 
-        self.tNProperty = HomieProperty(
+        self.tNProperty = PublishedProperty(
             id="tN",
             name="tN",
             settable=True,
@@ -46,7 +49,7 @@ class FlowTemperatureRegulatorNode(HomieNode):
         )
         self.add_property(self.tNProperty)
 
-        self.kIProperty = HomieProperty(
+        self.kIProperty = PublishedProperty(
             id="kI",
             name="kI",
             datatype=FLOAT,
@@ -54,7 +57,7 @@ class FlowTemperatureRegulatorNode(HomieNode):
         )
         self.add_property(self.kIProperty)
 
-        self.kDProperty = HomieProperty(
+        self.kDProperty = PublishedProperty(
             id="kD",
             name="kD",
             datatype=FLOAT,
@@ -62,7 +65,7 @@ class FlowTemperatureRegulatorNode(HomieNode):
         )
         self.add_property(self.kDProperty)
 
-        self.sampleTimeProperty = HomieProperty(
+        self.sampleTimeProperty = PublishedProperty(
             id="sampleTime",
             name="sampleTime",
             datatype=INTEGER,
@@ -72,29 +75,69 @@ class FlowTemperatureRegulatorNode(HomieNode):
         )
         self.add_property(self.sampleTimeProperty)
 
+        kP = state_store.register(self.id + "/kP", lambda: self.kP)
+        tN = state_store.register(self.id + "/tN", lambda: self.tN)
+        if (kP is not None and tN is not None and self.validParameter("kP", kP) and self.validParameter("tN", tN)):
+            self.setTunings(kP, tN)
+        sampleTime = state_store.register(self.id + "/sampleTime", lambda: self.sampleTime, True)
+        if (sampleTime is not None):
+            self.setSampleTime(sampleTime)
+        integral = state_store.register(self.id + "/integral", lambda: self.pid._integral)
+        if (integral is not None):
+            self.pid._integral = max(0.0, min(100.0, integral))
+
 
     def kPPropertyMessage(self, topic, payload, retained):
         kP = float(payload)
-        if (kP >= 0.0 and kP < 100.0):
+        if (self.validParameter("kP", kP)):
             self.setTunings(kP, self.tN)
             
     def tNPropertyMessage(self, topic, payload, retained):
         tN = float(payload)
-        if (tN >= 0.0 and tN < 10000.0):
+        if (self.validParameter("tN", tN)):
             self.setTunings(self.kP, tN)
 
     def sampleTimePropertyMessage(self, topic, payload, retained):
-        sampleTime = int(payload)
-        if (sampleTime >= 0 and sampleTime < 100000):
+        self.setSampleTime(int(payload))
+
+    def setSampleTime(self, sampleTime: int):
+        if (self.validParameter("sampleTime", sampleTime)):
             self.sampleTime = sampleTime
             self.pid.sample_time = sampleTime
+            self.sampleTimeProperty.value = sampleTime
+
+    def validParameter(self, name, value):
+        # ranges of the settable parameters, shared by the property messages, the restored
+        # state and checkConfig
+        if (isinstance(value, bool) or not isinstance(value, (int, float))):
+            return False
+        if (name == "kP"):
+            return value >= 0.0 and value < 100.0
+        if (name == "tN"):
+            return value >= 0.0 and value < 10000.0
+        if (name == "sampleTime"):
+            return isinstance(value, int) and value >= 0 and value < 100000
+        return False
+
+    def checkConfig(self, config):
+        # bulk configuration, returns the first invalid parameter or None
+        for name, value in config.items():
+            if not self.validParameter(name, value):
+                return name
+        return None
+
+    def applyConfig(self, config):
+        if "sampleTime" in config:
+            self.setSampleTime(config["sampleTime"])
+        if "kP" in config or "tN" in config:
+            self.setTunings(float(config.get("kP", self.kP)), float(config.get("tN", self.tN)))
 
     def calculateValveTarget(self, currentFlowTemperature, targetFlowTemperature):
         self.currentFlowTemperature = currentFlowTemperature
         self.targetFlowTemperature = targetFlowTemperature
         self.pid.setpoint = self.targetFlowTemperature
         self.valveTarget = self.pid(self.currentFlowTemperature)
-        print("PID called (%.1f, %.1f) -> %.1f" % (self.currentFlowTemperature, self.targetFlowTemperature, self.valveTarget))
+        log.debug("PID called (%.1f, %.1f) -> %.1f", self.currentFlowTemperature, self.targetFlowTemperature, self.valveTarget)
         return int(self.valveTarget)
 
     def setTunings(self, kP, tN):
@@ -1,26 +1,30 @@
 from machine import Pin
 from homie.node import HomieNode
-from homie.property import HomieProperty
+from publisher import PublishedProperty, HEARTBEAT_PERIOD
 from homie.constants import ENUM
 
 class HeatPumpControllerNode(HomieNode):
 
-    pumpPin = Pin(2, Pin.OUT)
-
     def __init__(self):
         super().__init__(id="HeatPump", name="HeatPump", type="Controller")
 
-        self.heatPumpProperty = HomieProperty(
+        self.pumpPin = Pin(2, Pin.OUT)
+
+        self.heatPumpProperty = PublishedProperty(
             id="heatPump",
             name="heatPump",
             datatype=ENUM,
             format="on,off",
             settable=False,
             default="on",
+            heartbeat=HEARTBEAT_PERIOD,
         )
         self.add_property(self.heatPumpProperty)        
 
 
+    def isOn(self):
+        return self.pumpPin.value() == 1
+
     def on(self):
         self.pumpPin.on()
         self.heatPumpProperty.value = "on"
@@ -1,79 +1,309 @@
-from homie.property import HomieProperty
+import array
+import json
+from publisher import PublishedProperty
 from homie.node import HomieNode
-from homie.constants import INTEGER
-from machine import Timer
+from homie.constants import INTEGER, ENUM, STRING
 from flow_temperature_regulator_node import FlowTemperatureRegulatorNode
 from target_flow_temperature_calculator_node import TargetFlowTemperatureCalculatorNode
 from valve_controller_node import ValveControllerNode
 from temperature_reader_node import TemperatureReaderNode
 from heat_pump_controller_node import HeatPumpControllerNode
+from circuits import suffix
+import log
+import state_store
+import settings
+from telemetry import TelemetryFrame, JSON, BINARY
+from job_timing import JobTiming
+from dataflow import Dataflow
+import scheduler
+from uasyncio import create_task
 
 class HeatingControllerNode(HomieNode):
 
-    flowTemperatureRegulator: FlowTemperatureRegulatorNode
-    targetFlowTemperatureCalculator: TargetFlowTemperatureCalculatorNode
-    valveController: ValveControllerNode
+    # sensors are polled every CONTROL_PERIOD, a temperature change below
+    # TEMPERATURE_TOLERANCE centi-degrees does not propagate down the control chain
+    CONTROL_PERIOD = const(10000)
+    TEMPERATURE_TOLERANCE = const(10)
+    # the heating curve is evaluated at least this often, changed parameters right away
+    CURVE_PERIOD = const(60000)
+    # numberOfOpenValves is stored as unsigned 16 bit value
+    MAX_OPEN_VALVES = const(65535)
+
+    # one entry per heating circuit
+    flowTemperatureRegulators: list
+    targetFlowTemperatureCalculators: list
+    valveControllers: list
     temperatureReader: TemperatureReaderNode
     heatPumpController: HeatPumpControllerNode
 
 
-    def __init__(self, temperatureReader, flowTemperatureRegulator, targetFlowTemperatureCalculator, valveController, heatPumpController):
+    def __init__(self, temperatureReader, flowTemperatureRegulators, targetFlowTemperatureCalculators, valveControllers, heatPumpController):
         super().__init__(id="Floors", name="Floors", type="Controller")
 
         self.temperatureReader = temperatureReader
-        self.flowTemperatureRegulator = flowTemperatureRegulator
-        self.targetFlowTemperatureCalculator = targetFlowTemperatureCalculator
-        self.valveController = valveController
+        self.flowTemperatureRegulators = flowTemperatureRegulators
+        self.targetFlowTemperatureCalculators = targetFlowTemperatureCalculators
+        self.valveControllers = valveControllers
         self.heatPumpController = heatPumpController
 
         self.temperatureSensorsInitialized = False
 
-        self.numberOfOpenValves = 1
-        self.numberOfOpenValvesProperty = HomieProperty(
-            id="numberOfOpenValves",
-            name="numberOfOpenValves",
-            datatype=INTEGER,
+        # per circuit state
+        circuits = len(valveControllers)
+        self.numberOfOpenValves = array.array('H', [1] * circuits)
+        self.flowTemperatures = array.array('f', [0.0] * circuits)
+        self.targetFlowTemperatures = array.array('f', [0.0] * circuits)
+        self.valveTargets = array.array('B', [0] * circuits)
+        self.telemetryFormat = getattr(settings, "TELEMETRY_FORMAT", JSON)
+        self.telemetryFrame = TelemetryFrame(circuits)
+        self.telemetryTask = None
+        self.logFormats = ["Flow Temp" + suffix(circuit) + " aktuell: %.1f, Ziel: %.1f Ventil aktuell: %d, Ziel: %d" for circuit in range(circuits)]
+
+        self.numberOfOpenValvesProperties = []
+        for circuit in range(circuits):
+            numberOfOpenValvesProperty = PublishedProperty(
+                id="numberOfOpenValves" + suffix(circuit),
+                name="numberOfOpenValves" + suffix(circuit),
+                datatype=INTEGER,
+                settable=True,
+                default=1,
+                on_message=lambda topic, payload, retained, circuit=circuit: self.numberOfOpenValvesMessage(circuit, payload)
+            )
+            self.add_property(numberOfOpenValvesProperty)
+            self.numberOfOpenValvesProperties.append(numberOfOpenValvesProperty)
+
+        self.logLevelProperty = PublishedProperty(
+            id="logLevel",
+            name="logLevel",
+            datatype=ENUM,
+            format="debug,info,warning,error",
             settable=True,
-            default=1,
-            on_message=self.numberOfOpenValvesMessage
+            default=log.NAMES[log.level],
+            on_message=self.logLevelMessage
         )
-        self.add_property(self.numberOfOpenValvesProperty)
+        self.add_property(self.logLevelProperty)
 
-        self.heatPumpController.off()
+        # bulk configuration of the regulators and calculators: a JSON object per node id,
+        # e.g. {"pid": {"kP": 2.8, "tN": 900}, "TargetTempCalc": {"curve": [[-10, 38], [15, 28]]}}.
+        # All parameters are validated before any is applied, then applied together between two
+        # control cycles; configResult acknowledges with "ok <parameters>" or "error <reason>".
+        self.configurableNodes = {}
+        for node in flowTemperatureRegulators + targetFlowTemperatureCalculators:
+            self.configurableNodes[node.id] = node
 
-        self.every10SecondsTimer = Timer(-1)
-        self.every10SecondsTimer.init(period=10000, mode=Timer.PERIODIC, callback=lambda t:self.every10Seconds())
+        self.configProperty = PublishedProperty(
+            id="config",
+            name="config",
+            datatype=STRING,
+            settable=True,
+            retained=False,
+            restore=False,
+            on_message=self.configMessage
+        )
+        self.add_property(self.configProperty)
 
-        self.temperatureInitializationTimer = Timer(-1)
-        self.temperatureInitializationTimer.init(period=60000, mode=Timer.ONE_SHOT, callback=lambda t:self.finishTemperatureSensorInitialization())
+        self.configResultProperty = PublishedProperty(
+            id="configResult",
+            name="configResult",
+            datatype=STRING,
+            retained=False
+        )
+        self.add_property(self.configResultProperty)
+
+        restored = False
+        for circuit in range(circuits):
+            numberOfOpenValves = state_store.register(self.id + "/numberOfOpenValves" + suffix(circuit), lambda circuit=circuit: self.numberOfOpenValves[circuit], True)
+            if (numberOfOpenValves is not None and numberOfOpenValves >= 0 and numberOfOpenValves <= self.MAX_OPEN_VALVES):
+                self.numberOfOpenValves[circuit] = numberOfOpenValves
+                self.numberOfOpenValvesProperties[circuit].value = numberOfOpenValves
+                restored = True
+        if (restored):
+            self.switchHeatPump()
+        else:
+            self.heatPumpController.off()
+
+        self.buildDataflow()
+        self.evaluationPending = False
+        self.every10SecondsJob = scheduler.every(self.CONTROL_PERIOD, self.every10Seconds, timing=JobTiming("control"))
+        # valve control starts as soon as the temperature readings have converged, at the latest after 60 s
+        self.temperatureReader.onReady = self.finishTemperatureSensorInitialization
+        self.temperatureInitializationJob = scheduler.after(60000, self.temperatureInitializationTimeout)
 
     def finishTemperatureSensorInitialization(self):
-        self.temperatureSensorsInitialized = True
+        if (not self.temperatureSensorsInitialized):
+            self.temperatureSensorsInitialized = True
+            scheduler.cancel(self.temperatureInitializationJob)
+            for stage in self.valveStages:
+                stage.invalidate()
+            self.evaluateSoon()
+
+    def temperatureInitializationTimeout(self):
+        log.warning("temperature readings not converged after 60 s, starting valve control anyway")
+        self.finishTemperatureSensorInitialization()
+
+
+    def buildDataflow(self):
+        # sensor -> target -> PID -> valve per circuit, see dataflow.py. The temperatures
+        # are polled, their properties only published on material changes (the publisher's
+        # heartbeat covers the rest); the PID runs on its sample time grid or when the
+        # target or the demand changed, the valve only when the PID output changed.
+        reader = self.temperatureReader
+        dataflow = self.dataflow = Dataflow()
+        tolerance = self.TEMPERATURE_TOLERANCE
+        self.outsideStage = dataflow.add(lambda: reader.centiDegrees(reader.OUTSIDE), tolerance=tolerance, period=0)
+        returnStage = dataflow.add(lambda: reader.centiDegrees(reader.RETURN), tolerance=tolerance, period=0)
+        dataflow.add(reader.getOutsideTemperature, (self.outsideStage,))
+        dataflow.add(reader.getReturnTemperature, (returnStage,))
+
+        self.demandStages = []
+        self.targetStages = []
+        self.pidStages = []
+        self.valveStages = []
+        for circuit in range(len(self.valveControllers)):
+            flowStage = dataflow.add(lambda channel=reader.flowChannels[circuit]: reader.centiDegrees(channel), tolerance=tolerance, period=0)
+            dataflow.add(lambda circuit=circuit: reader.getFlowTemperature(circuit), (flowStage,))
+            demandStage = dataflow.add(lambda circuit=circuit: self.numberOfOpenValves[circuit])
+            targetStage = dataflow.add(lambda circuit=circuit: self.calculateTarget(circuit), (self.outsideStage,), period=self.CURVE_PERIOD)
+            pidStage = dataflow.add(lambda circuit=circuit: self.calculateValveTarget(circuit), (targetStage, demandStage),
+                                    period=self.flowTemperatureRegulators[circuit].sampleTime)
+            self.valveStages.append(dataflow.add(lambda circuit=circuit: self.setValveTarget(circuit), (pidStage,)))
+            self.targetFlowTemperatureCalculators[circuit].onChange = lambda circuit=circuit: self.curveChanged(circuit)
+            self.demandStages.append(demandStage)
+            self.targetStages.append(targetStage)
+            self.pidStages.append(pidStage)
+
+
+    def curveChanged(self, circuit: int):
+        # a new curve setting takes effect right away, not with the next CURVE_PERIOD
+        self.targetStages[circuit].invalidate()
+        self.evaluateSoon()
 
 
     def every10Seconds(self):
-        flowTemperature = self.temperatureReader.getFlowTemperature()
-        outsideTemperature = self.temperatureReader.getOutsideTemperature()
-        self.temperatureReader.getReturnTemperature()
-
-        targetFlowTemperature = self.targetFlowTemperatureCalculator.calculateTargetFlowTemperature(outsideTemperature)
-        if (self.numberOfOpenValves == 0):
-            print("all floor valves closed, valveTarget=0")
-            valveTarget = 0.0
-        else:
-            valveTarget = self.flowTemperatureRegulator.calculateValveTarget(flowTemperature, targetFlowTemperature)
-        valveCurrent = self.valveController.valveCurrent
+        self.evaluate()
+        self.publishTelemetry()
+
+
+    def evaluate(self):
+        self.evaluationPending = False
+        for circuit in range(len(self.pidStages)):
+            self.pidStages[circuit].period = self.flowTemperatureRegulators[circuit].sampleTime
+        self.dataflow.evaluate()
+
+
+    def evaluateSoon(self):
+        # external events re-evaluate the chain right away instead of with the next poll
+        if (not self.evaluationPending):
+            self.evaluationPending = True
+            scheduler.after(0, self.evaluate, scheduler.HIGH)
+
+
+    def publishTelemetry(self):
+        # in a task of its own, the control cycle never waits for the broker; a frame is
+        # skipped while the previous one has not gone out yet
+        if (self.telemetryFormat is None or self.device is None):
+            return
+        if (self.telemetryTask is not None and not self.telemetryTask.done()):
+            return
+        reader = self.temperatureReader
+        frame = self.telemetryFrame
+        frame.stamp(self.heatPumpController.isOn(), reader.centiDegrees(reader.OUTSIDE), reader.centiDegrees(reader.RETURN))
+        for circuit in range(len(self.valveControllers)):
+            channel = reader.flowChannels[circuit]
+            frame.flow[circuit] = reader.centiDegrees(channel)
+            frame.rawFlow[circuit] = reader.centiDegrees(channel, True)
+            frame.target[circuit] = round(self.targetFlowTemperatures[circuit] * 100)
+            frame.valveTarget[circuit] = self.valveTargets[circuit]
+            frame.valveCurrent[circuit] = self.valveControllers[circuit].valveCurrent
+        self.telemetryTask = create_task(self.device.publish("$telemetry", frame.pack() if self.telemetryFormat == BINARY else frame.json(), False))
+
+
+    def calculateTarget(self, circuit: int):
+        targetFlowTemperature = self.targetFlowTemperatureCalculators[circuit].calculateTargetFlowTemperature(self.outsideStage.value / 100)
+        self.targetFlowTemperatures[circuit] = targetFlowTemperature
+        return targetFlowTemperature
+
+
+    def calculateValveTarget(self, circuit: int):
+        reader = self.temperatureReader
+        flowTemperature = reader.centiDegrees(reader.flowChannels[circuit]) / 100
+        self.flowTemperatures[circuit] = flowTemperature
+        if (self.numberOfOpenValves[circuit] == 0):
+            log.debug("all floor valves of circuit %d closed, valveTarget=0", circuit + 1)
+            return 0
+        return self.flowTemperatureRegulators[circuit].calculateValveTarget(flowTemperature, self.targetFlowTemperatures[circuit])
+
+
+    def setValveTarget(self, circuit: int):
+        valveTarget = self.pidStages[circuit].value
+        self.valveTargets[circuit] = valveTarget
+        valveController = self.valveControllers[circuit]
         if (self.temperatureSensorsInitialized == True):
-            self.valveController.setTarget(valveTarget)
+            valveController.setTarget(valveTarget)
+
+        log.info(self.logFormats[circuit], self.flowTemperatures[circuit], self.targetFlowTemperatures[circuit], valveController.valveCurrent, valveTarget)
+        return valveTarget
 
-        print("Flow Temp aktuell: %.1f, Ziel: %.1f Ventil aktuell: %d, Ziel: %d" % (flowTemperature, targetFlowTemperature, valveCurrent, valveTarget)) 
+    def logLevelMessage(self, topic, payload, retained):
+        for level, name in log.NAMES.items():
+            if name == payload:
+                log.setLevel(level)
+                self.logLevelProperty.value = payload
 
-    def numberOfOpenValvesMessage(self, topic, payload, retained):
+    def configMessage(self, topic, payload, retained):
+        try:
+            config = json.loads(payload)
+        except ValueError:
+            config = None
+        error = None
+        if (not isinstance(config, dict) or len(config) == 0):
+            error = "invalid JSON object"
+        else:
+            for nodeId, values in config.items():
+                node = self.configurableNodes.get(nodeId)
+                if (node is None):
+                    error = "unknown node " + nodeId
+                    break
+                if (not isinstance(values, dict)):
+                    error = "expected object for " + nodeId
+                    break
+                name = node.checkConfig(values)
+                if (name is not None):
+                    error = "invalid " + nodeId + "/" + name
+                    break
+        if (error is not None):
+            log.warning("bulk configuration rejected, see configResult")
+            self.configResultProperty.value = "error " + error
+            return
+        scheduler.after(0, lambda: self.applyConfig(config), scheduler.HIGH)
+
+    def applyConfig(self, config):
+        applied = []
+        for nodeId, values in config.items():
+            self.configurableNodes[nodeId].applyConfig(values)
+            for name in values:
+                applied.append(nodeId + "/" + name)
+        log.info("bulk configuration applied, %d parameters", len(applied))
+        self.configResultProperty.value = "ok " + ",".join(applied)
+        for stage in self.pidStages:
+            stage.invalidate()
+        self.evaluate()
+
+    def numberOfOpenValvesMessage(self, circuit: int, payload):
         numberOfOpenValves = int(payload)
-        print("new value for number of open valves received: %d" % numberOfOpenValves)
-        self.numberOfOpenValves = numberOfOpenValves
-        self.numberOfOpenValvesProperty.value = numberOfOpenValves
-        if (numberOfOpenValves == 0):
+        if (numberOfOpenValves < 0 or numberOfOpenValves > self.MAX_OPEN_VALVES):
+            log.warning("invalid number of open valves of circuit %d: %d", circuit + 1, numberOfOpenValves)
+            return
+        log.info("new value for number of open valves of circuit %d received: %d", circuit + 1, numberOfOpenValves)
+        self.numberOfOpenValves[circuit] = numberOfOpenValves
+        self.numberOfOpenValvesProperties[circuit].value = numberOfOpenValves
+        self.switchHeatPump()
+        self.demandStages[circuit].invalidate()
+        self.evaluateSoon()
+
+    def switchHeatPump(self):
+        # the heat pump runs as long as any circuit has an open floor valve
+        if (sum(self.numberOfOpenValves) == 0):
             self.heatPumpController.off()
         else:
             self.heatPumpController.on()
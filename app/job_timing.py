@@ -0,0 +1,72 @@
+import array
+
+# Start jitter and execution time of the periodic jobs.
+#
+# A JobTiming is fed with both values in microseconds by whoever runs the job: the
+# scheduler for its jobs (jitter is the deviation of the time between two starts from
+# the period), the valve planner for its motor progress timer (jitter is how late the
+# timer fired), both together with the bytes the run allocated on the heap where known.
+# record() only counts into preallocated histograms with the upper bucket
+# limits of LIMITS (the last bucket takes everything above) and keeps the maxima, so it
+# never allocates. report() formats one line per job for the device's $stats/timing/<name>
+# topic, e.g.
+#
+#   count=8640,jitter=8201/402/37/0/0/0,maxJitter=5210,execution=0/8512/128/0/0/0,maxExecution=18402,allocated=51200,maxAllocated=1024
+#
+# The histograms count since boot, allocated is the sum since the previous report and
+# the maxima are reset with every report.
+
+LIMITS = array.array('I', (100, 1000, 10000, 100000, 1000000))
+BUCKETS = const(6)
+
+_all = []
+
+
+def bucket(us: int):
+    index = 0
+    while index < BUCKETS - 1 and us > LIMITS[index]:
+        index += 1
+    return index
+
+
+class JobTiming:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.jitter = array.array('I', [0] * BUCKETS)
+        self.execution = array.array('I', [0] * BUCKETS)
+        self.maxJitter = 0
+        self.maxExecution = 0
+        self.allocated = 0
+        self.maxAllocated = 0
+        _all.append(self)
+
+    def record(self, jitter: int, execution: int, allocated=-1):
+        # a negative jitter or allocation is unknown (first run, collection during the run) and not counted
+        self.count += 1
+        if jitter >= 0:
+            self.jitter[bucket(jitter)] += 1
+            if jitter > self.maxJitter:
+                self.maxJitter = jitter
+        self.execution[bucket(execution)] += 1
+        if execution > self.maxExecution:
+            self.maxExecution = execution
+        if allocated >= 0:
+            self.allocated += allocated
+            if allocated > self.maxAllocated:
+                self.maxAllocated = allocated
+
+    def report(self):
+        line = "count=%d,jitter=%s,maxJitter=%d,execution=%s,maxExecution=%d,allocated=%d,maxAllocated=%d" % (
+            self.count, "/".join(str(n) for n in self.jitter), self.maxJitter,
+            "/".join(str(n) for n in self.execution), self.maxExecution, self.allocated, self.maxAllocated)
+        self.maxJitter = 0
+        self.maxExecution = 0
+        self.allocated = 0
+        self.maxAllocated = 0
+        return line
+
+
+def timings():
+    return _all
@@ -1,4 +1,5 @@
 import utime
+import log
 
 def _clamp(value, limits):
     lower, upper = limits
@@ -115,13 +116,13 @@ class PID(object):
         elif dt <= 0:
             raise ValueError('dt has negative value {}, must be positive'.format(dt))
 
-        print("dt: %d, sample_time: %d" % (dt, self.sample_time))
+        log.debug("dt: %d, sample_time: %d", dt, self.sample_time)
         if self.sample_time is not None and dt < self.sample_time and self._last_output is not None:
-            print("returning last output value: %d" % self._last_output)
+            log.debug("returning last output value: %d", self._last_output)
             # Only update every sample_time
             return self._last_output
 
-        print("PID re-calculating new values...")
+        log.debug("PID re-calculating new values...")
 
         # Compute error terms
         error = self.setpoint - input_
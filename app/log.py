@@ -0,0 +1,141 @@
+import array
+from utime import ticks_ms
+import settings
+
+# Leveled logging for the control paths.
+#
+# debug(), info(), warning() and error() are rebound whenever the level changes, so a
+# disabled level is a call to a no-op and never formats or allocates anything. Enabled
+# messages only store a reference to their (constant) format string and up to MAX_ARGS
+# numeric arguments in a preallocated ring buffer; formatting happens later in drain(),
+# which prints them to the serial console and publishes them to the device's $log topic.
+# onPending is called when a message arrives in the empty buffer, the device runs drain()
+# DRAIN_PERIOD later, so nothing wakes up while there is nothing to log.
+# Arguments are stored as 32 bit floats, "%d" formats them as integers again.
+
+DEBUG = const(10)
+INFO = const(20)
+WARNING = const(30)
+ERROR = const(40)
+NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+
+SLOTS = const(32)
+MAX_ARGS = const(4)
+DRAIN_PERIOD = const(200)
+
+_levels = bytearray(SLOTS)
+_argCounts = bytearray(SLOTS)
+_ticks = array.array('I', [0] * SLOTS)
+_formats = [None] * SLOTS
+_args = array.array('f', [0.0] * (SLOTS * MAX_ARGS))
+_head = 0
+_count = 0
+dropped = 0
+onPending = None
+
+level = ERROR
+
+
+def _write(lvl, fmt, a, b, c, d):
+    global _head, _count, dropped
+    if _count == SLOTS:
+        dropped += 1
+        return
+    slot = (_head + _count) % SLOTS
+    _levels[slot] = lvl
+    _ticks[slot] = ticks_ms()
+    _formats[slot] = fmt
+    offset = slot * MAX_ARGS
+    argCount = 0
+    if a is not None:
+        _args[offset] = a
+        argCount = 1
+        if b is not None:
+            _args[offset + 1] = b
+            argCount = 2
+            if c is not None:
+                _args[offset + 2] = c
+                argCount = 3
+                if d is not None:
+                    _args[offset + 3] = d
+                    argCount = 4
+    _argCounts[slot] = argCount
+    _count += 1
+    if _count == 1 and onPending is not None:
+        onPending()
+
+
+def _discard(fmt, a=None, b=None, c=None, d=None):
+    pass
+
+
+def _debug(fmt, a=None, b=None, c=None, d=None):
+    _write(DEBUG, fmt, a, b, c, d)
+
+
+def _info(fmt, a=None, b=None, c=None, d=None):
+    _write(INFO, fmt, a, b, c, d)
+
+
+def _warning(fmt, a=None, b=None, c=None, d=None):
+    _write(WARNING, fmt, a, b, c, d)
+
+
+def _error(fmt, a=None, b=None, c=None, d=None):
+    _write(ERROR, fmt, a, b, c, d)
+
+
+debug = _discard
+info = _discard
+warning = _discard
+error = _discard
+
+
+def setLevel(lvl: int):
+    global level, debug, info, warning, error
+    level = lvl
+    debug = _debug if lvl <= DEBUG else _discard
+    info = _info if lvl <= INFO else _discard
+    warning = _warning if lvl <= WARNING else _discard
+    error = _error if lvl <= ERROR else _discard
+
+
+def enabled(lvl: int):
+    return level <= lvl
+
+
+def pending():
+    return _count > 0 or dropped > 0
+
+
+def pop():
+    # formats and removes the oldest message, None if the buffer is empty
+    global _head, _count
+    if _count == 0:
+        return None
+    slot = _head
+    offset = slot * MAX_ARGS
+    fmt = _formats[slot]
+    args = tuple(_args[offset:offset + _argCounts[slot]])
+    line = "%d %s %s" % (_ticks[slot], NAMES.get(_levels[slot], "?"), fmt % args if args else fmt)
+    _formats[slot] = None
+    _head = (slot + 1) % SLOTS
+    _count -= 1
+    return line
+
+
+async def drain(device=None):
+    global dropped
+    if dropped:
+        lost = dropped
+        dropped = 0
+        print("%d log messages dropped" % lost)
+    line = pop()
+    while line is not None:
+        print(line)
+        if device is not None:
+            await device.publish("$log", line, False)
+        line = pop()
+
+
+setLevel(getattr(settings, "LOG_LEVEL", DEBUG if settings.DEBUG else WARNING))
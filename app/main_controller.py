@@ -1,5 +1,4 @@
 from esp_micro.esp_micro_controller import EspMicroController
-from pyheat_device import PyHeatDevice
 
 
 class MainController(EspMicroController):
@@ -7,6 +6,8 @@ class MainController(EspMicroController):
         super().__init__()
 
     def createHomieDevice(self, settings):
+        # imported here, so the controller's network setup does not wait for the node modules
+        from pyheat_device import PyHeatDevice
         return PyHeatDevice(settings)
 
     def getDeviceName(self):
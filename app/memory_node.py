@@ -0,0 +1,83 @@
+import gc
+from utime import ticks_us, ticks_diff
+from homie.node import HomieNode
+from homie.constants import INTEGER
+from publisher import PublishedProperty, HEARTBEAT_PERIOD
+import log
+import scheduler
+
+# Heap telemetry and garbage collection at a known idle point.
+#
+# collect() runs as a LOW priority job with the same period and deadline as the control
+# cycle, so it follows every control cycle (and its telemetry) before the next temperature
+# sample is due. Collecting every cycle keeps the heap mostly free, so an automatic
+# collection while the valve motor runs becomes unlikely. lowWatermark is the lowest free
+# heap seen right before a collection since boot; a value that keeps falling is a leak.
+
+class MemoryNode(HomieNode):
+
+    MEMORY_DEADBAND = const(1024)
+    GC_TIME_DEADBAND = const(1000)
+    MIN_PUBLISH_INTERVAL = const(60000)
+
+    def __init__(self, controlJob):
+        super().__init__(id="memory", name="Memory", type="Diagnostics")
+
+        self.lowWatermark = gc.mem_free()
+
+        self.memFreeProperty = PublishedProperty(
+            id="memFree",
+            name="memFree",
+            datatype=INTEGER,
+            unit="B",
+            deadband=self.MEMORY_DEADBAND,
+            minInterval=self.MIN_PUBLISH_INTERVAL,
+            heartbeat=HEARTBEAT_PERIOD,
+        )
+        self.add_property(self.memFreeProperty)
+
+        self.memAllocProperty = PublishedProperty(
+            id="memAlloc",
+            name="memAlloc",
+            datatype=INTEGER,
+            unit="B",
+            deadband=self.MEMORY_DEADBAND,
+            minInterval=self.MIN_PUBLISH_INTERVAL,
+            heartbeat=HEARTBEAT_PERIOD,
+        )
+        self.add_property(self.memAllocProperty)
+
+        self.lowWatermarkProperty = PublishedProperty(
+            id="lowWatermark",
+            name="lowWatermark",
+            datatype=INTEGER,
+            unit="B",
+            default=self.lowWatermark,
+            heartbeat=HEARTBEAT_PERIOD,
+        )
+        self.add_property(self.lowWatermarkProperty)
+
+        self.gcTimeProperty = PublishedProperty(
+            id="gcTime",
+            name="gcTime",
+            datatype=INTEGER,
+            unit="us",
+            deadband=self.GC_TIME_DEADBAND,
+            minInterval=self.MIN_PUBLISH_INTERVAL,
+            heartbeat=HEARTBEAT_PERIOD,
+        )
+        self.add_property(self.gcTimeProperty)
+
+        self.collectJob = scheduler.every(controlJob.period, self.collect, scheduler.LOW, delay=controlJob.deadline - scheduler.now())
+
+    def collect(self):
+        memFree = gc.mem_free()
+        if (memFree < self.lowWatermark):
+            self.lowWatermark = memFree
+            self.lowWatermarkProperty.value = memFree
+            log.debug("new low memory watermark: %d bytes free", memFree)
+        started = ticks_us()
+        gc.collect()
+        self.gcTimeProperty.value = ticks_diff(ticks_us(), started)
+        self.memFreeProperty.value = gc.mem_free()
+        self.memAllocProperty.value = gc.mem_alloc()
@@ -0,0 +1,78 @@
+from uasyncio import sleep_ms
+
+# Driver for the Nano Leser 9 NFC tag reader on I2C.
+#
+# Reading START_SCAN starts a scan, UUID_LENGTH reads BUSY until the scan is done and then
+# the length of the tag UUID (0: no tag), which is read in one transfer from UUID onwards.
+# All reads go into preallocated buffers, a scan with a tag present costs the trigger, a
+# few status polls (POLL_PERIOD apart, the event loop keeps running in between) and one
+# bulk read. startScan() and scanResult() are the two halves of scan() for callers that
+# poll on their own.
+
+class NanoReader:
+
+    ADDRESS = const(0x0C)
+    FIRMWARE_VERSION = const(0xA0)
+    HARDWARE_VERSION = const(0xA2)
+    START_SCAN = const(0xA6)
+    UUID = const(0xB0)
+    UUID_LENGTH = const(0xBF)
+    BUSY = const(0xFF)
+
+    # ISO 14443 UUIDs have 4, 7 or 10 bytes
+    MAX_UUID_LENGTH = const(10)
+    POLL_PERIOD = const(2)
+    SCAN_TIMEOUT = const(200)
+
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.register = bytearray(1)
+        self.uuid = bytearray(self.MAX_UUID_LENGTH)
+        # one view per UUID length, so a bulk read does not allocate
+        uuid = memoryview(self.uuid)
+        self.uuidViews = [uuid[:length] for length in range(self.MAX_UUID_LENGTH + 1)]
+
+    def readRegister(self, register: int):
+        self.i2c.readfrom_mem_into(self.ADDRESS, register, self.register)
+        return self.register[0]
+
+    def detect(self):
+        # (firmware version, hardware version) or None if there is no reader on the bus
+        try:
+            firmwareVersion = self.readRegister(self.FIRMWARE_VERSION)
+            hardwareVersion = self.readRegister(self.HARDWARE_VERSION)
+        except OSError:
+            return None
+        if (firmwareVersion == 0 or firmwareVersion == 0xFF or hardwareVersion == 0 or hardwareVersion == 0xFF):
+            return None
+        return (firmwareVersion, hardwareVersion)
+
+    async def scan(self):
+        # length of the UUID of the tag in the field, read into self.uuid, 0 for no tag
+        # and -1 if the reader did not finish the scan in time
+        self.startScan()
+        length = self.scanResult()
+        waited = 0
+        while (length is None):
+            if (waited >= self.SCAN_TIMEOUT):
+                return -1
+            await sleep_ms(self.POLL_PERIOD)
+            waited += self.POLL_PERIOD
+            length = self.scanResult()
+        return length
+
+    def startScan(self):
+        self.readRegister(self.START_SCAN)
+
+    def scanResult(self):
+        # like scan(), but None while the reader is still busy
+        length = self.readRegister(self.UUID_LENGTH)
+        if (length == self.BUSY):
+            return None
+        length = min(length, self.MAX_UUID_LENGTH)
+        if (length > 0):
+            self.i2c.readfrom_mem_into(self.ADDRESS, self.UUID, self.uuidViews[length])
+        return length
+
+    def tagId(self, length: int):
+        return "".join("%02x" % self.uuid[i] for i in range(length))
@@ -0,0 +1,97 @@
+from machine import Pin, I2C
+from homie.node import HomieNode
+from homie.constants import BOOLEAN, STRING
+from publisher import PublishedProperty, HEARTBEAT_PERIOD
+from nano_reader import NanoReader
+from job_timing import JobTiming
+import log
+import scheduler
+
+class NanoReaderNode(HomieNode):
+
+    SCAN_PERIOD = const(1000)
+    # retry interval while no reader answers on the bus
+    DETECT_PERIOD = const(60000)
+
+    def __init__(self, bus: int, sda: int, scl: int):
+        super().__init__(id="nfc", name="NFC Reader", type="Sensor")
+
+        self.reader = NanoReader(I2C(bus, sda=Pin(sda), scl=Pin(scl), freq=100000))
+        # previous scan, to publish only changes
+        self.lastUuid = bytearray(NanoReader.MAX_UUID_LENGTH)
+        self.lastLength = 0
+        self.detected = False
+        # time the running scan has been polled for
+        self.waited = 0
+
+        self.tagPresentProperty = PublishedProperty(
+            id="tagPresent",
+            name="tagPresent",
+            datatype=BOOLEAN,
+            default="false",
+            heartbeat=HEARTBEAT_PERIOD,
+        )
+        self.add_property(self.tagPresentProperty)
+
+        self.tagIdProperty = PublishedProperty(
+            id="tagId",
+            name="tagId",
+            datatype=STRING,
+            default="",
+            heartbeat=HEARTBEAT_PERIOD,
+        )
+        self.add_property(self.tagIdProperty)
+
+        # every DETECT_PERIOD until a reader answers, then every SCAN_PERIOD
+        self.scanJob = scheduler.every(self.DETECT_PERIOD, self.scanTags, scheduler.LOW, delay=0, timing=JobTiming("nfc"))
+
+
+    def scanTags(self):
+        # starts a scan, pollScan() picks up the result POLL_PERIOD apart without blocking the other jobs
+        reader = self.reader
+        if (not self.detected):
+            versions = reader.detect()
+            if (versions is None):
+                log.warning("no NFC reader detected")
+                return
+            log.info("NFC reader detected, firmware version %d, hardware version %d", versions[0], versions[1])
+            self.detected = True
+            self.scanJob.period = self.SCAN_PERIOD
+        try:
+            reader.startScan()
+        except OSError:
+            log.warning("NFC reader not responding")
+            return
+        self.waited = 0
+        self.pollScan()
+
+
+    def pollScan(self):
+        reader = self.reader
+        try:
+            length = reader.scanResult()
+        except OSError:
+            log.warning("NFC reader not responding")
+            return
+        if (length is None):
+            # the scan did not finish in time, the next one starts with the next period
+            if (self.waited < reader.SCAN_TIMEOUT):
+                self.waited += reader.POLL_PERIOD
+                scheduler.after(reader.POLL_PERIOD, self.pollScan, scheduler.LOW)
+            return
+        if (self.tagChanged(length)):
+            self.tagPresentProperty.value = "true" if length > 0 else "false"
+            self.tagIdProperty.value = reader.tagId(length)
+            log.info("NFC tag present: %d", length > 0)
+
+
+    def tagChanged(self, length: int):
+        uuid = self.reader.uuid
+        lastUuid = self.lastUuid
+        changed = length != self.lastLength
+        for i in range(length):
+            if (uuid[i] != lastUuid[i]):
+                changed = True
+                lastUuid[i] = uuid[i]
+        self.lastLength = length
+        return changed
@@ -0,0 +1,132 @@
+from utime import ticks_ms, ticks_add, ticks_diff
+from homie.property import HomieProperty
+from homie.constants import FLOAT, INTEGER
+import settings
+import scheduler
+
+# Change-threshold and rate-limited publishing of property values.
+#
+# A PublishedProperty quantizes every assigned value to its declared format (the number
+# of decimals of a FLOAT format like "10.0", whole numbers for INTEGER) and only
+# publishes it if it differs from the last published value by at least deadband. Within
+# minInterval of the previous publish a change is held back and published by flush(),
+# and heartbeat republishes an unchanged value after that long, so subscribers can tell
+# a quiet value from a dead device. flush() is a scheduler job that runs only when the
+# earliest held back change or heartbeat is due.
+# Non-retained properties are events and are always published. With
+# settings.PROPERTY_UPDATES = False, values that are not settable are only published
+# with the initial property announcement, the $telemetry frame carries them instead.
+
+# default maximum staleness of measured values
+HEARTBEAT_PERIOD = const(600000)
+
+_timed = []
+_flushJob = None
+_flushAt = 0
+propertyUpdates = getattr(settings, "PROPERTY_UPDATES", True)
+
+
+def decimalsOf(datatype, format):
+    if datatype == INTEGER:
+        return 0
+    if datatype == FLOAT and format:
+        fraction = format.split(":")[-1].split(".")
+        return len(fraction[1]) if len(fraction) > 1 else 0
+    return None
+
+
+class PublishedProperty(HomieProperty):
+
+    def __init__(self, deadband=0, minInterval=0, heartbeat=0, **kwargs):
+        super().__init__(**kwargs)
+        self.decimals = decimalsOf(self.datatype, self.format)
+        self.deadband = deadband
+        self.minInterval = minInterval
+        self.heartbeat = heartbeat
+        self.published = None
+        self.publishedAt = 0
+        self.pending = False
+        if minInterval or heartbeat:
+            _timed.append(self)
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        decimals = self.decimals
+        if decimals == 0:
+            value = int(round(value))
+        elif decimals is not None:
+            value = round(value, decimals)
+        self._value = value
+        if self.pub_on_upd:
+            self.update()
+
+    def changed(self):
+        published = self.published
+        if published is None:
+            return True
+        if self.deadband:
+            return abs(self._value - published) >= self.deadband * 0.999
+        return self._value != published
+
+    def update(self):
+        if self._value is None or not (propertyUpdates or self.settable):
+            return
+        if self.retained and not self.changed():
+            self.pending = False
+        elif self.minInterval and self.published is not None and ticks_diff(ticks_ms(), self.publishedAt) < self.minInterval:
+            self.pending = True
+            schedule(self.minInterval - ticks_diff(ticks_ms(), self.publishedAt))
+        else:
+            self.publish()
+
+    def flush(self, now):
+        # publishes a due change or heartbeat, returns the ms until the next one or None
+        if self.published is None or not (propertyUpdates or self.settable):
+            return None
+        age = ticks_diff(now, self.publishedAt)
+        if (self.pending and age >= self.minInterval) or (self.heartbeat and age >= self.heartbeat):
+            self.publish()
+            age = 0
+        due = self.minInterval - age if self.pending else None
+        if self.heartbeat and (due is None or self.heartbeat - age < due):
+            due = self.heartbeat - age
+        return due
+
+    def publish(self):
+        if self._value is None:
+            return
+        self.published = self._value
+        self.publishedAt = ticks_ms()
+        self.pending = False
+        super().publish()
+        if self.heartbeat:
+            schedule(self.heartbeat)
+
+
+def schedule(delay: int):
+    # makes flush() run in delay ms, unless it runs earlier anyway
+    global _flushJob, _flushAt
+    at = ticks_add(ticks_ms(), delay)
+    if _flushJob is not None:
+        if ticks_diff(at, _flushAt) >= 0:
+            return
+        scheduler.cancel(_flushJob)
+    _flushAt = at
+    _flushJob = scheduler.after(delay, flush, scheduler.LOW)
+
+
+def flush():
+    global _flushJob
+    _flushJob = None
+    now = ticks_ms()
+    delay = None
+    for p in _timed:
+        due = p.flush(now)
+        if due is not None and (delay is None or due < delay):
+            delay = due
+    if delay is not None:
+        schedule(delay)
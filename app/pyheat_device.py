@@ -1,31 +1,115 @@
+import boot_timing
 from homie.device import HomieDevice, await_ready_state
-from utime import time
-from flow_temperature_regulator_node import FlowTemperatureRegulatorNode
-from heating_controller_node import HeatingControllerNode
-from target_flow_temperature_calculator_node import TargetFlowTemperatureCalculatorNode
-from valve_controller_node import ValveControllerNode
-from temperature_reader_node import TemperatureReaderNode
-from heat_pump_controller_node import HeatPumpControllerNode
+from uasyncio import create_task, sleep_ms
+from circuits import CIRCUITS
+import log
+import job_timing
+import scheduler
+import state_store
 
 
 class PyHeatDevice(HomieDevice):
 
+    # $boot is published once all boot phases are reached, at the latest after this many seconds
+    BOOT_REPORT_TIMEOUT = const(600)
+
     def __init__(self, settings):
         super().__init__(settings)
 
-        flowTemperatureRegulator = FlowTemperatureRegulatorNode()
-        targetFlowTemperatureCalculator = TargetFlowTemperatureCalculatorNode()
-        valveController = ValveControllerNode()
-        temperatureReader = TemperatureReaderNode()
+        if state_store.load():
+            log.info("controller state restored from flash")
+
+        # safety first: motor and heat pump outputs off and the temperature filters
+        # seeded, before the control nodes are even imported
+        from valve_controller_node import ValveControllerNode
+        from heat_pump_controller_node import HeatPumpControllerNode
+        valveControllers = [ValveControllerNode(circuit) for circuit in range(len(CIRCUITS))]
         heatPumpController = HeatPumpControllerNode()
 
-        self.add_node(flowTemperatureRegulator)
-        self.add_node(targetFlowTemperatureCalculator)
-        self.add_node(valveController)
+        from temperature_reader_node import TemperatureReaderNode
+        temperatureReader = TemperatureReaderNode(getattr(settings, "SAMPLE_PERIOD", TemperatureReaderNode.SAMPLE_PERIOD))
+
+        # log drain and publisher flush are scheduled when there is something to do
+        self.drainLogJob = None
+        # publishing runs in tasks of its own, a stalled broker connection must not hold up
+        # the scheduler; one task per kind at a time, so they cannot pile up meanwhile
+        self.logTask = None
+        self.timingTask = None
+        log.onPending = self.scheduleLogDrain
+        if log.pending():
+            self.scheduleLogDrain()
+        self.snapshotStateJob = scheduler.every(state_store.SNAPSHOT_PERIOD, state_store.snapshot, scheduler.LOW)
+        self.publishTimingJob = scheduler.every(self.stats_interval * 1000, self.publishTiming, scheduler.LOW)
+        create_task(scheduler.run())
+
+        from flow_temperature_regulator_node import FlowTemperatureRegulatorNode
+        from target_flow_temperature_calculator_node import TargetFlowTemperatureCalculatorNode
+        from heating_controller_node import HeatingControllerNode
+        from memory_node import MemoryNode
+        flowTemperatureRegulators = [FlowTemperatureRegulatorNode(circuit) for circuit in range(len(CIRCUITS))]
+        targetFlowTemperatureCalculators = [TargetFlowTemperatureCalculatorNode(circuit) for circuit in range(len(CIRCUITS))]
+        heatingController = HeatingControllerNode(temperatureReader, flowTemperatureRegulators, targetFlowTemperatureCalculators, valveControllers, heatPumpController)
+        memory = MemoryNode(heatingController.every10SecondsJob)
+
+        # Homie registration in the established node order
+        for circuit in range(len(CIRCUITS)):
+            self.add_node(flowTemperatureRegulators[circuit])
+            self.add_node(targetFlowTemperatureCalculators[circuit])
+            self.add_node(valveControllers[circuit])
         self.add_node(temperatureReader)
         self.add_node(heatPumpController)
-
-        heatingController = HeatingControllerNode(temperatureReader, flowTemperatureRegulator, targetFlowTemperatureCalculator, valveController, heatPumpController)
         self.add_node(heatingController)
+        self.add_node(memory)
+
+        # optional NFC tag reader: (I2C bus, SDA pin, SCL pin)
+        nanoReader = getattr(settings, "NANO_READER", None)
+        if nanoReader is not None:
+            from nano_reader_node import NanoReaderNode
+            self.add_node(NanoReaderNode(*nanoReader))
+
+        boot_timing.mark(boot_timing.NODES)
+        create_task(self.reportBootTiming())
+
+
+    def scheduleLogDrain(self):
+        if self.drainLogJob is None:
+            self.drainLogJob = scheduler.after(log.DRAIN_PERIOD, self.drainLog, scheduler.LOW)
+
+
+    def drainLog(self):
+        # while the previous drain waits for the broker, the messages wait in the log buffer
+        self.drainLogJob = None
+        if (self.logTask is None or self.logTask.done()):
+            self.logTask = create_task(self.publishLog())
+
+
+    async def publishLog(self):
+        await log.drain(self)
+        if log.pending():
+            self.scheduleLogDrain()
+
+
+    def publishTiming(self):
+        if (self.timingTask is None or self.timingTask.done()):
+            self.timingTask = create_task(self.publishTimingReports())
+
+
+    async def publishTimingReports(self):
+        # next to the $stats of the stats extension
+        for timing in job_timing.timings():
+            await self.publish("$stats/timing/" + timing.name, timing.report())
+        await self.publish("$stats/timing/overruns", scheduler.overruns)
 
 
+    @await_ready_state
+    async def reportBootTiming(self):
+        boot_timing.mark(boot_timing.BROKER_CONNECTED)
+        for _ in range(self.BOOT_REPORT_TIMEOUT):
+            if boot_timing.complete():
+                break
+            await sleep_ms(1000)
+        log.info("boot: imports %d us, nodes %d us, first sample %d us", boot_timing.elapsed(boot_timing.IMPORTS),
+                 boot_timing.elapsed(boot_timing.NODES), boot_timing.elapsed(boot_timing.FIRST_SAMPLE))
+        log.info("boot: first valve command %d us, broker connected %d us", boot_timing.elapsed(boot_timing.FIRST_VALVE_COMMAND),
+                 boot_timing.elapsed(boot_timing.BROKER_CONNECTED))
+        await self.publish("$boot", boot_timing.report())
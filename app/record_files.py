@@ -0,0 +1,96 @@
+import struct
+from binascii import crc32
+
+# Records appended to one of two flash files, for the state store and the temperature history.
+#
+# append() writes a record to the active file. When the record does not fit into
+# maxFileSize anymore, the other file is truncated and becomes the active file, so writes
+# are spread over both files and flash use never exceeds 2 * maxFileSize. Every record
+# carries a sequence number, the active file is the one holding the newest record.
+# Reading a file stops at the first record with another magic, a length past the end of
+# the file or a wrong CRC, i.e. at a torn write; the next record then goes to the other
+# file, as it does after a failed append.
+#
+# Record: HEADER "<BBHII" = magic, version, payload length, sequence number, CRC32 of the
+# payload, followed by the payload. records() skips records of another version.
+
+HEADER = "<BBHII"
+HEADER_SIZE = const(12)
+
+
+class RecordFiles:
+
+    def __init__(self, files, maxFileSize, magic, version):
+        self.files = files
+        self.maxFileSize = maxFileSize
+        self.magic = magic
+        self.version = version
+        self.sequence = 0
+
+        # without any record the first append truncates file 0 and starts there
+        self.activeFile = 1
+        self.activeFileSize = maxFileSize
+        for index in range(len(files)):
+            newest = None
+            end = 0
+            for sequence, _, _, position in self.read(index):
+                if sequence is None:
+                    if newest is not None and newest > self.sequence:
+                        self.sequence = newest
+                        self.activeFile = index
+                        # a torn write at the end: continue in the other file
+                        self.activeFileSize = end if end == position else maxFileSize
+                else:
+                    end = position
+                    if newest is None or sequence > newest:
+                        newest = sequence
+
+    def append(self, payload):
+        self.sequence += 1
+        header = struct.pack(HEADER, self.magic, self.version, len(payload), self.sequence, crc32(payload) & 0xFFFFFFFF)
+        try:
+            if self.activeFileSize + HEADER_SIZE + len(payload) > self.maxFileSize:
+                self.activeFile = 1 - self.activeFile
+                self.activeFileSize = 0
+                open(self.files[self.activeFile], "wb").close()
+            with open(self.files[self.activeFile], "ab") as f:
+                f.write(header)
+                f.write(payload)
+        except OSError:
+            # the record may be torn
+            self.activeFileSize = self.maxFileSize
+            raise
+        self.activeFileSize += HEADER_SIZE + len(payload)
+
+    def records(self):
+        # yields (sequence, payload) of the valid records, older file first
+        for index in (1 - self.activeFile, self.activeFile):
+            for sequence, version, payload, _ in self.read(index):
+                if sequence is not None and version == self.version:
+                    yield (sequence, payload)
+
+    def read(self, index):
+        # yields (sequence, version, payload, end of the record) of the valid records and
+        # finally (None, None, None, file size)
+        try:
+            f = open(self.files[index], "rb")
+        except OSError:
+            yield (None, None, None, 0)
+            return
+        with f:
+            size = f.seek(0, 2)
+            f.seek(0)
+            end = 0
+            while True:
+                header = f.read(HEADER_SIZE)
+                if len(header) < HEADER_SIZE:
+                    break
+                magic, version, length, sequence, crc = struct.unpack(HEADER, header)
+                if magic != self.magic or end + HEADER_SIZE + length > size:
+                    break
+                payload = f.read(length)
+                if len(payload) < length or crc32(payload) & 0xFFFFFFFF != crc:
+                    break
+                end += HEADER_SIZE + length
+                yield (sequence, version, payload, end)
+        yield (None, None, None, size)
@@ -0,0 +1,220 @@
+import gc
+from utime import ticks_ms, ticks_us, ticks_diff
+from uasyncio import sleep_ms, create_task, current_task, CancelledError
+import log
+
+# Cooperative scheduler for all periodic work.
+#
+# Jobs are kept in a binary heap ordered by deadline and, for equal deadlines, by
+# priority (lower runs first). run() is a single uasyncio task that sleeps until the
+# earliest deadline (a job added in front of it cuts the sleep short), runs every due
+# job in that order and yields to the other tasks after each one, so nothing heavy runs
+# in interrupt context and the order is deterministic. A callback may be a coroutine
+# function, its coroutine runs as a task of its own, so a slow one (e.g. waiting for the
+# broker) does not hold up the other deadlines; the job is not started again before it
+# has finished. An exception in a job is logged and the job keeps its schedule, it never
+# stops the scheduler. Deadlines are kept on an unwrapped millisecond counter which is
+# rebased before it leaves the small int range, the job being run included. A periodic
+# job that is still running (or not yet started) after its next deadline counts an
+# overrun and skips the missed periods instead of running back to back. Jobs with a
+# JobTiming (see job_timing.py) record their start jitter, execution time and heap
+# allocation, a coroutine until it has finished (the allocation then includes that of
+# the tasks running in between).
+
+HIGH = const(0)
+NORMAL = const(1)
+LOW = const(2)
+
+REBASE_LIMIT = const(0x10000000)
+IDLE_SLEEP = const(60000)
+
+_heap = []
+# the job run() is executing, it is out of the heap but its deadline is rebased as well
+_running = None
+_task = None
+_sleeping = False
+_last = ticks_ms()
+_now = 0
+overruns = 0
+
+
+class Job:
+
+    def __init__(self, callback, period, priority, timing=None):
+        self.callback = callback
+        self.period = period
+        self.priority = priority
+        self.deadline = 0
+        self.index = -1
+        self.runs = 0
+        self.overruns = 0
+        self.timing = timing
+        self.started = 0
+        # the coroutine of the previous run has not finished yet
+        self.busy = False
+
+
+def now():
+    # unwrapped milliseconds since boot
+    global _last, _now
+    t = ticks_ms()
+    _now += ticks_diff(t, _last)
+    _last = t
+    if _now >= REBASE_LIMIT:
+        _now -= REBASE_LIMIT
+        for job in _heap:
+            job.deadline -= REBASE_LIMIT
+        if _running is not None:
+            _running.deadline -= REBASE_LIMIT
+    return _now
+
+
+def _before(a, b):
+    return a.deadline < b.deadline or (a.deadline == b.deadline and a.priority < b.priority)
+
+
+def _place(job, index):
+    _heap[index] = job
+    job.index = index
+
+
+def _siftUp(index):
+    job = _heap[index]
+    while index > 0:
+        parent = (index - 1) >> 1
+        if not _before(job, _heap[parent]):
+            break
+        _place(_heap[parent], index)
+        index = parent
+    _place(job, index)
+
+
+def _siftDown(index):
+    job = _heap[index]
+    count = len(_heap)
+    while True:
+        child = 2 * index + 1
+        if child >= count:
+            break
+        if child + 1 < count and _before(_heap[child + 1], _heap[child]):
+            child += 1
+        if not _before(_heap[child], job):
+            break
+        _place(_heap[child], index)
+        index = child
+    _place(job, index)
+
+
+def _push(job):
+    _heap.append(job)
+    _siftUp(len(_heap) - 1)
+    if job.index == 0 and _sleeping:
+        _task.cancel()
+
+
+def _pop():
+    job = _heap[0]
+    last = _heap.pop()
+    if _heap:
+        _place(last, 0)
+        _siftDown(0)
+    job.index = -1
+    return job
+
+
+def every(period: int, callback, priority=NORMAL, delay=None, timing=None):
+    # runs callback every period ms, the first time after delay (default one period)
+    job = Job(callback, period, priority, timing)
+    job.deadline = now() + (period if delay is None else delay)
+    _push(job)
+    return job
+
+
+def after(delay: int, callback, priority=NORMAL):
+    job = Job(callback, 0, priority)
+    job.deadline = now() + delay
+    _push(job)
+    return job
+
+
+def cancel(job):
+    job.period = 0
+    index = job.index
+    if index < 0:
+        return
+    last = _heap.pop()
+    if index < len(_heap):
+        _place(last, index)
+        _siftDown(index)
+        _siftUp(last.index)
+    job.index = -1
+
+
+def _dispatch(job):
+    job.runs += 1
+    timing = job.timing
+    started = jitter = allocated = 0
+    if timing is not None:
+        started = ticks_us()
+        jitter = abs(ticks_diff(started, job.started) - job.period * 1000) if job.runs > 1 else -1
+        job.started = started
+        allocated = gc.mem_alloc()
+    try:
+        result = job.callback()
+    except Exception:
+        log.error("scheduler: job with period %d ms failed", job.period)
+        return
+    if result is not None:
+        job.busy = True
+        create_task(_complete(job, result, started, jitter, allocated))
+    elif timing is not None:
+        # a collection during the run makes the heap shrink, the allocation is unknown then
+        timing.record(jitter, ticks_diff(ticks_us(), started), gc.mem_alloc() - allocated)
+
+
+async def _complete(job, coroutine, started, jitter, allocated):
+    try:
+        await coroutine
+    except Exception:
+        log.error("scheduler: job with period %d ms failed", job.period)
+    job.busy = False
+    if job.timing is not None:
+        job.timing.record(jitter, ticks_diff(ticks_us(), started), gc.mem_alloc() - allocated)
+
+
+async def run():
+    global overruns, _task, _sleeping, _running
+    _task = current_task()
+    while True:
+        # now() first, it may rebase the deadlines
+        t = now()
+        delay = _heap[0].deadline - t if _heap else IDLE_SLEEP
+        if delay > 0:
+            _sleeping = True
+            try:
+                await sleep_ms(delay)
+            except CancelledError:
+                pass
+            _sleeping = False
+            continue
+
+        job = _running = _pop()
+        if job.busy:
+            job.overruns += 1
+            overruns += 1
+            log.warning("scheduler: job with period %d ms still running", job.period)
+        else:
+            _dispatch(job)
+        if job.period:
+            job.deadline += job.period
+            late = now() - job.deadline
+            if late > 0:
+                missed = late // job.period + 1
+                job.deadline += missed * job.period
+                job.overruns += missed
+                overruns += missed
+                log.warning("scheduler: job with period %d ms overran by %d ms", job.period, late + job.period)
+            _push(job)
+        _running = None
+        if _heap and now() >= _heap[0].deadline:
+            await sleep_ms(0)
@@ -0,0 +1,88 @@
+import struct
+from record_files import RecordFiles
+import log
+
+# Persistent controller state and settable parameters.
+#
+# Nodes register numeric values under a key ("<node id>/<name>") with a getter;
+# register() returns the value restored from flash by load(), or None. snapshot(), run by
+# the scheduler every SNAPSHOT_PERIOD, collects all values and appends them as one record
+# to FILES (see record_files) if anything changed. load() restores the newest record,
+# records of another VERSION are ignored. A failed write is logged and retried with the
+# next snapshot.
+#
+# Record payload: per value the key length (B), the key, the type ("i" or "f") and the
+# value as little endian 32 bit int or float.
+
+VERSION = const(1)
+RECORD_MAGIC = const(0x5B)
+
+MAX_FILE_SIZE = const(4096)
+SNAPSHOT_PERIOD = const(60000)
+FILES = ["/state0.bin", "/state1.bin"]
+
+_entries = []
+_restored = {}
+_files = None
+_lastPayload = None
+
+
+def register(key: str, getter, integer=False):
+    _entries.append((key, getter, integer))
+    return _restored.get(key)
+
+
+def decode(payload):
+    values = {}
+    offset = 0
+    while offset < len(payload):
+        keyLength = payload[offset]
+        key = bytes(payload[offset + 1:offset + 1 + keyLength]).decode()
+        offset += 1 + keyLength
+        if payload[offset] == ord("i"):
+            values[key] = struct.unpack_from("<i", payload, offset + 1)[0]
+        else:
+            # back to the shortest decimal a 32 bit float holds, 2.6 instead of 2.5999999
+            values[key] = float("%.7g" % struct.unpack_from("<f", payload, offset + 1)[0])
+        offset += 5
+    return values
+
+
+def encode():
+    payload = bytearray()
+    for key, getter, integer in _entries:
+        value = getter()
+        if value is None:
+            continue
+        payload.append(len(key))
+        payload.extend(key.encode())
+        payload.extend(b"i" + struct.pack("<i", int(value)) if integer else b"f" + struct.pack("<f", value))
+    return payload
+
+
+def load():
+    global _files, _restored
+    _files = RecordFiles(FILES, MAX_FILE_SIZE, RECORD_MAGIC, VERSION)
+    newest = None
+    for sequence, payload in _files.records():
+        if newest is None or sequence > newest[0]:
+            newest = (sequence, payload)
+    if newest is not None:
+        try:
+            _restored = decode(newest[1])
+        except (ValueError, IndexError, UnicodeError):
+            _restored = {}
+    return len(_restored) > 0
+
+
+def snapshot():
+    global _lastPayload
+    payload = encode()
+    if payload == _lastPayload:
+        return
+    _lastPayload = payload
+    try:
+        _files.append(payload)
+    except OSError as e:
+        log.error("state snapshot failed: errno %d", e.errno or 0)
+        _lastPayload = None
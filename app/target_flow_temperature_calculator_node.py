@@ -1,17 +1,41 @@
-from homie.property import HomieProperty
+import array
+from publisher import PublishedProperty, HEARTBEAT_PERIOD
 from homie.node import HomieNode
-from homie.constants import FLOAT
+from homie.constants import FLOAT, STRING
+from circuits import suffix, circuitName
+import log
+import state_store
 
 class TargetFlowTemperatureCalculatorNode(HomieNode):
 
     slope = -0.3
     origin = 35.0
     maxFlowTemp = 40.0
+    # parallel shift of the whole curve
+    shift = 0.0
 
-    def __init__(self):
-        super().__init__(id="TargetTempCalc", name="Target Temperature Calculator", type="Controller")
+    # optional heating curve "<outside>:<flow>,<outside>:<flow>,..." with ascending outside
+    # temperatures, replaces the straight line origin + outside * slope when set. Flat beyond
+    # the first and last point.
+    CURVE_MAX_POINTS = const(8)
 
-        self.slopeProperty = HomieProperty(
+    # the curve (or line), shifted and capped at maxFlowTemp, is compiled into a table of
+    # deci-degrees for outside temperatures from TABLE_MIN in steps of 1 / TABLE_STEPS_PER_DEGREE,
+    # outside of the table the value at its end applies
+    TABLE_MIN = const(-30)
+    TABLE_STEPS_PER_DEGREE = const(2)
+    TABLE_SIZE = const(121)
+
+    def __init__(self, circuit=0):
+        super().__init__(id="TargetTempCalc" + suffix(circuit), name=circuitName("Target Temperature Calculator", circuit), type="Controller")
+
+        self.curve = []
+        self.table = array.array('h', [0] * self.TABLE_SIZE)
+        self.targetFlowTemperature = None
+        # called after every change of the curve, the heating controller re-evaluates the target
+        self.onChange = None
+
+        self.slopeProperty = PublishedProperty(
             id="slope",
             name="slope",
             settable=True,
@@ -21,7 +45,7 @@ class TargetFlowTemperatureCalculatorNode(HomieNode):
         )
         self.add_property(self.slopeProperty)
 
-        self.originProperty = HomieProperty(
+        self.originProperty = PublishedProperty(
             id="origin",
             name="origin",
             settable=True,
@@ -32,25 +56,71 @@ class TargetFlowTemperatureCalculatorNode(HomieNode):
         )
         self.add_property(self.originProperty)
 
-        self.maxFlowTempProperty = HomieProperty(
+        self.maxFlowTempProperty = PublishedProperty(
             id="maxFlowTemp",
             name="maxFlowTemp",
             settable=True,
             datatype=FLOAT,
             unit="°C",
             default=40.0,
-            on_message=self.slope_msg,
+            on_message=self.maxFlowTemp_msg,
         )
         self.add_property(self.maxFlowTempProperty)
 
-        self.targetTemperatureProperty = HomieProperty(
+        self.curveProperty = PublishedProperty(
+            id="curve",
+            name="curve",
+            settable=True,
+            datatype=STRING,
+            default="",
+            on_message=self.curve_msg,
+        )
+        self.add_property(self.curveProperty)
+
+        self.shiftProperty = PublishedProperty(
+            id="shift",
+            name="shift",
+            settable=True,
+            datatype=FLOAT,
+            unit="°C",
+            default=0.0,
+            on_message=self.shift_msg,
+        )
+        self.add_property(self.shiftProperty)
+
+        self.targetTemperatureProperty = PublishedProperty(
             id="targetFlowTemperature",
             name="targetFlowTemperature",
             datatype=FLOAT,
-            unit="°C", 
-            format="10.0",            
+            unit="°C",
+            format="10.0",
+            deadband=0.1,
+            heartbeat=HEARTBEAT_PERIOD,
         )
-        self.add_property(self.targetTemperatureProperty)        
+        self.add_property(self.targetTemperatureProperty)
+
+        slope = state_store.register(self.id + "/slope", lambda: self.slope)
+        if slope is not None:
+            self.setSlope(slope)
+        origin = state_store.register(self.id + "/origin", lambda: self.origin)
+        if origin is not None:
+            self.setOrigin(origin)
+        maxFlowTemp = state_store.register(self.id + "/maxFlowTemp", lambda: self.maxFlowTemp)
+        if maxFlowTemp is not None:
+            self.setMaxFlowTemp(maxFlowTemp)
+        shift = state_store.register(self.id + "/shift", lambda: self.shift)
+        if shift is not None:
+            self.setShift(shift)
+        curve = []
+        for point in range(self.CURVE_MAX_POINTS):
+            outside = state_store.register(self.id + "/curve%dOutside" % point, lambda point=point: self.curve[point][0] if point < len(self.curve) else None)
+            flow = state_store.register(self.id + "/curve%dFlow" % point, lambda point=point: self.curve[point][1] if point < len(self.curve) else None)
+            if outside is not None and flow is not None:
+                curve.append((outside, flow))
+        if curve:
+            self.setCurve(curve)
+
+        self.compile()
 
     def slope_msg(self, topic, payload, retained):
         slope = float(payload)
@@ -61,29 +131,147 @@ class TargetFlowTemperatureCalculatorNode(HomieNode):
         self.setOrigin(origin)
 
     def maxFlowTemp_msg(self, topic, payload, retained):
-        maxFlowTemp = int(payload)
-        if maxFlowTemp >= 20 and maxFlowTemp <= 50:
-            self.setMaxFlowTemp(maxFlowTemp)           
+        self.setMaxFlowTemp(float(payload))
+
+    def shift_msg(self, topic, payload, retained):
+        self.setShift(float(payload))
+
+    def curve_msg(self, topic, payload, retained):
+        curve = self.parseCurve(payload)
+        if curve is None or not self.setCurve(curve):
+            log.warning("invalid heating curve")
+
+    def parseCurve(self, value):
+        # "<outside>:<flow>,<outside>:<flow>,..." (empty for the straight line) or a list of
+        # [outside, flow] pairs, None if it is not a valid curve
+        try:
+            if isinstance(value, str):
+                curve = [tuple(float(v) for v in point.split(":")) for point in value.split(",")] if value else []
+            else:
+                curve = [tuple(float(v) for v in point) for point in value]
+        except (ValueError, TypeError):
+            return None
+        return curve if self.validCurve(curve) else None
+
+    def validCurve(self, curve):
+        if len(curve) > self.CURVE_MAX_POINTS:
+            return False
+        for i in range(len(curve)):
+            if len(curve[i]) != 2 or not (-40 <= curve[i][0] <= 40 and 10 <= curve[i][1] <= 70):
+                return False
+            if i > 0 and curve[i][0] <= curve[i - 1][0]:
+                return False
+        return True
+
+    def validParameter(self, name, value):
+        # ranges of the settable numbers, shared by the setters and checkConfig
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        if name == "slope":
+            return value > -1 and value < 1
+        if name == "origin":
+            return value >= 0 and value <= 50
+        if name == "maxFlowTemp":
+            return value >= 20 and value <= 50
+        if name == "shift":
+            return value >= -10 and value <= 10
+        return False
+
+    def checkConfig(self, config):
+        # bulk configuration, returns the first invalid parameter or None
+        for name, value in config.items():
+            valid = self.parseCurve(value) is not None if name == "curve" else self.validParameter(name, value)
+            if not valid:
+                return name
+        return None
+
+    def applyConfig(self, config):
+        # all parameters first, the table is compiled once
+        if "slope" in config:
+            self.slope = float(config["slope"])
+            self.slopeProperty.value = self.slope
+        if "origin" in config:
+            self.origin = float(config["origin"])
+            self.originProperty.value = self.origin
+        if "maxFlowTemp" in config:
+            self.maxFlowTemp = float(config["maxFlowTemp"])
+            self.maxFlowTempProperty.value = self.maxFlowTemp
+        if "shift" in config:
+            self.shift = float(config["shift"])
+            self.shiftProperty.value = self.shift
+        if "curve" in config:
+            self.curve = self.parseCurve(config["curve"])
+            self.curveProperty.value = ",".join("%g:%g" % point for point in self.curve)
+        self.compile()
 
     def setSlope(self, slope: float):
-        if slope > -1 and slope < 1:
+        if self.validParameter("slope", slope):
             self.slope = slope
             self.slopeProperty.value = slope
+            self.compile()
 
     def setOrigin(self, origin: float):
-        if origin >= 0 and origin <= 50:
+        if self.validParameter("origin", origin):
             self.origin = origin
             self.originProperty.value = origin
+            self.compile()
 
     def setMaxFlowTemp(self, maxFlowTemp: float):
-        if maxFlowTemp >= 20 and maxFlowTemp <= 50:
+        if self.validParameter("maxFlowTemp", maxFlowTemp):
             self.maxFlowTemp = maxFlowTemp
             self.maxFlowTempProperty.value = maxFlowTemp
+            self.compile()
 
-    def calculateTargetFlowTemperature(self, outsideTemperature: float):
-        targetFlowTemperature = min(self.origin + outsideTemperature * self.slope, self.maxFlowTemp)
-        self.targetTemperatureProperty.value = targetFlowTemperature
-        return self.targetTemperatureProperty.value
+    def setShift(self, shift: float):
+        if self.validParameter("shift", shift):
+            self.shift = shift
+            self.shiftProperty.value = shift
+            self.compile()
+
+    def setCurve(self, curve):
+        if not self.validCurve(curve):
+            return False
+        self.curve = curve
+        self.curveProperty.value = ",".join("%g:%g" % point for point in curve)
+        self.compile()
+        return True
 
+    def curveAt(self, outside: float):
+        curve = self.curve
+        if not curve:
+            return self.origin + outside * self.slope
+        if outside <= curve[0][0]:
+            return curve[0][1]
+        for i in range(1, len(curve)):
+            x0, y0 = curve[i - 1]
+            x1, y1 = curve[i]
+            if outside <= x1:
+                return y0 + (y1 - y0) * (outside - x0) / (x1 - x0)
+        return curve[-1][1]
 
+    def compile(self):
+        table = self.table
+        for i in range(self.TABLE_SIZE):
+            outside = self.TABLE_MIN + i / self.TABLE_STEPS_PER_DEGREE
+            flow = min(self.curveAt(outside) + self.shift, self.maxFlowTemp)
+            table[i] = round(flow * 10)
+        if self.onChange is not None:
+            self.onChange()
 
+    def calculateTargetFlowTemperature(self, outsideTemperature: float):
+        # linear interpolation in the compiled table, quantized to 0.1 °C
+        position = (outsideTemperature - self.TABLE_MIN) * self.TABLE_STEPS_PER_DEGREE
+        table = self.table
+        if position <= 0:
+            deciDegrees = table[0]
+        elif position >= self.TABLE_SIZE - 1:
+            deciDegrees = table[self.TABLE_SIZE - 1]
+        else:
+            index = int(position)
+            low = table[index]
+            deciDegrees = low + round((table[index + 1] - low) * (position - index))
+        targetFlowTemperature = deciDegrees / 10
+        if targetFlowTemperature != self.targetFlowTemperature:
+            self.targetFlowTemperature = targetFlowTemperature
+            self.targetTemperatureProperty.value = targetFlowTemperature
+        return targetFlowTemperature
@@ -0,0 +1,75 @@
+import array
+import struct
+from utime import time
+
+# One telemetry frame per control cycle, published to the device's $telemetry topic
+# as JSON or, more compact, struct-packed binary (settings.TELEMETRY_FORMAT).
+#
+# Binary layout, version 1, little endian, temperatures in centi-degrees:
+#
+#   offset  format   field
+#   0       B        version (1)
+#   1       B        number of heating circuits n
+#   2       B        flags, bit 0: heat pump on
+#   3       x        padding
+#   4       I        timestamp, device epoch seconds
+#   8       h        outside temperature
+#   10      h        return temperature
+#   12 + 8 * i       circuit i, "<hhhBB":
+#           h        flow temperature
+#           h        raw (fast filtered) flow temperature
+#           h        target flow temperature
+#           B        valve target in %
+#           B        valve current in %
+#
+# The frame is 12 + 8 * n bytes; host/telemetry.py decodes it in place.
+#
+# JSON: {"version": 1, "time": ..., "heatPump": 0|1, "outside": 1.23, "return": 28.5,
+#        "circuits": [{"flow": .., "rawFlow": .., "target": .., "valveTarget": .., "valveCurrent": ..}]}
+# with temperatures in degrees.
+
+VERSION = const(1)
+HEADER = "<BBBxIhh"
+HEADER_SIZE = const(12)
+CIRCUIT = "<hhhBB"
+CIRCUIT_SIZE = const(8)
+HEAT_PUMP_ON = const(1)
+
+JSON = "json"
+BINARY = "binary"
+
+
+class TelemetryFrame:
+
+    def __init__(self, circuits: int):
+        self.circuits = circuits
+        self.buffer = bytearray(HEADER_SIZE + circuits * CIRCUIT_SIZE)
+        self.time = 0
+        self.flags = 0
+        self.outside = 0
+        self.returnTemperature = 0
+        # per circuit, filled by the control cycle
+        self.flow = array.array('h', [0] * circuits)
+        self.rawFlow = array.array('h', [0] * circuits)
+        self.target = array.array('h', [0] * circuits)
+        self.valveTarget = array.array('B', [0] * circuits)
+        self.valveCurrent = array.array('B', [0] * circuits)
+
+    def stamp(self, heatPumpOn: bool, outside: int, returnTemperature: int):
+        self.time = time()
+        self.flags = HEAT_PUMP_ON if heatPumpOn else 0
+        self.outside = outside
+        self.returnTemperature = returnTemperature
+
+    def pack(self):
+        buffer = self.buffer
+        struct.pack_into(HEADER, buffer, 0, VERSION, self.circuits, self.flags, self.time, self.outside, self.returnTemperature)
+        for circuit in range(self.circuits):
+            struct.pack_into(CIRCUIT, buffer, HEADER_SIZE + circuit * CIRCUIT_SIZE, self.flow[circuit], self.rawFlow[circuit], self.target[circuit], self.valveTarget[circuit], self.valveCurrent[circuit])
+        return buffer
+
+    def json(self):
+        circuits = ",".join('{"flow":%.2f,"rawFlow":%.2f,"target":%.1f,"valveTarget":%d,"valveCurrent":%d}' % (
+            self.flow[c] / 100, self.rawFlow[c] / 100, self.target[c] / 100, self.valveTarget[c], self.valveCurrent[c]) for c in range(self.circuits))
+        return '{"version":%d,"time":%d,"heatPump":%d,"outside":%.2f,"return":%.2f,"circuits":[%s]}' % (
+            VERSION, self.time, self.flags & HEAT_PUMP_ON, self.outside / 100, self.returnTemperature / 100, circuits)
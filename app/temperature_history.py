@@ -0,0 +1,262 @@
+import array
+import struct
+from utime import time
+from record_files import RecordFiles
+import log
+
+# Compact temperature history, all values in centi-degrees.
+#
+#   recent samples   RECENT_SLOTS samples per channel in a RAM ring buffer
+#   minute buckets   min/avg/max per channel, MINUTE_SLOTS in a RAM ring buffer
+#   hour buckets     min/avg/max per channel, HOUR_SLOTS in a RAM ring buffer
+#   flash            every completed hour is appended to FILES (see record_files) as a
+#                    record holding its minute buckets (one per run of consecutive minutes)
+#                    and a record holding the hour bucket, delta-encoded. Flash use never
+#                    exceeds 2 * MAX_FILE_SIZE.
+#
+# Spill record payload: SPILL_HEADER "<IHBB" = start time, bucket interval in seconds,
+# bucket count, channel count, followed by for every bucket and channel min, avg and max
+# as zigzag varints of the difference to the same field of the previous bucket (the first
+# bucket is relative to 0).
+
+VERSION = const(1)
+RECORD_MAGIC = const(0xA6)
+SPILL_HEADER = "<IHBB"
+SPILL_HEADER_SIZE = const(8)
+
+RAW, MINUTE, HOUR = (0, 1, 2)
+INTERVALS = (0, 60, 3600)
+
+MIN_VALUE = const(-32768)
+MAX_VALUE = const(32767)
+
+
+class Buckets:
+
+    def __init__(self, slots, channels):
+        self.slots = slots
+        self.channels = channels
+        self.count = 0
+        self.head = 0
+        self.times = array.array('I', [0] * slots)
+        self.minimum = array.array('h', [0] * (slots * channels))
+        self.average = array.array('h', [0] * (slots * channels))
+        self.maximum = array.array('h', [0] * (slots * channels))
+
+        # accumulator of the bucket currently being filled
+        self.start = 0
+        self.samples = 0
+        self.accMinimum = array.array('h', [0] * channels)
+        self.accMaximum = array.array('h', [0] * channels)
+        self.accSum = array.array('i', [0] * channels)
+
+    def size(self):
+        return self.slots * (4 + 6 * self.channels) + self.channels * 8
+
+    def add(self, bucketStart, values, samples=1, minimum=None, maximum=None):
+        # returns True if the previous bucket has been closed by this value
+        closed = False
+        if self.samples > 0 and bucketStart != self.start:
+            self.close()
+            closed = True
+        if self.samples == 0:
+            self.start = bucketStart
+            for channel in range(self.channels):
+                self.accMinimum[channel] = MAX_VALUE
+                self.accMaximum[channel] = MIN_VALUE
+                self.accSum[channel] = 0
+        for channel in range(self.channels):
+            low = values[channel] if minimum is None else minimum[channel]
+            high = values[channel] if maximum is None else maximum[channel]
+            if low < self.accMinimum[channel]:
+                self.accMinimum[channel] = low
+            if high > self.accMaximum[channel]:
+                self.accMaximum[channel] = high
+            self.accSum[channel] += values[channel] * samples
+        self.samples += samples
+        return closed
+
+    def close(self):
+        slot = self.head
+        self.times[slot] = self.start
+        offset = slot * self.channels
+        for channel in range(self.channels):
+            self.minimum[offset + channel] = self.accMinimum[channel]
+            self.maximum[offset + channel] = self.accMaximum[channel]
+            self.average[offset + channel] = self.accSum[channel] // self.samples
+        self.head = (slot + 1) % self.slots
+        self.count = min(self.count + 1, self.slots)
+        self.samples = 0
+
+    def latest(self):
+        return (self.head - 1) % self.slots
+
+    def ordered(self):
+        # slot indices from oldest to newest
+        first = (self.head - self.count) % self.slots
+        for i in range(self.count):
+            yield (first + i) % self.slots
+
+
+class TemperatureHistory:
+
+    RECENT_SLOTS = 360      # 1 h at 10 s
+    MINUTE_SLOTS = 120      # 2 h
+    HOUR_SLOTS = 48         # 2 days
+    MAX_FILE_SIZE = 16384
+    FILES = ("/history0.bin", "/history1.bin")
+
+    def __init__(self, channels):
+        self.channels = channels
+
+        self.recentCount = 0
+        self.recentHead = 0
+        self.recentTimes = array.array('I', [0] * self.RECENT_SLOTS)
+        self.recentValues = array.array('h', [0] * (self.RECENT_SLOTS * channels))
+
+        self.minutes = Buckets(self.MINUTE_SLOTS, channels)
+        self.hours = Buckets(self.HOUR_SLOTS, channels)
+
+        self.spill = RecordFiles(self.FILES, self.MAX_FILE_SIZE, RECORD_MAGIC, VERSION)
+
+    def size(self):
+        # RAM held by the ring buffers, fixed at construction
+        return self.RECENT_SLOTS * (4 + 2 * self.channels) + self.minutes.size() + self.hours.size()
+
+    def record(self, values, now=None):
+        if now is None:
+            now = time()
+
+        slot = self.recentHead
+        self.recentTimes[slot] = now
+        offset = slot * self.channels
+        for channel in range(self.channels):
+            self.recentValues[offset + channel] = values[channel]
+        self.recentHead = (slot + 1) % self.RECENT_SLOTS
+        self.recentCount = min(self.recentCount + 1, self.RECENT_SLOTS)
+
+        minuteClosed = self.minutes.add(now - now % 60, values)
+        if minuteClosed:
+            self.rollupMinute()
+
+    def rollupMinute(self):
+        minutes = self.minutes
+        slot = minutes.latest()
+        offset = slot * self.channels
+        start = minutes.times[slot]
+        hourClosed = self.hours.add(
+            start - start % 3600,
+            minutes.average[offset:offset + self.channels],
+            60,
+            minutes.minimum[offset:offset + self.channels],
+            minutes.maximum[offset:offset + self.channels],
+        )
+        if hourClosed:
+            self.spillHour()
+
+    def spillHour(self):
+        # the minute buckets of the closed hour are the ones before the latest (which opened
+        # the next hour) going back while their times are in that hour and ascending, so a
+        # clock jump cannot mix in buckets of another hour
+        minutes = self.minutes
+        hours = self.hours
+        hourSlot = hours.latest()
+        hourStart = hours.times[hourSlot]
+        slots = []
+        slot = minutes.latest()
+        for _ in range(minutes.count - 1):
+            previous = (slot - 1) % minutes.slots
+            t = minutes.times[previous]
+            if t < hourStart or t >= min(hourStart + 3600, minutes.times[slot]):
+                break
+            slots.insert(0, previous)
+            slot = previous
+
+        try:
+            # a record holds consecutive minutes, a gap starts the next one
+            first = 0
+            for i in range(1, len(slots) + 1):
+                if i == len(slots) or minutes.times[slots[i]] != minutes.times[slots[i - 1]] + 60:
+                    self.appendRecord(minutes, slots[first:i], 60)
+                    first = i
+            self.appendRecord(hours, [hourSlot], 3600)
+        except OSError as e:
+            log.warning("history spill failed: errno %d", e.errno or 0)
+
+    def appendRecord(self, buckets, slots, interval):
+        payload = bytearray(struct.pack(SPILL_HEADER, buckets.times[slots[0]], interval, len(slots), self.channels))
+        previous = [0] * (3 * self.channels)
+        for slot in slots:
+            offset = slot * self.channels
+            for channel in range(self.channels):
+                for field, values in enumerate((buckets.minimum, buckets.average, buckets.maximum)):
+                    value = values[offset + channel]
+                    index = 3 * channel + field
+                    writeVarint(payload, zigzag(value - previous[index]))
+                    previous[index] = value
+        self.spill.append(payload)
+
+    def query(self, start, end, resolution):
+        # yields (time, values) for RAW and (time, minimum, average, maximum) for MINUTE and HOUR,
+        # flash records first (older file first), then the RAM ring buffers
+        if resolution == RAW:
+            for i in range(self.recentCount):
+                slot = (self.recentHead - self.recentCount + i) % self.RECENT_SLOTS
+                t = self.recentTimes[slot]
+                if start <= t <= end:
+                    offset = slot * self.channels
+                    yield (t, self.recentValues[offset:offset + self.channels])
+            return
+
+        interval = INTERVALS[resolution]
+        buckets = self.minutes if resolution == MINUTE else self.hours
+        firstInRam = buckets.times[(buckets.head - buckets.count) % buckets.slots] if buckets.count > 0 else end + 1
+        for bucket in self.readRecords(interval, start, min(end, firstInRam - 1)):
+            yield bucket
+        for slot in buckets.ordered():
+            t = buckets.times[slot]
+            if start <= t <= end:
+                offset = slot * self.channels
+                yield (t, buckets.minimum[offset:offset + self.channels], buckets.average[offset:offset + self.channels], buckets.maximum[offset:offset + self.channels])
+
+    def readRecords(self, interval, start, end):
+        for _, payload in self.spill.records():
+            recordStart, recordInterval, count, channels = struct.unpack_from(SPILL_HEADER, payload)
+            if recordInterval != interval or recordStart > end or recordStart + count * interval <= start:
+                continue
+            position = SPILL_HEADER_SIZE
+            values = [0] * (3 * channels)
+            for bucket in range(count):
+                for index in range(3 * channels):
+                    delta, position = readVarint(payload, position)
+                    values[index] += unzigzag(delta)
+                t = recordStart + bucket * interval
+                if start <= t <= end:
+                    yield (t, values[0::3], values[1::3], values[2::3])
+
+
+def zigzag(value):
+    return (value << 1) if value >= 0 else ((-value << 1) - 1)
+
+
+def unzigzag(value):
+    return (value >> 1) if not (value & 1) else -((value + 1) >> 1)
+
+
+def writeVarint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def readVarint(buffer, position):
+    value = 0
+    shift = 0
+    while True:
+        b = buffer[position]
+        position += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, position
+        shift += 7
@@ -1,168 +1,496 @@
 import array
-from machine import ADC, Pin, Timer
+from machine import ADC, Pin
 from homie.node import HomieNode
-from homie.property import HomieProperty
-from homie.constants import FLOAT
+from publisher import PublishedProperty, HEARTBEAT_PERIOD
+from homie.constants import FLOAT, STRING, BOOLEAN
+from uasyncio import sleep_ms, create_task
+from fixed_filter import STATE_FRACTION_BITS, FILTERS, MEMORY_SIZE, coefficient, filterParameters, resetMemory, trimmedSum, seed, lowpass, filterChannels
+from temperature_history import TemperatureHistory, RAW, MINUTE, HOUR
+from circuits import CIRCUITS, suffix
+import boot_timing
+import state_store
+import log
+from job_timing import JobTiming
+import scheduler
 
 class TemperatureReaderNode(HomieNode):
 
-    AF_TEMP_PIN = const(28)
-    RUEF_TEMP_PIN = const(26)
-    VF_TEMP_PIN = const(27)
+    # one entry per sensor: (property id, ADC pin, property id of the fast filtered value or None),
+    # the flow sensor pin is taken from the first heating circuit and the flow sensors of
+    # further circuits are appended
+    CHANNELS = (
+        ("flowTemperature", 27, "rawFlowTemperature"),
+        ("outsideTemperature", 28, None),
+        ("returnTemperature", 26, None),
+    )
+    FLOW, OUTSIDE, RETURN = (0, 1, 2)
 
     REF_VOLTAGE = const(3300)
     REF_RESISTOR = const(3875)
-    
+
     RESISTENCE_CORRECTION_OFFSET = -20
     RESISTENCE_CORRECTION_FACTOR = 1.0
 
-    NO_OF_SAMPLES_TO_AVG = const(128)
+    # ADC reads per channel and wake-up, sorted and reduced to a trimmed mean.
+    # BURST_TRIM samples are dropped at each end, (BURST_SAMPLES - 1) // 2 gives the median.
+    SAMPLE_PERIOD = const(100)
+    BURST_SAMPLES = const(8)
+    BURST_TRIM = const(2)
+    # bursts averaged into the initial filter states at boot
+    SEED_BURSTS = const(16)
+
+    # readiness: exponentially weighted mean square of (reading - filter state) in read_u16
+    # units (16 per ADC code), weight 1 / 2**VARIANCE_SHIFT. Ready once all channels stayed
+    # below READY_VARIANCE (3 codes rms) for READY_SAMPLES samples, no longer ready once a
+    # channel stayed above UNREADY_VARIANCE (6 codes rms) for READY_SAMPLES samples. After
+    # a change the state holds for at least READY_HOLD ms, so a flow temperature ramping
+    # through the threshold does not toggle the retained property.
+    VARIANCE_SHIFT = const(3)
+    READY_VARIANCE = const(2304)
+    UNREADY_VARIANCE = const(9216)
+    READY_SAMPLES = const(10)
+    READY_HOLD = const(300000)
 
     TEMP_FACTOR = 0.257003341043434
     TEMP_OFFSET = -257.003341043434
 
+    # ADC code -> centi-degree lookup table, one entry per 12 bit code plus one for interpolating at the top
+    LOOKUP_TABLE_SIZE = const(4097)
+    LOOKUP_TABLE_MIN = const(-32768)
+    LOOKUP_TABLE_MAX = const(32767)
+
+    # lowpass coefficients per sample of SAMPLE_PERIOD
     K2 = 0.0005
-    K1 = 1 - K2
+    RAW_K2 = 0.01
 
-    def __init__(self):
-        super().__init__(id="Temperatures", name="Temperatures", type="Controller")
+    # filter per channel, see fixed_filter.py; lowpass uses K2, the others a time constant in seconds
+    FILTER_TIME_CONSTANT = 20.0
+    MIN_FILTER_TIME_CONSTANT = 5.0
+    MAX_FILTER_TIME_CONSTANT = 3600.0
 
-        self.delayAf = None
-        self.delayRuef = None
-        self.delayVf = None
-        self.delayRawVf = None
+    # published temperatures: changes below the deadband are only sent with the heartbeat
+    DEADBAND = 0.1
+    RAW_DEADBAND = 0.2
+    MIN_PUBLISH_INTERVAL = const(10000)
 
-        self.flowTemperatureProperty = HomieProperty(
-            id="flowTemperature",
-            name="flowTemperature",
-            datatype=FLOAT,
-            unit="°C", 
-            format="10.0",
-            settable=False,
-            default=0.0,
-        )
-        self.add_property(self.flowTemperatureProperty)
+    HISTORY_PERIOD = const(10000)
+    HISTORY_CHUNK_LINES = const(60)
+    HISTORY_RESOLUTIONS = {"raw": RAW, "minute": MINUTE, "hour": HOUR}
 
-        self.rawFlowTemperatureProperty = HomieProperty(
-            id="rawFlowTemperature",
-            name="rawFlowTemperature",
+    def __init__(self, samplePeriod=SAMPLE_PERIOD):
+        super().__init__(id="Temperatures", name="Temperatures", type="Controller")
+
+        # another sample period scales the lowpass coefficients to the same time constants
+        self.samplePeriod = samplePeriod
+        if (samplePeriod != self.SAMPLE_PERIOD):
+            factor = samplePeriod / self.SAMPLE_PERIOD
+            self.K2 = 1.0 - (1.0 - self.K2) ** factor
+            self.RAW_K2 = 1.0 - (1.0 - self.RAW_K2) ** factor
+
+        # channel of the flow sensor per heating circuit
+        channels = list(self.CHANNELS)
+        channels[self.FLOW] = ("flowTemperature", CIRCUITS[0][2], "rawFlowTemperature")
+        self.flowChannels = array.array('B', [self.FLOW] * len(CIRCUITS))
+        for circuit in range(1, len(CIRCUITS)):
+            self.flowChannels[circuit] = len(channels)
+            channels.append(("flowTemperature" + suffix(circuit), CIRCUITS[circuit][2], "rawFlowTemperature" + suffix(circuit)))
+        self.CHANNELS = tuple(channels)
+
+        self.temperatureProperties = []
+        self.rawTemperatureProperties = []
+        for id, pin, rawId in self.CHANNELS:
+            temperatureProperty = PublishedProperty(
+                id=id,
+                name=id,
+                datatype=FLOAT,
+                unit="°C",
+                format="10.0",
+                settable=False,
+                default=0.0,
+                deadband=self.DEADBAND,
+                minInterval=self.MIN_PUBLISH_INTERVAL,
+                heartbeat=HEARTBEAT_PERIOD,
+            )
+            self.add_property(temperatureProperty)
+            self.temperatureProperties.append(temperatureProperty)
+
+            rawTemperatureProperty = None
+            if rawId is not None:
+                rawTemperatureProperty = PublishedProperty(
+                    id=rawId,
+                    name=rawId,
+                    datatype=FLOAT,
+                    unit="°C",
+                    format="10.0",
+                    settable=False,
+                    default=0.0,
+                    deadband=self.RAW_DEADBAND,
+                    minInterval=self.MIN_PUBLISH_INTERVAL,
+                    heartbeat=HEARTBEAT_PERIOD,
+                )
+                self.add_property(rawTemperatureProperty)
+            self.rawTemperatureProperties.append(rawTemperatureProperty)
+
+        self.lowpassFilterK2Property = PublishedProperty(
+            id="lowpassFilterK2",
+            name="lowpassFilterK2",
             datatype=FLOAT,
-            unit="°C", 
-            format="10.0",
-            settable=False,
-            default=0.0,
+            settable=True,
+            default=0.0005,
+            on_message=self.lowpassFilterK2PropertyMessage
         )
-        self.add_property(self.rawFlowTemperatureProperty)        
+        self.add_property(self.lowpassFilterK2Property)
 
-        self.outsideTemperatureProperty = HomieProperty(
-            id="outsideTemperature",
-            name="outsideTemperature",
-            datatype=FLOAT,
-            unit="°C", 
-            format="10.0",
-            settable=False,
-            default=0.0,
+        self.filterProperty = PublishedProperty(
+            id="filter",
+            name="filter",
+            datatype=STRING,
+            settable=True,
+            default="",
+            on_message=self.filterPropertyMessage
         )
-        self.add_property(self.outsideTemperatureProperty)
+        self.add_property(self.filterProperty)
 
-        self.returnTemperatureProperty = HomieProperty(
-            id="returnTemperature",
-            name="returnTemperature",
-            datatype=FLOAT,
-            unit="°C", 
-            format="10.0",
-            settable=False,
-            default=0.0,
+        self.calibrationProperty = PublishedProperty(
+            id="calibration",
+            name="calibration",
+            datatype=STRING,
+            settable=True,
+            default="",
+            on_message=self.calibrationPropertyMessage
         )
-        self.add_property(self.returnTemperatureProperty)   
+        self.add_property(self.calibrationProperty)
 
-        self.lowpassFilterK2Property = HomieProperty(
-            id="lowpassFilterK2",
-            name="lowpassFilterK2",
-            datatype=FLOAT,
+        self.historyQueryProperty = PublishedProperty(
+            id="historyQuery",
+            name="historyQuery",
+            datatype=STRING,
             settable=True,
-            default=0.0005,
-            on_message=self.lowpassFilterK2PropertyMessage
+            default="",
+            on_message=self.historyQueryPropertyMessage
         )
-        self.add_property(self.lowpassFilterK2Property)   
+        self.add_property(self.historyQueryProperty)
+
+        self.historyProperty = PublishedProperty(
+            id="history",
+            name="history",
+            datatype=STRING,
+            retained=False,
+            default="",
+        )
+        self.add_property(self.historyProperty)
 
-        self.setup()
-    
-    
+        self.readyProperty = PublishedProperty(
+            id="ready",
+            name="ready",
+            datatype=BOOLEAN,
+            default="false",
+        )
+        self.add_property(self.readyProperty)
+        self.ready = False
+        # called once when the readings first become trustworthy
+        self.onReady = None
 
-    def setup(self):
+        self.setup()
 
-        self.adcAf = ADC(Pin(AF_TEMP_PIN))
-        self.adcRuef = ADC(Pin(RUEF_TEMP_PIN))
-        self.adcVf = ADC(Pin(VF_TEMP_PIN))
 
-        self.afVoltage = 0.0
-        self.ruefVoltage = 0.0
-        self.vfVoltage = 0.0
-        self.rawVfVoltage = 0.0
 
-        self.readTemperaturesTimer = Timer(-1)
-        self.readTemperaturesTimer.init(period=100, mode=Timer.PERIODIC, callback=lambda t:self.readTemperatures())
+    def setup(self):
+        channels = len(self.CHANNELS)
+
+        self.adcs = [ADC(Pin(pin)) for _, pin, _ in self.CHANNELS]
+
+        # everything the sampling job touches is allocated here
+        self.burst = array.array('H', [0] * self.BURST_SAMPLES)
+        self.burstDivisor = self.BURST_SAMPLES - 2 * self.BURST_TRIM
+        self.readings = array.array('H', [0] * channels)
+        self.states = array.array('i', [0] * channels)
+        self.rawStates = array.array('i', [0] * channels)
+        self.coefficients = array.array('i', [coefficient(self.K2)] * channels)
+        self.rawCoefficients = array.array('i', [coefficient(self.RAW_K2)] * channels)
+        self.filterKinds = bytearray(channels)
+        self.filterTimeConstants = [self.FILTER_TIME_CONSTANT] * channels
+        self.filterParams = array.array('i', [0] * (2 * channels))
+        self.filterMemory = array.array('i', [0] * (MEMORY_SIZE * channels))
+        # start well above the threshold, so readiness needs a few samples to settle
+        self.variances = array.array('i', [16 * self.READY_VARIANCE] * channels)
+        self.readySamples = 0
+        # samples until the next change of readiness is allowed, none before the first one
+        self.readyHold = 0
+        self.readyHoldSamples = self.READY_HOLD // self.samplePeriod
+
+        self.correctionOffsets = [self.RESISTENCE_CORRECTION_OFFSET] * channels
+        self.correctionFactors = [self.RESISTENCE_CORRECTION_FACTOR] * channels
+        self.lookupTables = []
+        for channel in range(channels):
+            self.lookupTables.append(array.array('h', bytes(2 * self.LOOKUP_TABLE_SIZE)))
+            self.buildLookupTable(channel)
+
+        self.logFormats = [id + ": reading:%.2f, temperature:%.1f" for id, _, _ in self.CHANNELS]
+
+        # created by the first recordHistory job, to keep the flash access out of the boot path
+        self.history = None
+        self.historyValues = array.array('h', [0] * channels)
+
+        k2 = state_store.register(self.id + "/K2", lambda: self.K2)
+        if k2 is not None:
+            self.setK2(k2)
+        for channel in range(channels):
+            id = self.CHANNELS[channel][0]
+            offset = state_store.register(self.id + "/" + id + "/offset", lambda channel=channel: self.correctionOffsets[channel])
+            factor = state_store.register(self.id + "/" + id + "/factor", lambda channel=channel: self.correctionFactors[channel])
+            if offset is not None and factor is not None:
+                self.setCalibration(channel, offset, factor)
+            kind = state_store.register(self.id + "/" + id + "/filter", lambda channel=channel: self.filterKinds[channel], integer=True)
+            timeConstant = state_store.register(self.id + "/" + id + "/filterTime", lambda channel=channel: self.filterTimeConstants[channel])
+            if kind is not None and timeConstant is not None:
+                self.setFilter(channel, kind, timeConstant)
+
+        self.seedFilters()
+        self.readTemperaturesJob = scheduler.every(self.samplePeriod, self.readTemperatures, scheduler.HIGH, timing=JobTiming("sampling"))
+        self.recordHistoryJob = scheduler.every(self.HISTORY_PERIOD, self.recordHistory, scheduler.LOW)
 
 
 
     def lowpassFilterK2PropertyMessage(self, topic, payload, retained):
-        k2 = float(payload)
+        self.setK2(float(payload))
+
+
+    def setK2(self, k2: float):
         if (k2 >= 0.0 and k2 <= 1.0):
             self.K2 = k2
-            self.K1 = 1 - self.K2
+            k = coefficient(k2)
+            for channel in range(len(self.coefficients)):
+                self.coefficients[channel] = k
+            self.lowpassFilterK2Property.value = k2
+
+
+    def historyQueryPropertyMessage(self, topic, payload, retained):
+        # payload: "<from>,<to>[,raw|minute|hour]", times in device epoch seconds
+        try:
+            fields = payload.split(",")
+            start = int(fields[0])
+            end = int(fields[1])
+            resolution = self.HISTORY_RESOLUTIONS[fields[2]] if len(fields) > 2 else RAW
+        except (ValueError, IndexError, KeyError):
+            log.warning("invalid history query")
+            return
+        if self.history is None:
+            return
+        create_task(self.publishHistory(start, end, resolution))
+
+
+    def recordHistory(self):
+        if self.history is None:
+            self.history = TemperatureHistory(len(self.CHANNELS))
+            log.info("temperature history: %d bytes RAM, %d bytes flash", self.history.size(), 2 * self.history.MAX_FILE_SIZE)
+        for channel in range(len(self.historyValues)):
+            self.historyValues[channel] = self.lookupTemperature(channel, self.states[channel])
+        self.history.record(self.historyValues)
+
+
+    async def publishHistory(self, start, end, resolution):
+        # one header message, then HISTORY_CHUNK_LINES lines per message, values in centi-degrees
+        names = ",".join(id for id, _, _ in self.CHANNELS)
+        self.historyProperty.value = "#%s %d %d %s" % (("raw", "minute", "hour")[resolution], start, end, names)
+        await sleep_ms(0)
+        lines = []
+        count = 0
+        for entry in self.history.query(start, end, resolution):
+            if resolution == RAW:
+                lines.append("%d,%s" % (entry[0], ",".join(str(v) for v in entry[1])))
+            else:
+                t, minimum, average, maximum = entry
+                lines.append("%d,%s" % (t, ",".join("%d,%d,%d" % (minimum[c], average[c], maximum[c]) for c in range(len(average)))))
+            if len(lines) == self.HISTORY_CHUNK_LINES:
+                count += len(lines)
+                self.historyProperty.value = "\n".join(lines)
+                lines = []
+                await sleep_ms(0)
+        if lines:
+            count += len(lines)
+            self.historyProperty.value = "\n".join(lines)
+            await sleep_ms(0)
+        self.historyProperty.value = "#end %d" % count
+
+
+    def filterPropertyMessage(self, topic, payload, retained):
+        # payload: "<channel property id>,lowpass|median|butterworth|kalman[,<time constant in s>]"
+        try:
+            fields = payload.split(",")
+            id = fields[0]
+            kind = FILTERS.index(fields[1])
+            timeConstant = float(fields[2]) if len(fields) > 2 else self.FILTER_TIME_CONSTANT
+        except (ValueError, IndexError):
+            log.warning("invalid filter")
+            return
+        for channel in range(len(self.CHANNELS)):
+            if self.CHANNELS[channel][0] == id:
+                if self.setFilter(channel, kind, timeConstant):
+                    self.filterProperty.value = payload
+                else:
+                    log.warning("filter of temperature channel %d out of range", channel)
+                return
+        log.warning("unknown temperature channel")
+
+
+    def setFilter(self, channel: int, kind: int, timeConstant: float):
+        if (kind < 0 or kind >= len(FILTERS) or timeConstant < self.MIN_FILTER_TIME_CONSTANT or timeConstant > self.MAX_FILTER_TIME_CONSTANT):
+            return False
+        self.filterParams[2 * channel], self.filterParams[2 * channel + 1] = filterParameters(kind, timeConstant, self.samplePeriod)
+        self.filterTimeConstants[channel] = timeConstant
+        self.filterKinds[channel] = kind
+        resetMemory(kind, self.filterMemory, MEMORY_SIZE * channel, self.states[channel])
+        log.info("temperature filter %d: %d", channel, kind)
+        return True
+
+
+    def calibrationPropertyMessage(self, topic, payload, retained):
+        # payload: "<channel property id>,<resistence correction offset>,<resistence correction factor>"
+        try:
+            id, offset, factor = payload.split(",")
+            offset = float(offset)
+            factor = float(factor)
+        except ValueError:
+            log.warning("invalid calibration")
+            return
+        for channel in range(len(self.CHANNELS)):
+            if self.CHANNELS[channel][0] == id:
+                if self.setCalibration(channel, offset, factor):
+                    self.calibrationProperty.value = payload
+                else:
+                    log.warning("calibration of temperature channel %d out of range", channel)
+                return
+        log.warning("unknown temperature channel")
+
+
+    def setCalibration(self, channel: int, offset: float, factor: float):
+        if not (factor > 0.5 and factor < 2.0 and offset > -500.0 and offset < 500.0):
+            return False
+        self.correctionOffsets[channel] = offset
+        self.correctionFactors[channel] = factor
+        self.buildLookupTable(channel)
+        return True
+
+
+    def buildLookupTable(self, channel: int):
+        table = self.lookupTables[channel]
+        for code in range(self.LOOKUP_TABLE_SIZE):
+            voltage = code / 4096 * self.REF_VOLTAGE
+            if voltage < self.REF_VOLTAGE:
+                resistence = self.resistenceCorrection(self.calculateResistence(voltage), channel)
+                centiDegrees = round(self.calculateTemperature(resistence) * 100)
+            else:
+                centiDegrees = self.LOOKUP_TABLE_MAX
+            table[code] = max(self.LOOKUP_TABLE_MIN, min(self.LOOKUP_TABLE_MAX, centiDegrees))
+
+
+    def readBursts(self, bursts: int):
+        # trimmed mean of bursts * BURST_SAMPLES ADC reads per channel
+        readings = self.readings
+        burst = self.burst
+        for channel in range(len(readings)):
+            adc = self.adcs[channel]
+            total = 0
+            for _ in range(bursts):
+                for i in range(self.BURST_SAMPLES):
+                    burst[i] = adc.read_u16()
+                total += trimmedSum(burst, self.BURST_SAMPLES, self.BURST_TRIM)
+            readings[channel] = total // (self.burstDivisor * bursts)
+
+
+    def seedFilters(self):
+        self.readBursts(self.SEED_BURSTS)
+        channels = len(self.readings)
+        seed(self.states, self.readings, channels)
+        seed(self.rawStates, self.readings, channels)
+        for channel in range(channels):
+            resetMemory(self.filterKinds[channel], self.filterMemory, MEMORY_SIZE * channel, self.states[channel])
+        boot_timing.mark(boot_timing.FIRST_SAMPLE)
 
 
     def readTemperatures(self):
-        self.delayAf = self.lowpassFilter(self.adcAf.read_u16() >> 4, self.delayAf, self.K2)
-        self.afVoltage = self.delayAf / 4096 * self.REF_VOLTAGE 
-        self.delayRuef = self.lowpassFilter(self.adcRuef.read_u16() >> 4, self.delayRuef, self.K2)
-        self.ruefVoltage =  self.delayRuef / 4096 * self.REF_VOLTAGE
-        vfReading = self.adcVf.read_u16() >> 4
-        self.delayVf = self.lowpassFilter(vfReading, self.delayVf, self.K2)
-        self.vfVoltage = self.delayVf / 4096 * self.REF_VOLTAGE
-        self.delayRawVf = self.lowpassFilter(vfReading, self.delayRawVf, 0.01)
-        self.rawVfVoltage = self.delayRawVf / 4096 * self.REF_VOLTAGE 
+        self.readBursts(1)
+        channels = len(self.readings)
+        filterChannels(self.filterKinds, self.states, self.readings, self.coefficients, self.filterParams, self.filterMemory, channels)
+        lowpass(self.rawStates, self.readings, self.rawCoefficients, channels)
+        self.updateReadiness()
+
+
+    def updateReadiness(self):
+        readings = self.readings
+        states = self.states
+        variances = self.variances
+        limit = self.UNREADY_VARIANCE if self.ready else self.READY_VARIANCE
+        converged = True
+        for channel in range(len(readings)):
+            residual = max(-16383, min(16383, readings[channel] - (states[channel] >> 10)))
+            variance = variances[channel]
+            variance += (residual * residual - variance) >> self.VARIANCE_SHIFT
+            variances[channel] = variance
+            if variance > limit:
+                converged = False
+        # samples in a row that disagree with the current state
+        self.readySamples = self.readySamples + 1 if converged != self.ready else 0
+        if self.readyHold > 0:
+            self.readyHold -= 1
+        elif self.readySamples >= self.READY_SAMPLES:
+            ready = not self.ready
+            self.ready = ready
+            self.readySamples = 0
+            self.readyHold = self.readyHoldSamples
+            self.readyProperty.value = "true" if ready else "false"
+            log.info("temperature readings ready: %d", ready)
+            if ready and self.onReady is not None:
+                self.onReady()
+                self.onReady = None
+
+
+    def lookupTemperature(self, channel: int, state: int):
+        # filter states are 12 bit ADC codes with STATE_FRACTION_BITS fractional bits
+        table = self.lookupTables[channel]
+        code = state >> STATE_FRACTION_BITS
+        low = table[code]
+        fraction = state - (code << STATE_FRACTION_BITS)
+        return low + (((table[code + 1] - low) * fraction + (1 << (STATE_FRACTION_BITS - 1))) >> STATE_FRACTION_BITS)
 
 
     def calculateResistence(self, voltage: float):
         return voltage * self.REF_RESISTOR / (self.REF_VOLTAGE - voltage)
 
-    def resistenceCorrection(self, resistence: float):
-        return resistence * self.RESISTENCE_CORRECTION_FACTOR + self.RESISTENCE_CORRECTION_OFFSET
+    def resistenceCorrection(self, resistence: float, channel: int):
+        return resistence * self.correctionFactors[channel] + self.correctionOffsets[channel]
 
 
     def calculateTemperature(self, resistence: int):
         return self.TEMP_OFFSET + self.TEMP_FACTOR * resistence;
 
 
+    def centiDegrees(self, channel: int, raw=False):
+        return self.lookupTemperature(channel, (self.rawStates if raw else self.states)[channel])
+
+
+    def getTemperature(self, channel: int):
+        state = self.states[channel]
+        temperature = self.lookupTemperature(channel, state) / 100
+        if log.enabled(log.DEBUG):
+            log.debug(self.logFormats[channel], state / (1 << STATE_FRACTION_BITS), temperature)
+        self.temperatureProperties[channel].value = temperature
+
+        rawTemperatureProperty = self.rawTemperatureProperties[channel]
+        if rawTemperatureProperty is not None:
+            rawTemperatureProperty.value = self.lookupTemperature(channel, self.rawStates[channel]) / 100
+        return temperature
+
+
     def getOutsideTemperature(self):
-        afResistence = self.resistenceCorrection(self.calculateResistence(self.afVoltage))
-        afTemperature = self.calculateTemperature(afResistence)
-        print("outside: voltage:%.2f, resistence:%.2f, temperature:%.1f" % (self.afVoltage, afResistence, afTemperature))
-        self.outsideTemperatureProperty.value = afTemperature
-        return afTemperature
+        return self.getTemperature(self.OUTSIDE)
 
 
-    def getFlowTemperature(self):
-        vfResistence = self.resistenceCorrection(self.calculateResistence(self.vfVoltage))
-        vfTemperature = self.calculateTemperature(vfResistence)
-        rawVfResistence = self.resistenceCorrection(self.calculateResistence(self.rawVfVoltage))
-        rawVfTemperature = self.calculateTemperature(rawVfResistence)
-        print("flow: voltage:%.2f, resistence:%.2f, temperature:%.1f" % (self.vfVoltage, vfResistence, vfTemperature))
-        self.flowTemperatureProperty.value = vfTemperature
-        self.rawFlowTemperatureProperty.value = rawVfTemperature
-        return vfTemperature
+    def getFlowTemperature(self, circuit=0):
+        return self.getTemperature(self.flowChannels[circuit])
 
 
     def getReturnTemperature(self):
-        ruefResistence = self.resistenceCorrection(self.calculateResistence(self.ruefVoltage))
-        ruefTemperature = self.calculateTemperature(ruefResistence)
-        print("reflux: voltage:%.2f, resistence:%.2f, temperature:%.1f" % (self.ruefVoltage, ruefResistence, ruefTemperature))
-        self.returnTemperatureProperty.value = ruefTemperature
-        return ruefTemperature
-
+        return self.getTemperature(self.RETURN)
 
-    def lowpassFilter(self, inp: int, delayParam, k2):
-        delay = inp if delayParam is None else delayParam
-        return (inp * k2) + (delay * (1 - k2))
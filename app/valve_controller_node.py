@@ -1,152 +1,269 @@
-from machine import Timer, Pin
-from homie.property import HomieProperty
+from machine import Pin
+from utime import ticks_ms, ticks_us, ticks_diff
+from publisher import PublishedProperty, HEARTBEAT_PERIOD
 from homie.node import HomieNode
-from homie.constants import INTEGER, STRING
-from homie.device import await_ready_state
-from uasyncio import sleep_ms, create_task
+from homie.constants import INTEGER
+from uasyncio import create_task, wait_for_ms, ThreadSafeFlag, TimeoutError
+from circuits import CIRCUITS, suffix, circuitName
+import boot_timing
+import state_store
+import log
+from job_timing import JobTiming
+import scheduler
 
 class ValveControllerNode(HomieNode):
 
-    WORKER_DELAY = const(10)
-    VALVE_ONE_PERCENT_OPEN_CYCLES: int = 55
+    # motor run time for 1 % of valve travel
+    VALVE_ONE_PERCENT_MS = const(550)
+    VALVE_FULL_TRAVEL_MS = const(55000)
+    # extra travel (3 %) when driving to completely open or closed
+    VALVE_OVERDRIVE_MS = const(1650)
+    # the motor position is updated this often while the motor runs
+    PROGRESS_PERIOD = const(1000)
+    # valveCurrent is published at most this often
+    VALVE_PUBLISH_INTERVAL = const(5000)
 
     CLOSE, HOLD, OPEN = (-1, 0, 1)
+    # motion steps: initial homing, recalibration against an end stop, move to valveTarget
+    HOME, CALIBRATE, MOVE = (0, 1, 2)
 
-    def __init__(self):
-        super().__init__(id="flowTempValve", name="Flow Temperature Valve", type="Controller")
+    def __init__(self, circuit=0):
+        super().__init__(id="flowTempValve" + suffix(circuit), name=circuitName("Flow Temperature Valve", circuit), type="Controller")
 
-        self.closePin = Pin(1, Pin.OUT)
-        self.openPin = Pin(0, Pin.OUT)
+        # lateness of the motor progress timer and time spent until the next wait
+        self.timing = JobTiming("valve" + suffix(circuit))
+
+        openPin, closePin, _ = CIRCUITS[circuit]
+        self.closePin = Pin(closePin, Pin.OUT)
+        self.openPin = Pin(openPin, Pin.OUT)
 
         self.valveTarget = 0
-        self.internalValveTarget = 0
-        self.previousValveTarget = 0
         self.valveCurrent = 0
         self.valveState = self.HOLD
 
-        self.motorAdjustCounter = 0
+        # position as motor run time from completely closed, integrated from ticks_ms while moving
+        self.valvePosition = 0
+        self.moveStart = 0
 
-        self.valveTargetProperty = HomieProperty(
+        self.valveTargetProperty = PublishedProperty(
             id="valveTarget",
             name="valveTarget",
             datatype=INTEGER,
             unit="%",
             default=0,
+            heartbeat=HEARTBEAT_PERIOD,
         )
         self.add_property(self.valveTargetProperty)
 
-        self.valveCurrentProperty = HomieProperty(
+        self.valveCurrentProperty = PublishedProperty(
             id="valveCurrent",
             name="valveCurrent",
             datatype=INTEGER,
             unit="%",
             default=0,
+            minInterval=self.VALVE_PUBLISH_INTERVAL,
+            heartbeat=HEARTBEAT_PERIOD,
         )
         self.add_property(self.valveCurrentProperty)
 
-        self.resetValveProperty = HomieProperty(
+        self.resetValveProperty = PublishedProperty(
             id="resetValve",
             name="resetValve",
             default="",
         )
         self.add_property(self.resetValveProperty)
 
-        self.pauseValveUpdate = False
-
-        create_task(self.closeValve())
-
-        self.every10SecondsTimer = Timer(-1)
-        self.every10SecondsTimer.init(period=10, mode=Timer.PERIODIC, callback=lambda t:self.every10Milliseconds())
-
-        self.resetValveTimer = Timer(-1)
-        self.resetValveTimer.init(period=86400000, mode=Timer.PERIODIC, callback=lambda t:self.closeValve()) # 24h
-        
-
-
-    async def closeValve(self):
-        self.pauseValveUpdate = True
-        print("closing all valves...")
-        self.resetValveProperty.value = "resetting valve..."        
-
-        self.openPin.off()
-        self.closePin.on()
+        # motion queue, owned by the motionPlanner task
+        self.steps = []
+        self.homed = False
+        self.recalibrationDue = False
+        self.preempted = False
+        # target of the last completed move, it is not planned again until the target changes
+        self.reachedTarget = None
+        self.wakeup = ThreadSafeFlag()
+
+        # a position saved while the motor was holding makes the homing unnecessary, the
+        # motor saves -1 when it starts and the new position when it stops
+        position = state_store.register(self.id + "/position", self.savedPosition, True)
+        if (position is not None and position >= 0):
+            self.valvePosition = min(position, self.VALVE_FULL_TRAVEL_MS)
+            self.valveCurrent = (self.valvePosition + self.VALVE_ONE_PERCENT_MS // 2) // self.VALVE_ONE_PERCENT_MS
+            self.valveCurrentProperty.value = self.valveCurrent
+            self.homed = True
+            log.info("valve position restored: %d ms", self.valvePosition)
+        target = state_store.register(self.id + "/target", lambda: self.valveTarget, True)
+        if (target is not None and target >= 0 and target <= 100):
+            self.valveTarget = target
+            self.valveTargetProperty.value = target
 
-        await sleep_ms(self.VALVE_ONE_PERCENT_OPEN_CYCLES * 10 * 100);
+        create_task(self.motionPlanner())
 
-        self.closePin.off()
-        print("...finished closing all valves")
-        self.pauseValveUpdate = False
+        self.resetValveJob = scheduler.every(86400000, self.requestRecalibration, scheduler.LOW) # 24h
 
 
 
     def setTarget(self, target: int):
-        if (target != self.previousValveTarget and target >= 0 and target <= 100):
+        boot_timing.mark(boot_timing.FIRST_VALVE_COMMAND)
+        if (target != self.valveTarget and target >= 0 and target <= 100):
             self.valveTarget = target
             self.valveTargetProperty.value = target
-
-
-    def adjustTargetValvePosition(self):
-        # check, if new target was set in the meantime...
-        if (self.valveTarget != self.previousValveTarget):
-            print("Ventil Ziel: %d" % self.valveTarget)
-            self.previousValveTarget = self.valveTarget
-
-            # if completely open or closed, make sure it is really completely open/closed.
-            if (self.valveTarget == 100 and self.valveCurrent < 100):
-                self.internalValveTarget = 103
-            elif (self.valveTarget == 0 and self.valveCurrent > 0):
-                self.internalValveTarget = -3
-            else:
-                self.internalValveTarget = self.valveTarget
-
-
-            self.motorAdjustCounter = int(int(max(-103, min(103, self.internalValveTarget - self.valveCurrent))) * self.VALVE_ONE_PERCENT_OPEN_CYCLES)
-            print("MotorAdjustCounter: %d" % self.motorAdjustCounter)
-
-
-    def every10Milliseconds(self):
-        if (not self.pauseValveUpdate):
-            # adjust 2-point regulation
-            if (self.motorAdjustCounter > 0):
-                if (self.valveState != self.OPEN):
-                    print("opening valve...")
-                    self.valveState = self.OPEN
-                    self.openPin.on()
-                    self.closePin.off()
-
-                if ((self.motorAdjustCounter % self.VALVE_ONE_PERCENT_OPEN_CYCLES) == 0):
-                    if (self.valveCurrent < 100):
-                        self.valveCurrent += 1
-                        self.valveCurrentProperty.value = self.valveCurrent
-                    self.motorAdjustCounter -= 1
-                    self.adjustTargetValvePosition()
+            self.wakeup.set()
+
+
+    def savedPosition(self):
+        # -1 while moving or not homed, the position is not trustworthy after a power loss then
+        if (self.valveState != self.HOLD or not self.homed):
+            return -1
+        return self.valvePosition
+
+
+    def requestRecalibration(self):
+        self.recalibrationDue = True
+        self.wakeup.set()
+
+
+    async def motionPlanner(self):
+        # the only code that drives the motor: runs the queued steps one by one, a new
+        # target cancels the step in progress (except the initial homing) and replans
+        steps = self.steps
+        while True:
+            if (self.plan()):
+                kind = steps.pop(0)
+                direction, duration = self.stepMotion(kind)
+                if (kind != self.MOVE):
+                    log.info("resetting valve...")
+                    self.resetValveProperty.value = "resetting valve..."
+                if (await self.runMotor(direction, duration, kind != self.HOME)):
+                    self.finishStep(kind)
                 else:
-                    self.motorAdjustCounter -= 1
-
-            elif (self.motorAdjustCounter < 0):
-                if (self.valveState != self.CLOSE):
-                    print("closing valve...")
-                    self.valveState = self.CLOSE
-                    self.openPin.off()
-                    self.closePin.on()
-
-                if ((self.motorAdjustCounter % self.VALVE_ONE_PERCENT_OPEN_CYCLES) == 0):
-                    if (self.valveCurrent > 0):
-                        self.valveCurrent -= 1
-                        self.valveCurrentProperty.value = self.valveCurrent
-                    self.motorAdjustCounter += 1
-                    self.adjustTargetValvePosition()
-                else:
-                    self.motorAdjustCounter += 1
-
+                    log.debug("valve step preempted")
+                    self.preempted = True
+                    steps.clear()
             else:
-                if (self.valveState != self.HOLD):
-                    print("keeping valve state...")
-                    self.valveState = self.HOLD
-
-                    # keep current valve position
-                    self.openPin.off()
-                    self.closePin.off()
-
-                self.adjustTargetValvePosition()
-
+                self.stopMotor()
+                await self.wakeup.wait()
+
+
+    def plan(self):
+        steps = self.steps
+        if (not steps):
+            if (not self.homed):
+                steps.append(self.HOME)
+            elif (self.recalibrationDue and not self.preempted):
+                steps.append(self.CALIBRATE)
+            steps.append(self.MOVE)
+        # less than half a percent off counts as reached, the motor timing is not more exact
+        # than that and a correction would just overshoot the other way
+        if (steps[0] == self.MOVE and (self.valveTarget == self.reachedTarget
+                                       or self.stepMotion(self.MOVE)[1] < self.VALVE_ONE_PERCENT_MS // 2)):
+            steps.pop(0)
+            self.reachedTarget = self.valveTarget
+            self.preempted = False
+        return len(steps) > 0
+
+
+    def stepMotion(self, kind: int):
+        # (direction, motor run time) of a step, starting from the current position
+        self.updatePosition()
+        if (kind == self.HOME):
+            return (self.CLOSE, self.VALVE_FULL_TRAVEL_MS + self.VALVE_OVERDRIVE_MS)
+        if (kind == self.CALIBRATE):
+            # recalibrate against the nearer end stop
+            if (2 * self.valvePosition >= self.VALVE_FULL_TRAVEL_MS):
+                return (self.OPEN, self.VALVE_FULL_TRAVEL_MS - self.valvePosition + self.VALVE_OVERDRIVE_MS)
+            return (self.CLOSE, self.valvePosition + self.VALVE_OVERDRIVE_MS)
+
+        # if completely open or closed, make sure it is really completely open/closed.
+        if (self.valveTarget == 100 and self.valvePosition < self.VALVE_FULL_TRAVEL_MS):
+            internalValveTarget = self.VALVE_FULL_TRAVEL_MS + self.VALVE_OVERDRIVE_MS
+        elif (self.valveTarget == 0 and self.valvePosition > 0):
+            internalValveTarget = -self.VALVE_OVERDRIVE_MS
+        else:
+            internalValveTarget = self.valveTarget * self.VALVE_ONE_PERCENT_MS
+        duration = internalValveTarget - self.valvePosition
+        return (self.OPEN, duration) if duration >= 0 else (self.CLOSE, -duration)
+
+
+    def finishStep(self, kind: int):
+        if (kind == self.MOVE):
+            log.debug("Ventil Ziel: %d erreicht", self.valveTarget)
+            self.reachedTarget = self.valveTarget
+            self.preempted = False
+            if (self.valveTarget == 0 or self.valveTarget == 100):
+                # the overdrive has just run into an end stop
+                self.recalibrationDue = False
+        else:
+            self.valvePosition = 0 if self.valveState == self.CLOSE else self.VALVE_FULL_TRAVEL_MS
+            self.homed = True
+            self.recalibrationDue = False
+            self.reachedTarget = None
+            log.info("...finished resetting valve")
+            self.resetValveProperty.value = ""
+        self.publishPosition()
+
+
+    async def runMotor(self, direction: int, duration: int, cancellable: bool):
+        # returns False if a new target cancelled the step before duration has passed
+        self.setMotor(direction)
+        log.debug("motor run time: %d ms", duration)
+        runStarted = ticks_us()
+        remaining = duration
+        while (remaining > 0):
+            period = min(remaining, self.PROGRESS_PERIOD)
+            started = ticks_us()
+            try:
+                await wait_for_ms(self.wakeup.wait(), period)
+                woken = True
+            except TimeoutError:
+                woken = False
+            fired = ticks_us()
+            remaining = duration - ticks_diff(fired, runStarted) // 1000
+            self.publishPosition()
+            if (woken and cancellable):
+                return False
+            self.timing.record(-1 if woken else abs(ticks_diff(fired, started) - period * 1000), ticks_diff(ticks_us(), fired))
+        return True
+
+
+    def setMotor(self, direction: int):
+        if (self.valveState != direction):
+            self.updatePosition()
+            self.valveState = direction
+            if (direction == self.OPEN):
+                log.debug("opening valve...")
+                self.closePin.off()
+                self.openPin.on()
+            else:
+                log.debug("closing valve...")
+                self.openPin.off()
+                self.closePin.on()
+            self.moveStart = ticks_ms()
+            # invalidate the saved position while the motor moves
+            state_store.snapshot()
+
+
+    def stopMotor(self):
+        self.updatePosition()
+        if (self.valveState != self.HOLD):
+            log.debug("keeping valve state...")
+            self.valveState = self.HOLD
+            self.openPin.off()
+            self.closePin.off()
+            state_store.snapshot()
+        self.publishPosition()
+
+
+    def updatePosition(self):
+        if (self.valveState != self.HOLD):
+            now = ticks_ms()
+            position = self.valvePosition + self.valveState * ticks_diff(now, self.moveStart)
+            self.valvePosition = max(0, min(self.VALVE_FULL_TRAVEL_MS, position))
+            self.moveStart = now
+
+
+    def publishPosition(self):
+        self.updatePosition()
+        valveCurrent = (self.valvePosition + self.VALVE_ONE_PERCENT_MS // 2) // self.VALVE_ONE_PERCENT_MS
+        if (valveCurrent != self.valveCurrent):
+            self.valveCurrent = valveCurrent
+            self.valveCurrentProperty.value = valveCurrent
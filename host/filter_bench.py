@@ -0,0 +1,135 @@
+"""Noise versus latency of the selectable temperature filters.
+
+Runs every filter of app/fixed_filter.filterChannels (lowpass, median, butterworth,
+kalman) for a set of time constants over the same synthetic flow temperature: a flat
+stretch, a STEP_SIZE step and a RAMP_SLOPE ramp, converted to readings through the
+firmware's lookup table, with ADC noise and occasional single sample spikes on top.
+All configurations are channels of one filterChannels call per sample, so the
+integer arithmetic is exactly what the device runs (the pure Python twin of the viper
+kernel). Per configuration the table shows
+
+    noise      rms error on the flat stretch (K)
+    peak       largest error on the flat stretch, mostly the spikes (K)
+    delay      time until the output crossed half of the step (s)
+    overshoot  largest excess over the step target (K)
+    lag        steady state lag behind the ramp (s), the mean error divided by the
+               slope, which leaves a few seconds of noise
+
+The first rows are the firmware's current lowpass filters (K2 and RAW_K2) for reference.
+
+    python -m host.filter_bench
+    python -m host.filter_bench --time-constants 5,10,20,40 --noise 60 --spike-rate 0.002
+"""
+import argparse
+import math
+from array import array
+
+import numpy as np
+
+from host.replay import centiDegrees, lookupTable
+
+FLAT_TEMPERATURE = 30.0
+STEP_START = 900.0
+STEP_SIZE = 5.0
+RAMP_START = 2100.0
+RAMP_END = 3900.0
+RAMP_SLOPE = 0.5 / 60
+DURATION = 4200.0
+# the noise and peak window, the lag window
+FLAT_WINDOW = (300.0, STEP_START)
+LAG_WINDOW = (RAMP_END - 900.0, RAMP_END)
+
+
+def flowTemperature(t):
+    temperature = np.full(len(t), FLAT_TEMPERATURE)
+    temperature[t >= STEP_START] += STEP_SIZE
+    temperature += np.clip(t - RAMP_START, 0.0, RAMP_END - RAMP_START) * RAMP_SLOPE
+    return temperature
+
+
+def readings(temperature, table, noise, spikeRate, spikeSize, seed):
+    # read_u16 scaled readings of a temperature, with gaussian noise and spikes in read_u16 units
+    rng = np.random.default_rng(seed)
+    codes = np.arange(4096, dtype=float)
+    reading = np.interp(temperature * 100, table[:4096], codes) * 16
+    reading += rng.normal(0.0, noise, len(reading))
+    spikes = rng.random(len(reading)) < spikeRate
+    reading[spikes] += spikeSize * rng.choice((-1.0, 1.0), spikes.sum())
+    return np.clip(np.rint(reading), 0, 65535).astype(np.uint16)
+
+
+def run(configurations, reading, samplePeriod):
+    # states of all (kind, time constant, coefficient) configurations, one column each
+    import fixed_filter
+    n = len(configurations)
+    kinds = bytearray(kind for kind, _, _ in configurations)
+    state = array("i", [0] * n)
+    inp = array("H", [int(reading[0])] * n)
+    coeff = array("i", [0] * n)
+    params = array("i", [0] * (2 * n))
+    memory = array("i", [0] * (fixed_filter.MEMORY_SIZE * n))
+    for i, (kind, timeConstant, k) in enumerate(configurations):
+        params[2 * i], params[2 * i + 1] = fixed_filter.filterParameters(kind, timeConstant, samplePeriod)
+        coeff[i] = params[2 * i] if k is None else k
+    fixed_filter.seed(state, inp, n)
+    for i in range(n):
+        fixed_filter.resetMemory(kinds[i], memory, fixed_filter.MEMORY_SIZE * i, state[i])
+    out = np.empty((len(reading) - 1, n), dtype=np.int32)
+    for sample in range(1, len(reading)):
+        value = int(reading[sample])
+        for i in range(n):
+            inp[i] = value
+        fixed_filter.filterChannels(kinds, state, inp, coeff, params, memory, n)
+        out[sample - 1] = state
+    return out
+
+
+def metrics(t, truth, temperature):
+    flat = (t >= FLAT_WINDOW[0]) & (t < FLAT_WINDOW[1])
+    error = temperature[flat] - truth[flat]
+    afterStep = (t >= STEP_START) & (t < RAMP_START)
+    crossed = np.nonzero(afterStep & (temperature >= FLAT_TEMPERATURE + STEP_SIZE / 2))[0]
+    delay = t[crossed[0]] - STEP_START if len(crossed) else math.inf
+    overshoot = max(0.0, temperature[afterStep].max() - FLAT_TEMPERATURE - STEP_SIZE)
+    ramp = (t >= LAG_WINDOW[0]) & (t < LAG_WINDOW[1])
+    lag = (truth[ramp] - temperature[ramp]).mean() / RAMP_SLOPE
+    return (np.sqrt((error * error).mean()), np.abs(error).max(), delay, overshoot, lag)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--time-constants", default="5,10,20,40,80", help="comma separated filter time constants (s)")
+    parser.add_argument("--filters", default="lowpass,median,butterworth,kalman")
+    parser.add_argument("--sample-period", type=int, default=100, help="ms")
+    parser.add_argument("--noise", type=float, default=40.0, help="rms noise of a reading in read_u16 units (16 per ADC code)")
+    parser.add_argument("--spike-rate", type=float, default=0.001, help="probability of a spike per reading")
+    parser.add_argument("--spike-size", type=float, default=1600.0, help="spike height in read_u16 units")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    table = lookupTable()
+    from fixed_filter import FILTERS, LOWPASS, coefficient
+    from temperature_reader_node import TemperatureReaderNode
+
+    configurations = [(LOWPASS, args.sample_period / 1000 / -math.log(1.0 - k2), coefficient(k2))
+                      for k2 in (TemperatureReaderNode.K2, TemperatureReaderNode.RAW_K2)]
+    names = ["lowpass K2", "lowpass RAW_K2"]
+    for name in args.filters.split(","):
+        for timeConstant in (float(v) for v in args.time_constants.split(",")):
+            configurations.append((FILTERS.index(name), timeConstant, None))
+            names.append(name)
+
+    period = args.sample_period / 1000
+    t = np.arange(0.0, DURATION + period / 2, period)
+    truth = flowTemperature(t)
+    reading = readings(truth, table, args.noise, args.spike_rate, args.spike_size, args.seed)
+    temperatures = centiDegrees(run(configurations, reading, args.sample_period), table) / 100
+
+    print("%-15s %6s %8s %8s %8s %10s %8s" % ("filter", "tau s", "noise K", "peak K", "delay s", "overshoot", "lag s"))
+    for i, (name, (_, timeConstant, _)) in enumerate(zip(names, configurations)):
+        noise, peak, delay, overshoot, lag = metrics(t[1:], truth[1:], temperatures[:, i])
+        print("%-15s %6.1f %8.3f %8.3f %8.1f %10.2f %8.1f" % (name, timeConstant, noise, peak, delay, overshoot, lag))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Fleet aggregator: the Homie properties of many pyHeat boards in columnar files.
+
+host.fleet.collector subscribes to <MQTT_BASE_TOPIC>/# and turns the property
+messages into values, host.fleet.store keeps them per device and property in
+memory-mapped fixed-width columns with minute and hour downsampling tiers.
+
+    python -m host.fleet collect fleet/ --broker mqtt.local
+    python -m host.fleet query fleet/ Temperatures/flowTemperature --from 2026-10-01 --to 2027-04-30
+    python -m host.fleet sim fleet/ --days 2
+    python -m host.fleet bench fleet/ --devices 300 --days 210
+"""
+from host.fleet.collector import Collector
+from host.fleet.store import Store
@@ -0,0 +1,165 @@
+import argparse
+import calendar
+import os
+import time
+
+import numpy as np
+
+from host.fleet import Collector, Store
+
+# seconds between flushes of the buffered values to the column files
+FLUSH_PERIOD = 10
+# seconds between attempts to reconnect to the broker, doubling up to the maximum
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 60
+
+
+def timestamp(text):
+    # "YYYY-MM-DD" or epoch seconds, in ms
+    if "-" in text:
+        return calendar.timegm(time.strptime(text, "%Y-%m-%d")) * 1000
+    return int(float(text) * 1000)
+
+
+def collect(args):
+    try:
+        import paho.mqtt.client as mqtt
+    except ImportError:
+        raise SystemExit("collecting from a broker needs paho-mqtt (pip install paho-mqtt)")
+    store = Store(args.root)
+    collector = Collector(store, args.base_topic)
+    host, _, port = args.broker.partition(":")
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2) if hasattr(mqtt, "CallbackAPIVersion") else mqtt.Client()
+    client.on_connect = lambda client, *_: client.subscribe(collector.subscription())
+    client.on_message = lambda client, userdata, message: collector.message(message.topic, message.payload, message.retain)
+    client.connect(host, int(port or 1883))
+    flushed = time.time()
+    delay = RECONNECT_DELAY
+    try:
+        while True:
+            if client.loop(timeout=1.0) == mqtt.MQTT_ERR_SUCCESS:
+                delay = RECONNECT_DELAY
+            else:
+                # on_connect subscribes again once the broker is back
+                time.sleep(delay)
+                try:
+                    client.reconnect()
+                except OSError as e:
+                    print("reconnecting to %s failed: %s" % (args.broker, e))
+                    delay = min(2 * delay, MAX_RECONNECT_DELAY)
+            if time.time() - flushed >= FLUSH_PERIOD:
+                store.flush()
+                flushed = time.time()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.flush()
+    print("%d messages, %d values, %d skipped" % (collector.messages, collector.values, collector.skipped))
+
+
+def query(args):
+    store = Store(args.root)
+    start = timestamp(args.start)
+    end = timestamp(args.end)
+    started = time.perf_counter()
+    result = store.fleetQuery(args.property, start, end, args.tier, args.device or None)
+    elapsed = time.perf_counter() - started
+    for device, columns in sorted(result.items()):
+        values = columns["v"] if "v" in columns else columns["mean"]
+        if len(values):
+            print("%-20s %-6s %7d rows  min %8.2f  mean %8.2f  max %8.2f" % (
+                device, columns["tier"], len(values), columns.get("min", values).min(), values.mean(), columns.get("max", values).max()))
+        else:
+            print("%-20s %-6s       0 rows" % (device, columns["tier"]))
+    print("%d devices in %.1f ms" % (len(result), elapsed * 1000))
+
+
+def sim(args):
+    # one simulated board against the stand-in broker, stamped with the virtual clock
+    from host.sim import Simulation
+    simulation = Simulation(seed=args.seed, samplePeriodMs=args.sample_period, logLevel=40)
+    clock = simulation.clock
+    store = Store(args.root)
+    collector = Collector(store, simulation.settings.MQTT_BASE_TOPIC, lambda: clock.epoch + clock.now_us / 1000000)
+    simulation.broker.listeners.append(lambda topic, payload, retain: collector.message(topic, payload))
+    simulation.run(args.days * 86400, onDay=lambda stats: store.flush())
+    store.flush()
+    print("%d messages, %d values, %d skipped" % (collector.messages, collector.values, collector.skipped))
+    for device in store.devices():
+        for property in store.properties(device):
+            columns = store.query(device, property, 0, 2 ** 62, "raw")
+            print("%s %-40s %6d values, last %g" % (device, property, len(columns["v"]), columns["v"][-1]))
+
+
+def bench(args):
+    # a synthetic season of flow temperatures for many devices, then fleet queries on it
+    store = Store(args.root)
+    rng = np.random.default_rng(args.seed)
+    start = timestamp("2026-10-01")
+    samples = int(args.days * 86400 / args.interval)
+    property = "Temperatures/flowTemperature"
+    started = time.perf_counter()
+    for device in range(args.devices):
+        times = start + np.arange(samples, dtype=np.int64) * args.interval * 1000 + rng.integers(0, 1000, samples)
+        days = np.arange(samples) * args.interval / 86400
+        values = 32 + 4 * np.sin(2 * np.pi * days / 7 + device) + rng.normal(0, 0.2, samples)
+        series = store.open("bench%03d" % device, property)
+        series.extend(times, values)
+        series.flush()
+    print("wrote %d devices x %d values in %.1f s" % (args.devices, samples, time.perf_counter() - started))
+
+    end = start + samples * args.interval * 1000
+    store = Store(args.root)
+    for name, first, last, tier in (("season", start, end, None), ("week", end - 7 * 86400000, end, None),
+                                    ("week, minute tier", end - 7 * 86400000, end, "minute"), ("day", end - 86400000, end, None)):
+        started = time.perf_counter()
+        result = store.fleetQuery(property, first, last, tier)
+        elapsed = time.perf_counter() - started
+        rows = sum(len(columns["t"]) for columns in result.values())
+        tiers = ",".join(sorted({columns["tier"] for columns in result.values()}))
+        print("%-18s %4d devices %9d rows (%s) in %7.1f ms" % (name, len(result), rows, tiers, elapsed * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m host.fleet", description="Collect and query the properties of a fleet of pyHeat boards.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("collect", help="subscribe to a broker and store the property values")
+    command.add_argument("root", help="store directory")
+    command.add_argument("--broker", required=True, metavar="HOST[:PORT]")
+    command.add_argument("--base-topic", default="devices", help="MQTT_BASE_TOPIC of the boards")
+    command.set_defaults(run=collect)
+
+    command = commands.add_parser("query", help="range query of one property over all devices")
+    command.add_argument("root", help="store directory")
+    command.add_argument("property", help="<node>/<property>, e.g. Temperatures/flowTemperature")
+    command.add_argument("--from", dest="start", default="0", help="YYYY-MM-DD or epoch seconds")
+    command.add_argument("--to", dest="end", default="4102444800", help="YYYY-MM-DD or epoch seconds")
+    command.add_argument("--tier", choices=("raw", "minute", "hour"), default=None, help="default: the finest with at most 2000 rows")
+    command.add_argument("--device", action="append", help="only this device, repeatable")
+    command.set_defaults(run=query)
+
+    command = commands.add_parser("sim", help="collect from a simulated board on the stand-in broker")
+    command.add_argument("root", help="store directory")
+    command.add_argument("--days", type=float, default=1)
+    command.add_argument("--seed", type=int, default=1)
+    command.add_argument("--sample-period", type=int, default=2000, metavar="MS")
+    command.set_defaults(run=sim)
+
+    command = commands.add_parser("bench", help="write a synthetic season for many devices and time fleet queries")
+    command.add_argument("root", help="store directory, should be empty")
+    command.add_argument("--devices", type=int, default=300)
+    command.add_argument("--days", type=float, default=210)
+    command.add_argument("--interval", type=int, default=60, help="seconds between values")
+    command.add_argument("--seed", type=int, default=1)
+    command.set_defaults(run=bench)
+
+    args = parser.parse_args()
+    if args.command != "bench" or not os.path.exists(args.root) or not os.listdir(args.root):
+        args.run(args)
+    else:
+        parser.error("%s is not empty" % args.root)
+
+
+if __name__ == "__main__":
+    main()
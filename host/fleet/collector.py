@@ -0,0 +1,99 @@
+"""Homie property messages of a fleet of boards into a Store.
+
+message() takes every message below <base topic>/ (MQTT_BASE_TOPIC of the boards,
+"devices" by default) and stores the numeric property values
+<base topic>/<device>/<node>/<property> as series "<node>/<property>": numbers as
+they are, booleans as 0 and 1, everything else (enums, strings, $ attributes, /set
+commands) is skipped. $telemetry frames, JSON or binary, are split into the series
+"$telemetry/outside", "$telemetry/return", "$telemetry/heatPump" and per circuit
+"$telemetry/flow", "$telemetry/rawFlow", "$telemetry/target", "$telemetry/valveTarget"
+and "$telemetry/valveCurrent" with the circuit suffix of the firmware ("", "2", ...),
+so boards with PROPERTY_UPDATES = False are covered as well.
+
+Messages whose device or property could not be stored as a series name (".." and the
+like, see Store.open) are skipped as well.
+
+Values are stamped with the time of arrival from clock(), the boards do not send
+timestamps with their properties. Retained messages replayed on subscribing are
+skipped, they carry old values.
+"""
+import json
+import struct
+import time
+
+from host import telemetry
+
+CIRCUIT_FIELDS = ("flow", "rawFlow", "target", "valveTarget", "valveCurrent")
+BOOLEANS = {b"true": 1.0, b"false": 0.0}
+
+
+def suffix(circuit):
+    return "" if circuit == 0 else str(circuit + 1)
+
+
+def number(payload):
+    value = BOOLEANS.get(payload)
+    if value is not None:
+        return value
+    try:
+        return float(payload)
+    except ValueError:
+        return None
+
+
+class Collector:
+
+    def __init__(self, store, baseTopic="devices", clock=time.time):
+        self.store = store
+        self.baseTopic = baseTopic
+        self.clock = clock
+        self.messages = 0
+        self.values = 0
+        self.skipped = 0
+
+    def subscription(self):
+        return self.baseTopic + "/#"
+
+    def message(self, topic, payload, retained=False):
+        self.messages += 1
+        if isinstance(payload, str):
+            payload = payload.encode()
+        levels = topic.split("/")
+        if retained or len(levels) < 3 or levels[0] != self.baseTopic:
+            self.skipped += 1
+            return
+        device = levels[1]
+        t = int(self.clock() * 1000)
+        if len(levels) == 3 and levels[2] == "$telemetry":
+            self.telemetry(device, t, payload)
+        elif len(levels) == 4 and not levels[2].startswith("$") and not levels[3].startswith("$"):
+            value = number(payload)
+            if value is None:
+                self.skipped += 1
+                return
+            try:
+                self.store.add(device, levels[2] + "/" + levels[3], t, value)
+            except ValueError:
+                self.skipped += 1
+                return
+            self.values += 1
+        else:
+            self.skipped += 1
+
+    def telemetry(self, device, t, payload):
+        try:
+            frame = json.loads(payload) if payload[:1] == b"{" else telemetry.decode(payload)
+            values = [("outside", frame["outside"]), ("return", frame["return"]), ("heatPump", frame["heatPump"])]
+            for circuit, fields in enumerate(frame["circuits"]):
+                values.extend((name + suffix(circuit), fields[name]) for name in CIRCUIT_FIELDS)
+            values = [(name, float(value)) for name, value in values]
+        except (ValueError, KeyError, TypeError, struct.error):
+            self.skipped += 1
+            return
+        try:
+            for name, value in values:
+                self.store.add(device, "$telemetry/" + name, t, value)
+        except ValueError:
+            self.skipped += 1
+            return
+        self.values += len(values)
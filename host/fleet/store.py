@@ -0,0 +1,325 @@
+"""Columnar time series files, one directory per device and property.
+
+A series is stored in TIERS: "raw" with every value as it arrived, "minute" and
+"hour" with the minimum, mean and maximum and the number of values per bucket. Every
+column of a tier is its own file of fixed-width little endian rows (timestamps are
+milliseconds since the Unix epoch as int64, values float32, counts uint32), e.g.
+
+    <root>/<device>/Temperatures/flowTemperature/raw.t
+    <root>/<device>/Temperatures/flowTemperature/raw.v
+    <root>/<device>/Temperatures/flowTemperature/hour.mean
+
+so a file is a plain array and the number of rows follows from its size. Device names
+and property levels come from MQTT topics, open() rejects those that are no plain
+directory name (empty, ".", "..", containing a path separator) with ValueError. Appended rows
+are buffered until flush(); buckets are written once they are complete. Queries
+memory-map the columns, find the time range by binary search in the timestamp column
+and copy only the rows in the range; the last MAX_MAPS maps stay open. The open bucket of a tier is part of query results
+and is rebuilt from the raw values when a series is opened again, so nothing is lost
+between flushes of the raw tier.
+"""
+import mmap
+import os
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+TIERS = (("raw", 0), ("minute", 60000), ("hour", 3600000))
+TIER_NAMES = tuple(name for name, _ in TIERS)
+RAW_COLUMNS = (("t", "<i8"), ("v", "<f4"))
+BUCKET_COLUMNS = (("t", "<i8"), ("min", "<f4"), ("mean", "<f4"), ("max", "<f4"), ("count", "<u4"))
+# array typecodes of the append buffers
+BUFFER_TYPES = {"<i8": "q", "<f4": "f", "<u4": "I"}
+# most rows a query without explicit tier returns, picks the finest tier that fits
+MAX_POINTS = 2000
+# memory maps kept open between queries, each holds a file descriptor
+MAX_MAPS = 512
+
+_maps = OrderedDict()
+
+
+def checkLevel(level):
+    if level in ("", ".", "..") or "/" in level or os.sep in level or (os.altsep and os.altsep in level) \
+            or "\0" in level or os.path.isabs(level) or os.path.splitdrive(level)[0]:
+        raise ValueError("invalid series name %r" % level)
+
+
+class Column:
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.pending = array(BUFFER_TYPES[dtype])
+        self.stored = os.path.getsize(path) // self.dtype.itemsize if os.path.exists(path) else 0
+        self.firstValue = None
+        self.lastValue = None
+
+    def __len__(self):
+        return self.stored + len(self.pending)
+
+    def append(self, value):
+        self.pending.append(value)
+
+    def extend(self, values):
+        self.pending.frombytes(np.asarray(values, dtype=self.dtype).tobytes())
+
+    def flush(self):
+        if self.pending:
+            with open(self.path, "ab") as f:
+                self.pending.tofile(f)
+            self.stored += len(self.pending)
+            self.lastValue = self.pending[-1]
+            del self.pending[:]
+
+    def map(self):
+        # the stored rows, an empty array for an empty file (which cannot be mapped)
+        if self.stored == 0:
+            return np.empty(0, dtype=self.dtype)
+        mapped = _maps.get(self)
+        if mapped is None or len(mapped) != self.stored:
+            with open(self.path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), self.stored * self.dtype.itemsize, access=mmap.ACCESS_READ)
+            mapped = _maps[self] = np.frombuffer(buffer, dtype=self.dtype)
+            if len(_maps) > MAX_MAPS:
+                _maps.popitem(last=False)
+        _maps.move_to_end(self)
+        return mapped
+
+    def rows(self, start, stop, stored=None):
+        # rows start..stop of the stored rows followed by the pending ones
+        stored = self.map() if stored is None else stored
+        head = stored[start:min(stop, self.stored)]
+        if stop <= self.stored:
+            return head.copy()
+        tail = np.frombuffer(self.pending, dtype=self.dtype)[max(0, start - self.stored):stop - self.stored]
+        return np.concatenate((head, tail))
+
+    def first(self):
+        if self.firstValue is None and len(self):
+            self.firstValue = self.map()[0].item() if self.stored else self.pending[0]
+        return self.firstValue
+
+    def last(self):
+        if self.pending:
+            return self.pending[-1]
+        if self.lastValue is None and self.stored:
+            self.lastValue = self.map()[-1].item()
+        return self.lastValue
+
+
+class Tier:
+
+    def __init__(self, directory, name, period):
+        self.name = name
+        self.period = period
+        self.columns = {column: Column(os.path.join(directory, "%s.%s" % (name, column)), dtype)
+                        for column, dtype in (BUCKET_COLUMNS if period else RAW_COLUMNS)}
+        self.time = self.columns["t"]
+        # the bucket being filled
+        self.bucket = None
+        self.minimum = self.maximum = self.total = 0.0
+        self.count = 0
+
+    def add(self, t, value):
+        if not self.period:
+            self.time.append(t)
+            self.columns["v"].append(value)
+            return
+        bucket = t - t % self.period
+        if bucket != self.bucket:
+            self.close()
+            self.bucket = bucket
+            self.minimum = self.maximum = value
+            self.total = 0.0
+            self.count = 0
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        self.total += value
+        self.count += 1
+
+    def extend(self, times, values):
+        # add() for arrays, one NumPy operation per column
+        if not self.period:
+            self.time.extend(times)
+            self.columns["v"].extend(values)
+            return
+        buckets = times - times % self.period
+        starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+        minima = np.minimum.reduceat(values, starts)
+        maxima = np.maximum.reduceat(values, starts)
+        totals = np.add.reduceat(values, starts)
+        counts = np.diff(np.append(starts, len(values)))
+        first = 0
+        if self.count and buckets[0] == self.bucket:
+            self.minimum = min(self.minimum, float(minima[0]))
+            self.maximum = max(self.maximum, float(maxima[0]))
+            self.total += float(totals[0])
+            self.count += int(counts[0])
+            first = 1
+        if first == len(starts):
+            return
+        self.close()
+        complete = slice(first, len(starts) - 1)
+        columns = self.columns
+        columns["t"].extend(buckets[starts[complete]])
+        columns["min"].extend(minima[complete])
+        columns["mean"].extend(totals[complete] / counts[complete])
+        columns["max"].extend(maxima[complete])
+        columns["count"].extend(counts[complete])
+        self.bucket = int(buckets[starts[-1]])
+        self.minimum = float(minima[-1])
+        self.maximum = float(maxima[-1])
+        self.total = float(totals[-1])
+        self.count = int(counts[-1])
+
+    def close(self):
+        if self.count:
+            columns = self.columns
+            columns["t"].append(self.bucket)
+            columns["min"].append(self.minimum)
+            columns["mean"].append(self.total / self.count)
+            columns["max"].append(self.maximum)
+            columns["count"].append(self.count)
+            self.count = 0
+
+    def flush(self):
+        for column in self.columns.values():
+            column.flush()
+
+    def range(self, start, end, times=None):
+        # first and last + 1 row with start <= t < end
+        times = self.time.map() if times is None else times
+        pending = np.frombuffer(self.time.pending, dtype=self.time.dtype)
+        return tuple(int(np.searchsorted(times, bound)) if len(pending) == 0 or bound <= pending[0]
+                     else len(times) + int(np.searchsorted(pending, bound)) for bound in (start, end))
+
+    def estimate(self, start, end):
+        # rows in the range, assuming evenly spaced rows
+        rows = len(self.time)
+        if rows < 2:
+            return rows
+        first = self.time.first()
+        last = self.time.last()
+        overlap = max(0, min(end, last + 1) - max(start, first))
+        return rows * overlap / (last + 1 - first)
+
+    def query(self, start, end):
+        times = self.time.map()
+        first, last = self.range(start, end, times)
+        result = {column: self.columns[column].rows(first, last, times if column == "t" else None) for column in self.columns}
+        if self.count and start <= self.bucket < end:
+            for column, value in (("t", self.bucket), ("min", self.minimum), ("mean", self.total / self.count),
+                                  ("max", self.maximum), ("count", self.count)):
+                result[column] = np.append(result[column], np.array(value, dtype=result[column].dtype))
+        return result
+
+
+class Series:
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.tiers = [Tier(directory, name, period) for name, period in TIERS]
+        self.raw = self.tiers[0]
+        last = self.raw.time.last()
+        self.lastTime = -1 if last is None else last
+        self.restoreBuckets()
+
+    def restoreBuckets(self):
+        # replays the raw values after the last stored bucket of every tier, which
+        # reopens the bucket being filled and appends complete buckets a crash lost
+        times = self.raw.time.map()
+        for tier in self.tiers[1:]:
+            last = tier.time.last()
+            first = int(np.searchsorted(times, 0 if last is None else last + tier.period))
+            values = self.raw.columns["v"].rows(first, len(times))
+            for t, value in zip(times[first:].tolist(), values.tolist()):
+                tier.add(t, value)
+
+    def add(self, t, value):
+        # timestamps never go backwards, a late value is stored at the time of the previous one
+        t = max(t, self.lastTime)
+        self.lastTime = t
+        for tier in self.tiers:
+            tier.add(t, value)
+
+    def extend(self, times, values):
+        # add() for arrays of timestamps and values, e.g. to import a backlog
+        times = np.maximum.accumulate(np.maximum(np.asarray(times, dtype=np.int64), self.lastTime))
+        values = np.asarray(values, dtype=np.float64)
+        if len(times) == 0:
+            return
+        self.lastTime = int(times[-1])
+        for tier in self.tiers:
+            tier.extend(times, values)
+
+    def flush(self):
+        for tier in self.tiers:
+            tier.flush()
+
+    def tier(self, start, end, maxPoints=MAX_POINTS):
+        for tier in self.tiers:
+            if tier.estimate(start, end) <= maxPoints:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, start, end, tier=None, maxPoints=MAX_POINTS):
+        # dict of column arrays with start <= t < end (ms), from the named tier or the
+        # finest one with at most maxPoints rows in the range
+        tier = self.tier(start, end, maxPoints) if tier is None else self.tiers[TIER_NAMES.index(tier)]
+        result = tier.query(start, end)
+        result["tier"] = tier.name
+        return result
+
+
+class Store:
+
+    def __init__(self, root):
+        self.root = root
+        self.series = {}
+        os.makedirs(root, exist_ok=True)
+
+    def open(self, device, property, create=True):
+        key = (device, property)
+        series = self.series.get(key)
+        if series is None:
+            levels = property.split("/")
+            for level in [device] + levels:
+                checkLevel(level)
+            directory = os.path.join(self.root, device, *levels)
+            if not create and not os.path.isdir(directory):
+                return None
+            series = self.series[key] = Series(directory)
+        return series
+
+    def add(self, device, property, t, value):
+        self.open(device, property).add(t, value)
+
+    def flush(self):
+        for series in self.series.values():
+            series.flush()
+
+    def devices(self):
+        return sorted(entry for entry in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, entry)))
+
+    def properties(self, device):
+        directory = os.path.join(self.root, device)
+        found = set()
+        for path, _, files in os.walk(directory):
+            if "raw.t" in files:
+                found.add(os.path.relpath(path, directory).replace(os.sep, "/"))
+        return sorted(found | {property for d, property in self.series if d == device})
+
+    def query(self, device, property, start, end, tier=None, maxPoints=MAX_POINTS):
+        series = self.open(device, property, create=False)
+        return None if series is None else series.query(start, end, tier, maxPoints)
+
+    def fleetQuery(self, property, start, end, tier=None, devices=None, maxPoints=MAX_POINTS):
+        # {device: columns} of one property for all (or the given) devices that have it
+        result = {}
+        for device in self.devices() if devices is None else devices:
+            columns = self.query(device, property, start, end, tier, maxPoints)
+            if columns is not None:
+                result[device] = columns
+        return result
@@ -0,0 +1,404 @@
+"""Bit-exact replay of recorded ADC readings through the temperature filter chain.
+
+A trace holds the trimmed-mean readings (read_u16 scale) the sampling job fed into the
+filters of TemperatureReaderNode: a 16 byte header "<4sBBHII" = magic b"PHTR", version,
+number of channels, sample period in ms, Q16 coefficient of the (K2) filter and of the
+raw filter, then one row of little endian uint16 per sample and channel. The first row
+is the seed the filter states start from, every further row is one lowpass step.
+`python -m host.sim --adc-trace FILE` writes one, the trace is memory-mapped here.
+
+The filter is the fixed point recurrence of app/fixed_filter.py, whose rounding makes it
+nonlinear, so there is no exact closed form. Instead every segment of the trace is cut
+into lanes (at least LANE_LENGTH samples, long enough for the warm-up) that are stepped
+in lockstep, one NumPy operation per step for all lanes of all filters and channels. Lane 0 starts from the exact state, every other lane speculatively
+from the mean input a warm-up of WARMUP_TIME_CONSTANTS time constants earlier: trajectories of
+the filter that start close together merge into the identical integer trajectory and
+then stay merged. The repair pass checks every lane boundary against the exact state of
+the previous lane and re-steps the lanes where the speculation was wrong until they merge
+with the speculative trajectory (usually after a few samples, at worst to the end of the
+lane), repeating until all boundaries agree. The result is identical to stepping
+fixed_filter.lowpass sample by sample, which --verify checks on a prefix of the trace.
+
+Channels the device runs with another filter of app/fixed_filter.filterChannels
+(median, butterworth, kalman, see --filter) are stepped through the firmware kernel
+itself, one sample at a time, which is exact but runs at Python speed.
+
+States are converted to centi-degrees with the firmware's own lookup tables and
+interpolation. tests/test_replay.py checks the result against the firmware running in
+host.sim.
+
+    python -m host.sim --days 30 --sample-period 2000 --adc-trace trace.bin
+    python -m host.replay trace.bin --verify 200000 --out replay/
+    python -m host.replay trace.bin --filter 0,kalman,20
+    python -m host.replay --synthetic 100000000
+"""
+import argparse
+import os
+import struct
+import time
+from array import array
+
+import numpy as np
+
+MAGIC = b"PHTR"
+VERSION = 1
+HEADER = "<4sBBHII"
+HEADER_SIZE = struct.calcsize(HEADER)
+
+STATE_FRACTION_BITS = 14
+COEFFICIENT_ONE = 65536
+
+LANES = 2048
+LANE_LENGTH = 16384
+WARMUP_TIME_CONSTANTS = 16
+BLOCK = 64
+
+
+class TraceWriter:
+
+    def __init__(self, file, channels, samplePeriodMs, coefficient, rawCoefficient):
+        self.file = file
+        file.write(struct.pack(HEADER, MAGIC, VERSION, channels, samplePeriodMs, coefficient, rawCoefficient))
+
+    def write(self, readings):
+        # one reading per channel, the first call writes the seed
+        self.file.write(np.asarray(readings, dtype="<u2").tobytes())
+
+
+class Trace:
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, channels, samplePeriodMs, coefficient, rawCoefficient = struct.unpack(HEADER, f.read(HEADER_SIZE))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d pyHeat ADC trace" % (path, VERSION))
+        self.channels = channels
+        self.samplePeriodMs = samplePeriodMs
+        self.coefficient = coefficient
+        self.rawCoefficient = rawCoefficient
+        rows = (os.path.getsize(path) - HEADER_SIZE) // (2 * channels)
+        self.readings = np.memmap(path, dtype="<u2", mode="r", offset=HEADER_SIZE, shape=(rows, channels))
+
+    @property
+    def samples(self):
+        return len(self.readings) - 1
+
+
+def step(state, input10, k):
+    # fixed_filter.lowpass for arrays, input10 is the reading << 10; every intermediate
+    # value stays below 2**31, so int32 arrays are exact
+    d = input10 - state
+    return state + (((d >> 14) * k + (((d & 0x3FFF) * k + 0x8000) >> 14)) >> 2)
+
+
+def stepInPlace(state, input10, k, d, t):
+    # step() without temporaries, d and t are scratch arrays like state
+    np.subtract(input10, state, out=d)
+    np.bitwise_and(d, 0x3FFF, out=t)
+    t *= k
+    t += 0x8000
+    t >>= 14
+    d >>= 14
+    d *= k
+    d += t
+    d >>= 2
+    state += d
+
+
+def timeConstant(k):
+    return COEFFICIENT_ONE // max(1, int(k))
+
+
+def laneLengthFor(k):
+    # long enough that the warm-up costs at most half of the steps
+    return max(LANE_LENGTH, 2 * WARMUP_TIME_CONSTANTS * timeConstant(min(k)))
+
+
+def rows(x, start, stop):
+    # (step, input10 of all lanes) for the steps start..stop of x (lanes, laneLength),
+    # transposed in cache-sized blocks of BLOCK steps
+    for j in range(start, stop, BLOCK):
+        block = x[:, j:min(stop, j + BLOCK)].astype(np.int32).T.copy()
+        block <<= 10
+        for i in range(len(block)):
+            yield j + i, block[i]
+
+
+def lowpassSegment(inputs, states, k, laneLength):
+    # steps m filters over the columns of inputs (n, m, uint16) from their exact states
+    # with their coefficients k (both m), returns the states after every input (m, n)
+    n, m = inputs.shape
+    perFilter = -(-n // laneLength)
+    lanes = m * perFilter
+    x = np.empty((m, perFilter * laneLength), dtype=np.uint16)
+    x[:, :n] = inputs.T
+    x[:, n:] = inputs[-1][:, None]
+    x = x.reshape(lanes, laneLength)
+    y = np.empty((lanes, laneLength), dtype=np.int32)
+    k = np.repeat(np.asarray(k, dtype=np.int32), perFilter)
+    # every lane but the first of a filter continues the lane before
+    speculative = np.arange(lanes) % perFilter != 0
+    d = np.empty(lanes, dtype=np.int32)
+    t = np.empty(lanes, dtype=np.int32)
+
+    # speculative warm-up on the tail of the lane before, from the mean input of one time
+    # constant before that
+    lane = np.empty(lanes, dtype=np.int32)
+    tau = timeConstant(k.min())
+    tail = max(0, laneLength - WARMUP_TIME_CONSTANTS * tau)
+    if lanes > 1:
+        lane[1:] = (x[:-1, max(0, tail - tau):max(1, tail)].mean(axis=1) * 1024).astype(np.int32)
+        for j, input10 in rows(x[:-1], tail, laneLength):
+            stepInPlace(lane[1:], input10, k[1:], d[1:], t[1:])
+    lane[~speculative] = states
+
+    block = np.empty((BLOCK, lanes), dtype=np.int32)
+    for j, input10 in rows(x, 0, laneLength):
+        stepInPlace(lane, input10, k, d, t)
+        block[j % BLOCK] = lane
+        if j % BLOCK == BLOCK - 1 or j == laneLength - 1:
+            first = j - j % BLOCK
+            y[:, first:j + 1] = block[:j + 1 - first].T
+
+    # repair: re-step lanes whose speculative start differs from the exact one, block by
+    # block, until they have merged with their speculative trajectory
+    while lanes > 1:
+        exact = step(y[:-1, -1], x[1:, 0].astype(np.int32) << 10, k[1:])
+        wrong = np.nonzero((exact != y[1:, 0]) & speculative[1:])[0] + 1
+        if len(wrong) == 0:
+            break
+        lane = y[wrong - 1, -1]
+        kWrong = k[wrong]
+        for first in range(0, laneLength, BLOCK):
+            last = min(laneLength, first + BLOCK)
+            inputs10 = x[wrong, first:last].astype(np.int32) << 10
+            repaired = np.empty((len(wrong), last - first), dtype=np.int32)
+            for j in range(last - first):
+                lane = step(lane, inputs10[:, j], kWrong)
+                repaired[:, j] = lane
+            diverged = repaired[:, -1] != y[wrong, last - 1]
+            y[wrong, first:last] = repaired
+            if not diverged.all():
+                # merged lanes follow their speculative trajectory from here on
+                wrong = wrong[diverged]
+                lane = lane[diverged]
+                kWrong = kWrong[diverged]
+                if len(wrong) == 0:
+                    break
+
+    return y.reshape(m, perFilter * laneLength)[:, :n]
+
+
+def lowpassSegments(inputs, seeds, k, columns=None, lanes=LANES, laneLength=None):
+    # (first sample, states (m, samples)) of the filters seeded with seeds (m readings) after
+    # every input, like the firmware; filter i runs over column columns[i] of inputs
+    inputs = inputs.reshape(len(inputs), -1)
+    columns = list(range(inputs.shape[1])) if columns is None else list(columns)
+    laneLength = laneLength or laneLengthFor(k)
+    segment = max(1, lanes // len(columns)) * laneLength
+    states = np.asarray(seeds, dtype=np.int32) << 10
+    for start in range(0, len(inputs), segment):
+        y = lowpassSegment(np.asarray(inputs[start:start + segment])[:, columns], states, k, laneLength)
+        states = y[:, -1].copy()
+        yield start, y
+
+
+def lowpass(inputs, seeds, k, columns=None, lanes=LANES, laneLength=None):
+    # all states (m, samples) at once
+    out = None
+    for start, y in lowpassSegments(inputs, seeds, k, columns, lanes, laneLength):
+        if out is None:
+            out = np.empty((len(y), len(inputs)), dtype=np.int32)
+        out[:, start:start + y.shape[1]] = y
+    return out
+
+
+def lowpassReference(inputs, seedReading, k):
+    # the firmware kernel, one sample at a time
+    import fixed_filter
+    state = array("i", [0])
+    reading = array("H", [int(seedReading)])
+    coefficients = array("i", [k])
+    fixed_filter.seed(state, reading, 1)
+    out = np.empty(len(inputs), dtype=np.int32)
+    for i in range(len(inputs)):
+        reading[0] = int(inputs[i])
+        fixed_filter.lowpass(state, reading, coefficients, 1)
+        out[i] = state[0]
+    return out
+
+
+def filterReference(inputs, seedReading, kind, timeConstant, samplePeriodMs):
+    # the firmware's selectable filter of one channel, one sample at a time
+    import fixed_filter
+    kinds = bytearray([kind])
+    state = array("i", [0])
+    reading = array("H", [int(seedReading)])
+    params = array("i", fixed_filter.filterParameters(kind, timeConstant, samplePeriodMs))
+    coefficients = array("i", [params[0]])
+    memory = array("i", [0] * fixed_filter.MEMORY_SIZE)
+    fixed_filter.seed(state, reading, 1)
+    fixed_filter.resetMemory(kind, memory, 0, state[0])
+    out = np.empty(len(inputs), dtype=np.int32)
+    for i in range(len(inputs)):
+        reading[0] = int(inputs[i])
+        fixed_filter.filterChannels(kinds, state, reading, coefficients, params, memory, 1)
+        out[i] = state[0]
+    return out
+
+
+def lookupTable(offset=None, factor=None):
+    # the firmware's ADC code -> centi-degree table of a channel
+    from host.sim import install
+    install()
+    from temperature_reader_node import TemperatureReaderNode
+    node = TemperatureReaderNode.__new__(TemperatureReaderNode)
+    node.correctionOffsets = [TemperatureReaderNode.RESISTENCE_CORRECTION_OFFSET if offset is None else offset]
+    node.correctionFactors = [TemperatureReaderNode.RESISTENCE_CORRECTION_FACTOR if factor is None else factor]
+    node.lookupTables = [array("h", bytes(2 * TemperatureReaderNode.LOOKUP_TABLE_SIZE))]
+    TemperatureReaderNode.buildLookupTable(node, 0)
+    return np.array(node.lookupTables[0], dtype=np.int32)
+
+
+def centiDegrees(states, table, out=None, chunk=1 << 16):
+    # TemperatureReaderNode.lookupTemperature for arrays of states, in cache-sized chunks;
+    # table differences times fractions stay below 2**31 in int32
+    states = np.asarray(states, dtype=np.int32)
+    if out is None:
+        out = np.empty(states.shape, dtype=np.int16)
+    flatStates = states.reshape(-1)
+    flatOut = out.reshape(-1)
+    for start in range(0, len(flatStates), chunk):
+        state = flatStates[start:start + chunk]
+        code = state >> STATE_FRACTION_BITS
+        low = np.take(table, code)
+        fraction = state - (code << STATE_FRACTION_BITS)
+        flatOut[start:start + chunk] = low + (((np.take(table, code + 1) - low) * fraction + (1 << (STATE_FRACTION_BITS - 1))) >> STATE_FRACTION_BITS)
+    return out
+
+
+def synthetic(samples, channels=3, seed=1, chunk=1 << 22):
+    # slow random walks around 25 °C with ADC noise, for benchmarking
+    rng = np.random.default_rng(seed)
+    readings = np.empty((samples + 1, channels), dtype=np.uint16)
+    level = np.full(channels, 14800.0)
+    for start in range(0, samples + 1, chunk):
+        end = min(samples + 1, start + chunk)
+        walk = level + np.cumsum(rng.normal(0.0, 0.05, (end - start, channels)), axis=0)
+        level = walk[-1]
+        readings[start:end] = np.clip(walk + rng.normal(0.0, 40.0, walk.shape), 0, 65535)
+    return readings
+
+
+def replay(readings, coefficient, rawCoefficient, table, outDir=None, lanes=LANES, laneLength=None, filters=None, samplePeriodMs=None):
+    # runs the filtered and the raw filter of every channel and converts to centi-degrees,
+    # written as memory-mapped .npy files to outDir if given; returns per channel the last
+    # (filtered, raw) centi-degrees and the mean and maximum of |raw - filtered|.
+    # filters maps channels to the (kind, time constant) of a filter other than the lowpass.
+    samples, channels = len(readings) - 1, readings.shape[1]
+    exact = {channel: filterReference(readings[1:, channel], readings[0, channel], kind, timeConstant, samplePeriodMs)
+             for channel, (kind, timeConstant) in (filters or {}).items()}
+    columns = [channel for channel in range(channels) for _ in range(2)]
+    k = [coefficient, rawCoefficient] * channels
+    seeds = [readings[0, channel] for channel in columns]
+    outputs = None
+    if outDir is not None:
+        outputs = [np.lib.format.open_memmap(os.path.join(outDir, "channel%d_%s.npy" % (channel, name)),
+                                             mode="w+", dtype=np.int16, shape=(samples,))
+                   for channel in range(channels) for name in ("filtered", "raw")]
+    divergenceSum = np.zeros(channels)
+    divergenceMax = np.zeros(channels, dtype=np.int64)
+    for start, states in lowpassSegments(readings[1:], seeds, k, columns, lanes, laneLength):
+        for channel, filtered in exact.items():
+            states[2 * channel] = filtered[start:start + states.shape[1]]
+        temperatures = centiDegrees(states, table)
+        if outputs is not None:
+            for i in range(len(outputs)):
+                outputs[i][start:start + states.shape[1]] = temperatures[i]
+        divergence = np.abs(temperatures[1::2].astype(np.int64) - temperatures[0::2])
+        divergenceSum += divergence.sum(axis=1)
+        divergenceMax = np.maximum(divergenceMax, divergence.max(axis=1))
+        last = temperatures[:, -1]
+    if outputs is not None:
+        for output in outputs:
+            output.flush()
+    return [(last[2 * c], last[2 * c + 1], divergenceSum[c] / max(1, samples), divergenceMax[c]) for c in range(channels)]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m host.replay", description="Replay an ADC trace through the firmware filter chain.")
+    parser.add_argument("trace", nargs="?", help="binary ADC trace, see --adc-trace of host.sim")
+    parser.add_argument("--synthetic", type=int, default=None, metavar="N", help="replay N generated samples per channel instead of a trace")
+    parser.add_argument("--k2", type=float, default=None, help="replay with this coefficient instead of the recorded one")
+    parser.add_argument("--raw-k2", type=float, default=None, help="the same for the raw filter")
+    parser.add_argument("--offset", type=float, default=None, help="resistence correction offset of the lookup table")
+    parser.add_argument("--factor", type=float, default=None, help="resistence correction factor of the lookup table")
+    parser.add_argument("--filter", action="append", default=[], metavar="CHANNEL,KIND[,SECONDS]",
+                        help="the channel runs median, butterworth or kalman on the device (time constant default 20 s), repeatable")
+    parser.add_argument("--lanes", type=int, default=LANES)
+    parser.add_argument("--lane-length", type=int, default=None, help="default: long enough for the warm-up of the slowest filter")
+    parser.add_argument("--verify", type=int, default=0, metavar="N", help="compare the first N states of every filter with the firmware kernel")
+    parser.add_argument("--out", default=None, metavar="DIR", help="write the centi-degrees per channel as .npy")
+    args = parser.parse_args()
+
+    from host.sim import install
+    install()
+    from fixed_filter import FILTERS, LOWPASS, coefficient as toCoefficient
+    from temperature_reader_node import TemperatureReaderNode
+
+    if args.synthetic is not None:
+        readings = synthetic(args.synthetic)
+        samplePeriodMs = TemperatureReaderNode.SAMPLE_PERIOD
+        coefficient, rawCoefficient = toCoefficient(TemperatureReaderNode.K2), toCoefficient(TemperatureReaderNode.RAW_K2)
+    elif args.trace is not None:
+        trace = Trace(args.trace)
+        readings = trace.readings
+        samplePeriodMs = trace.samplePeriodMs
+        coefficient, rawCoefficient = trace.coefficient, trace.rawCoefficient
+    else:
+        parser.error("a trace or --synthetic is required")
+    filters = {}
+    for spec in args.filter:
+        fields = spec.split(",")
+        try:
+            channel, kind = int(fields[0]), FILTERS.index(fields[1])
+            timeConstant = float(fields[2]) if len(fields) > 2 else TemperatureReaderNode.FILTER_TIME_CONSTANT
+        except (ValueError, IndexError):
+            parser.error("invalid --filter %s, expected CHANNEL,%s[,SECONDS]" % (spec, "|".join(FILTERS)))
+        if not 0 <= channel < readings.shape[1]:
+            parser.error("no channel %d in the trace" % channel)
+        if kind != LOWPASS:
+            filters[channel] = (kind, timeConstant)
+    if args.k2 is not None:
+        coefficient = toCoefficient(args.k2)
+    if args.raw_k2 is not None:
+        rawCoefficient = toCoefficient(args.raw_k2)
+    if args.out is not None:
+        os.makedirs(args.out, exist_ok=True)
+
+    table = lookupTable(args.offset, args.factor)
+    samples, channels = len(readings) - 1, readings.shape[1]
+    started = time.time()
+    results = replay(readings, coefficient, rawCoefficient, table, args.out, args.lanes, args.lane_length, filters, samplePeriodMs)
+    elapsed = time.time() - started
+    print("%d samples x %d channels x 2 filters in %.2f s, %.1f M samples/s" % (
+        samples, channels, elapsed, 2 * samples * channels / max(elapsed, 1e-9) / 1e6))
+    for channel, (filtered, raw, meanDivergence, maxDivergence) in enumerate(results):
+        print("channel %d: last %.2f °C (raw %.2f °C), |raw - filtered| mean %.3f K, max %.2f K" % (
+            channel, filtered / 100, raw / 100, meanDivergence / 100, maxDivergence / 100))
+
+    if args.verify:
+        n = min(args.verify, samples)
+        for channel in range(channels):
+            inputs = np.asarray(readings[1:n + 1, channel])
+            actual = lowpass(inputs, [readings[0, channel]] * 2, [coefficient, rawCoefficient], [0, 0], args.lanes, args.lane_length)
+            for i, (name, k) in enumerate((("filtered", coefficient), ("raw", rawCoefficient))):
+                expected = lowpassReference(inputs, readings[0, channel], k)
+                mismatches = np.count_nonzero(expected != actual[i])
+                print("verify channel %d %s: %d samples, %d mismatches" % (channel, name, n, mismatches))
+                if mismatches:
+                    raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Closed-loop simulation of the pyHeat firmware on CPython.
+
+The firmware under app/ runs unmodified: host/sim/stubs provides machine, utime,
+uasyncio, micropython and homie on top of one virtual clock (host.sim.clock), and
+host.sim.plant supplies the ADC readings from a thermal model that in turn reacts
+to the valve motor and heat pump pins. Zone thermostats of the model switch the
+floor valves and report it over the stand-in broker, exactly as the real
+installation writes Floors/numberOfOpenValves.
+
+    python -m host.sim --days 7
+"""
+import builtins
+import calendar
+import gc
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+STUBS = os.path.join(HERE, "stubs")
+APP = os.path.join(ROOT, "app")
+LIB = os.path.join(APP, "lib")
+# free heap of an ESP32 with MicroPython and the firmware loaded
+HEAP_SIZE = 111168
+
+
+def install():
+    # stand-ins first so they win over anything with the same name
+    for path in (ROOT, LIB, APP, STUBS):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+    import micropython
+    builtins.const = micropython.const
+    # MicroPython's heap statistics, CPython has no fixed heap to report on; the
+    # firmware collects every control cycle, a full CPython collection each time
+    # would triple the run time, the youngest generation is enough here
+    if not hasattr(gc, "mem_free"):
+        gc.mem_free = lambda: HEAP_SIZE
+        gc.mem_alloc = lambda: 0
+        fullCollect = gc.collect
+        gc.collect = lambda generation=0: fullCollect(generation)
+
+
+class Settings:
+    # settings.py with some values overridden for one simulation
+
+    def __init__(self, module, **overrides):
+        self.module = module
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+
+class DayStats:
+
+    def __init__(self, day):
+        self.day = day
+        self.samples = 0
+        self.roomMin = float("inf")
+        self.roomMax = float("-inf")
+        self.roomSum = 0.0
+        self.outsideSum = 0.0
+        self.flowErrorSquares = 0.0
+        self.heat = 0.0
+        self.valveTravel = 0.0
+        self.pumpOn = 0.0
+
+    def line(self):
+        n = max(1, self.samples)
+        return "day %3d  outside %5.1f  room %5.2f [%5.2f..%5.2f]  flow rms err %4.2f  heat %6.1f kWh  valve travel %5.1f %%  pump on %4.1f h" % (
+            self.day, self.outsideSum / n, self.roomSum / n, self.roomMin, self.roomMax,
+            (self.flowErrorSquares / n) ** 0.5, self.heat / 3.6e6, self.valveTravel * 100, self.pumpOn / 3600)
+
+
+class Simulation:
+
+    PLANT_STEP_S = 10
+
+    def __init__(self, seed=1, samplePeriodMs=None, start=(2026, 10, 1), logLevel=None, flashDir=None, trace=None, adcTrace=None):
+        install()
+        from host.sim.clock import clock
+        from host.sim.broker import broker
+        from host.sim.plant import Plant
+        import machine
+
+        self.clock = clock
+        self.broker = broker
+        clock.reset(epoch=calendar.timegm(start + (0, 0, 0)))
+        broker.reset()
+        machine.Pin.registry.clear()
+        machine.ADC.sources.clear()
+
+        self.plant = Plant(seed)
+        machine.ADC.sources.update(self.plant.adcSources())
+        self.pins = machine.Pin.registry
+
+        # stands in for main.py
+        import boot_timing
+        import settings
+        import log
+        from temperature_history import TemperatureHistory
+        from pyheat_device import PyHeatDevice
+        boot_timing.mark(boot_timing.IMPORTS)
+
+        # the board's flash filesystem
+        self.flashDir = flashDir or tempfile.mkdtemp(prefix="pyheat-flash-")
+        TemperatureHistory.FILES = tuple(self.flash(path) for path in TemperatureHistory.FILES)
+        import state_store
+        state_store.FILES = [self.flash(path) for path in state_store.FILES]
+
+        if logLevel is not None:
+            log.setLevel(logLevel)
+
+        self.settings = Settings(settings, SAMPLE_PERIOD=samplePeriodMs) if samplePeriodMs is not None else settings
+        self.device = PyHeatDevice(self.settings)
+        self.demandTopic = "%s/Floors/numberOfOpenValves/set" % self.device.dtopic
+        self.targetTopic = "%s/TargetTempCalc/targetFlowTemperature" % self.device.dtopic
+        self.openZones = None
+
+        self.days = []
+        self.plantSteps = 0
+        self.trace = trace
+        if trace is not None:
+            trace.write("time,outside,flow,return,supply,openValves,valve\n")
+        if adcTrace is not None:
+            self.recordReadings(adcTrace)
+        self.plant.lastUs = clock.now_us
+        clock.call_later_us(self.PLANT_STEP_S * 1000000, self.plantStep)
+
+    def recordReadings(self, file):
+        # the filter inputs of every sample for host.replay, starting with the seed
+        from host.replay import TraceWriter
+        reader = next(node for node in self.device.nodes if node.id == "Temperatures")
+        writer = TraceWriter(file, len(reader.readings), reader.samplePeriod, reader.coefficients[0], reader.rawCoefficients[0])
+        writer.write(reader.readings)
+        job = reader.readTemperaturesJob
+        readTemperatures = job.callback
+
+        def recordingReadTemperatures():
+            readTemperatures()
+            writer.write(reader.readings)
+        job.callback = recordingReadTemperatures
+
+    def flash(self, path):
+        return os.path.join(self.flashDir, path.lstrip("/"))
+
+    def plantStep(self):
+        plant = self.plant
+        pumpOn = plant.pinIsOn(plant.PUMP_PIN, self.pins)
+        travel = plant.valveTravel
+        plant.step(self.pins)
+        self.plantSteps += 1
+
+        openZones = plant.openZones()
+        if openZones != self.openZones:
+            self.openZones = openZones
+            self.broker.deliver(self.demandTopic, str(openZones))
+
+        day = int(self.clock.now_us // 86400000000)
+        if not self.days or self.days[-1].day != day:
+            self.days.append(DayStats(day))
+        stats = self.days[-1]
+        stats.samples += 1
+        stats.roomMin = min(stats.roomMin, plant.room)
+        stats.roomMax = max(stats.roomMax, plant.room)
+        stats.roomSum += plant.room
+        stats.outsideSum += plant.outside
+        target = float(self.broker.value(self.targetTopic, plant.flow))
+        stats.flowErrorSquares += (plant.flow - target) ** 2 if openZones else 0.0
+        stats.heat += plant.heat * self.PLANT_STEP_S
+        stats.valveTravel += plant.valveTravel - travel
+        stats.pumpOn += self.PLANT_STEP_S if pumpOn else 0
+
+        if self.trace is not None:
+            self.trace.write("%d,%.3f,%.3f,%.3f,%.3f,%d,%.2f\n" % (
+                self.clock.now_us // 1000000, plant.outside, plant.flow, plant.returnTemperature, plant.supply, openZones, plant.valve * 100))
+
+        self.clock.call_later_us(self.PLANT_STEP_S * 1000000, self.plantStep)
+
+    def run(self, seconds, onDay=None):
+        end = self.clock.now_us + int(seconds * 1000000)
+        day = 86400000000
+        while self.clock.now_us < end:
+            self.clock.run_until(min(end, (self.clock.now_us // day + 1) * day - 1))
+            if onDay is not None and self.days:
+                onDay(self.days[-1])
+            self.clock.run_until(min(end, self.clock.now_us + 1))
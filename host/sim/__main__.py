@@ -0,0 +1,35 @@
+import argparse
+import time
+
+from host.sim import Simulation
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m host.sim", description="Run the pyHeat firmware against a simulated heating installation.")
+    parser.add_argument("--days", type=float, default=7, help="simulated days (a heating season is about 210)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the sensor noise")
+    parser.add_argument("--sample-period", type=int, default=None, metavar="MS",
+                        help="sample the temperatures every MS instead of the firmware default, "
+                             "filter coefficients are scaled to keep their time constants")
+    parser.add_argument("--trace", default=None, metavar="FILE", help="write the plant state as CSV, e.g. for host.sweep")
+    parser.add_argument("--adc-trace", default=None, metavar="FILE", help="write the filter inputs as binary trace for host.replay")
+    parser.add_argument("--log-level", type=int, default=40, help="firmware log level, 10 prints everything")
+    args = parser.parse_args()
+
+    trace = open(args.trace, "w") if args.trace else None
+    adcTrace = open(args.adc_trace, "wb") if args.adc_trace else None
+    started = time.time()
+    sim = Simulation(seed=args.seed, samplePeriodMs=args.sample_period, logLevel=args.log_level, trace=trace, adcTrace=adcTrace)
+    sim.run(args.days * 86400, onDay=lambda stats: print(stats.line(), flush=True))
+    elapsed = time.time() - started
+    if trace is not None:
+        trace.close()
+    if adcTrace is not None:
+        adcTrace.close()
+
+    print("%.1f simulated days in %.1f s, %d events, %d MQTT messages (%d bytes)" % (
+        args.days, elapsed, sim.clock.events, sim.broker.messages, sim.broker.bytes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Stand-in for the MQTT broker the device talks to."""
+from collections import Counter
+
+
+class Broker:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.retained = {}
+        self.last = {}
+        self.counts = Counter()
+        self.bytes = 0
+        self.messages = 0
+        self.subscriptions = {}
+        self.listeners = []
+
+    def publish(self, topic, payload, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        elif not isinstance(payload, (bytes, bytearray)):
+            payload = str(payload).encode()
+        self.messages += 1
+        self.bytes += len(topic) + len(payload)
+        self.counts[topic] += 1
+        self.last[topic] = payload
+        if retain:
+            self.retained[topic] = payload
+        for listener in self.listeners:
+            listener(topic, payload, retain)
+
+    def subscribe(self, topic, callback):
+        self.subscriptions[topic] = callback
+
+    def deliver(self, topic, payload, retained=False):
+        # message from another client to the device
+        callback = self.subscriptions.get(topic)
+        if callback is None:
+            raise KeyError("nothing subscribed to %s" % topic)
+        callback(topic, payload, retained)
+
+    def value(self, topic, default=None):
+        payload = self.last.get(topic)
+        return default if payload is None else payload.decode()
+
+
+broker = Broker()
@@ -0,0 +1,55 @@
+"""Virtual time for the simulation.
+
+Everything that happens on the simulated board -- machine.Timer callbacks, uasyncio
+tasks waking up, plant integration steps -- is an entry in one deadline heap, so the
+simulation jumps straight from one event to the next instead of waiting.
+"""
+import heapq
+
+
+class Clock:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, epoch=0):
+        self.now_us = 0
+        self.epoch = epoch
+        self._heap = []
+        self._seq = 0
+        self.events = 0
+
+    def call_at_us(self, at_us, fn, *args):
+        self._seq += 1
+        entry = [max(at_us, self.now_us), self._seq, fn, args]
+        heapq.heappush(self._heap, entry)
+        return entry
+
+    def call_later_us(self, delay_us, fn, *args):
+        return self.call_at_us(self.now_us + delay_us, fn, *args)
+
+    def call_soon(self, fn, *args):
+        return self.call_at_us(self.now_us, fn, *args)
+
+    @staticmethod
+    def cancel(entry):
+        if entry is not None:
+            entry[2] = None
+
+    def run_until(self, end_us):
+        heap = self._heap
+        while heap and heap[0][0] <= end_us:
+            at_us, _, fn, args = heapq.heappop(heap)
+            if fn is None:
+                continue
+            self.now_us = at_us
+            self.events += 1
+            fn(*args)
+        self.now_us = max(self.now_us, end_us)
+
+    def advance_us(self, delay_us):
+        # blocking sleeps on the board: time passes, nothing else runs
+        self.now_us += delay_us
+
+
+clock = Clock()
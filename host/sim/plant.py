@@ -0,0 +1,170 @@
+"""Thermal model of the heating installation the board controls.
+
+    heat pump --supply--> mixer valve --flow--> floor loops --return--+
+                              ^                                       |
+                              +---------------------------------------+
+
+The heat pump heats its supply towards SUPPLY_TEMPERATURE while pin 2 is high. The
+mixer valve is moved by the open/close motor pins at VALVE_TRAVEL_S for a full stroke
+and blends supply with return water. The floor loops are open according to the zone
+thermostats and exchange heat with one concrete slab, which heats one room that
+loses heat to the outside. Outside temperature follows a seasonal and a daily cycle.
+All first order lags are integrated exactly, so the step size only limits the
+resolution, not the stability.
+"""
+import functools
+import math
+import random
+
+from host.sim.clock import clock
+
+
+def _lag(tau, dt):
+    return 1.0 - math.exp(-dt / tau)
+
+
+class Plant:
+
+    # (setpoint, hysteresis) per floor zone thermostat
+    ZONES = ((20.6, 0.3), (20.8, 0.3), (21.0, 0.3), (21.2, 0.3))
+
+    SUPPLY_TEMPERATURE = 50.0
+    SUPPLY_TAU = 600.0
+    SUPPLY_IDLE_TEMPERATURE = 25.0
+    SUPPLY_IDLE_TAU = 3600.0
+
+    VALVE_TRAVEL_S = 55.0
+    FLOW_SENSOR_TAU = 20.0
+    RETURN_IDLE_TAU = 900.0
+
+    WATER_FLOW = 0.3            # kg/s with all zones open
+    WATER_CAPACITY = 4186.0     # J/(kg K)
+    FLOOR_UA = 1000.0           # W/K water -> slab with all zones open
+    SLAB_CAPACITY = 20e6        # J/K
+    SLAB_UA = 600.0             # W/K slab -> room
+    ROOM_CAPACITY = 5e6         # J/K
+    ROOM_UA = 200.0             # W/K room -> outside
+
+    OUTSIDE_MEAN = 4.0
+    OUTSIDE_SEASON_AMPLITUDE = 7.0
+    OUTSIDE_DAY_AMPLITUDE = 4.0
+    COLDEST_DAY = 110           # days after the start of the simulation
+
+    # sensor wiring as in TemperatureReaderNode
+    FLOW_PIN, OUTSIDE_PIN, RETURN_PIN = (27, 28, 26)
+    OPEN_PIN, CLOSE_PIN, PUMP_PIN = (0, 1, 2)
+    REF_VOLTAGE = 3300.0
+    REF_RESISTOR = 3875.0
+    TEMP_FACTOR = 0.257003341043434
+    TEMP_OFFSET = -257.003341043434
+    RESISTENCE_OFFSET = -20.0
+    ADC_NOISE = 3.0             # standard deviation in 12 bit codes
+
+    def __init__(self, seed=1):
+        self.random = random.Random(seed)
+        self.supply = 45.0
+        self.valve = 0.0
+        self.flow = 30.0
+        self.flowSensor = 30.0
+        self.returnTemperature = 28.0
+        self.slab = 27.0
+        self.room = 20.8
+        self.outside = self.outsideAt(0.0)
+        self.zonesOpen = [True] * len(self.ZONES)
+        self.heat = 0.0
+        self.valveTravel = 0.0
+        self.lastUs = clock.now_us
+        self.lastOnUs = {}
+
+        # sensor noise is drawn from a precomputed table, ADC reads are the hot path of the simulation
+        self.noise = [self.random.gauss(0.0, self.ADC_NOISE) for _ in range(4093)]
+        self.noiseIndex = 0
+        self.codes = {}
+        self.updateCodes()
+
+    def outsideAt(self, seconds):
+        day = seconds / 86400.0
+        season = -math.cos(2 * math.pi * (day - self.COLDEST_DAY) / 365.0)
+        daily = math.sin(2 * math.pi * (day % 1.0 - 0.375))
+        return self.OUTSIDE_MEAN - self.OUTSIDE_SEASON_AMPLITUDE * season + self.OUTSIDE_DAY_AMPLITUDE * daily
+
+    def pinOnSeconds(self, pinId, pins):
+        # seconds the pin was high since the previous step
+        pin = pins.get(pinId)
+        if pin is None:
+            return 0.0
+        onUs = pin.on_time_us()
+        delta = onUs - self.lastOnUs.get(pinId, 0)
+        self.lastOnUs[pinId] = onUs
+        return delta / 1e6
+
+    def pinIsOn(self, pinId, pins):
+        pin = pins.get(pinId)
+        return pin is not None and pin.value() == 1
+
+    def step(self, pins):
+        dt = (clock.now_us - self.lastUs) / 1e6
+        self.lastUs = clock.now_us
+        if dt <= 0:
+            return
+
+        self.outside = self.outsideAt(clock.now_us / 1e6)
+
+        opening = self.pinOnSeconds(self.OPEN_PIN, pins)
+        closing = self.pinOnSeconds(self.CLOSE_PIN, pins)
+        previous = self.valve
+        self.valve = min(1.0, max(0.0, self.valve + (opening - closing) / self.VALVE_TRAVEL_S))
+        self.valveTravel += abs(self.valve - previous)
+
+        if self.pinIsOn(self.PUMP_PIN, pins):
+            self.supply += (self.SUPPLY_TEMPERATURE - self.supply) * _lag(self.SUPPLY_TAU, dt)
+        else:
+            self.supply += (self.SUPPLY_IDLE_TEMPERATURE - self.supply) * _lag(self.SUPPLY_IDLE_TAU, dt)
+
+        demand = sum(self.zonesOpen) / len(self.ZONES)
+        self.flow = self.valve * self.supply + (1.0 - self.valve) * self.returnTemperature
+        self.flowSensor += (self.flow - self.flowSensor) * _lag(self.FLOW_SENSOR_TAU, dt)
+
+        if demand > 0:
+            # counter flow exchanger, UA and water flow both scale with the open zones
+            efficiency = 1.0 - math.exp(-self.FLOOR_UA / (self.WATER_FLOW * self.WATER_CAPACITY))
+            returnTemperature = self.flow - (self.flow - self.slab) * efficiency
+            self.heat = demand * self.WATER_FLOW * self.WATER_CAPACITY * (self.flow - returnTemperature)
+            self.returnTemperature = returnTemperature
+        else:
+            self.heat = 0.0
+            self.returnTemperature += (self.slab - self.returnTemperature) * _lag(self.RETURN_IDLE_TAU, dt)
+
+        toRoom = self.SLAB_UA * (self.slab - self.room)
+        toOutside = self.ROOM_UA * (self.room - self.outside)
+        self.slab += (self.heat - toRoom) * dt / self.SLAB_CAPACITY
+        self.room += (toRoom - toOutside) * dt / self.ROOM_CAPACITY
+
+        for i, (setpoint, hysteresis) in enumerate(self.ZONES):
+            if self.room < setpoint - hysteresis:
+                self.zonesOpen[i] = True
+            elif self.room > setpoint + hysteresis:
+                self.zonesOpen[i] = False
+
+        self.updateCodes()
+
+    def openZones(self):
+        return sum(self.zonesOpen)
+
+    def adcCode(self, temperature):
+        # inverse of the conversion in TemperatureReaderNode, as a fractional 12 bit code
+        resistence = (temperature - self.TEMP_OFFSET) / self.TEMP_FACTOR - self.RESISTENCE_OFFSET
+        return resistence / (self.REF_RESISTOR + resistence) * 4096 + 0.5
+
+    def updateCodes(self):
+        self.codes[self.FLOW_PIN] = self.adcCode(self.flowSensor)
+        self.codes[self.OUTSIDE_PIN] = self.adcCode(self.outside)
+        self.codes[self.RETURN_PIN] = self.adcCode(self.returnTemperature)
+
+    def adcReading(self, pinId):
+        i = self.noiseIndex = (self.noiseIndex + 1) % 4093
+        code = int(self.codes[pinId] + self.noise[i])
+        return (0 if code < 0 else 4095 if code > 4095 else code) << 4
+
+    def adcSources(self):
+        return {pinId: functools.partial(self.adcReading, pinId) for pinId in (self.FLOW_PIN, self.OUTSIDE_PIN, self.RETURN_PIN)}
@@ -0,0 +1,17 @@
+STRING = "string"
+INTEGER = "integer"
+FLOAT = "float"
+BOOLEAN = "boolean"
+ENUM = "enum"
+COLOR = "color"
+DATETIME = "datetime"
+DURATION = "duration"
+
+TRUE = "true"
+FALSE = "false"
+
+EXT_MPY = "org.microhomie.mpy:0.1.0:[4.x]"
+EXT_FW = "org.homie.legacy-firmware:0.1.1:[4.x]"
+EXT_STATS = "org.homie.legacy-stats:0.1.1:[4.x]"
+
+QOS = 1
@@ -0,0 +1,43 @@
+from host.sim.broker import broker
+
+
+def await_ready_state(func):
+    return func
+
+
+class HomieDevice:
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.device_id = settings.DEVICE_ID
+        self.dtopic = "{}/{}".format(settings.MQTT_BASE_TOPIC, self.device_id)
+        self.nodes = []
+        self.stats_interval = getattr(settings, "DEVICE_STATS_INTERVAL", 60)
+
+    def add_node(self, node):
+        node.device = self
+        self.nodes.append(node)
+        for p in node.properties:
+            self.subscribe_property(p)
+
+    def subscribe_property(self, p):
+        if p.settable:
+            topic = "{}/{}/{}/set".format(self.dtopic, p.node.id, p.id)
+
+            def dispatch(topic, payload, retained, p=p):
+                if p.on_message is not None:
+                    p.on_message(topic, payload, retained)
+
+            broker.subscribe(topic, dispatch)
+
+    async def publish(self, topic, payload, retain=True):
+        broker.publish("{}/{}".format(self.dtopic, topic), payload, retain)
+
+    async def subscribe(self, topic):
+        pass
+
+    def run(self):
+        raise RuntimeError("the simulation drives the device through host.sim.clock")
+
+    def run_forever(self):
+        self.run()
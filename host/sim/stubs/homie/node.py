@@ -0,0 +1,16 @@
+class HomieNode:
+
+    def __init__(self, id, name, type):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.properties = []
+        self.device = None
+
+    def add_property(self, p, cb=None):
+        p.node = self
+        if cb is not None:
+            p.on_message = cb
+        self.properties.append(p)
+        if self.device is not None:
+            self.device.subscribe_property(p)
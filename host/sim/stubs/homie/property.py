@@ -0,0 +1,47 @@
+from uasyncio import create_task
+from homie.constants import STRING
+
+
+class HomieProperty:
+
+    def __init__(
+        self,
+        id,
+        name=None,
+        settable=False,
+        retained=True,
+        unit=None,
+        datatype=STRING,
+        format=None,
+        default=None,
+        restore=True,
+        on_message=None,
+        pub_on_upd=True,
+    ):
+        self.id = id
+        self.name = name
+        self.settable = settable
+        self.retained = retained
+        self.unit = unit
+        self.datatype = datatype
+        self.format = format
+        self.restore = restore
+        self.on_message = on_message
+        self.pub_on_upd = pub_on_upd
+        self.node = None
+        self._value = default
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        if self.pub_on_upd:
+            self.publish()
+
+    def publish(self):
+        if self._value is None or self.node is None or self.node.device is None:
+            return
+        create_task(self.node.device.publish("{}/{}".format(self.node.id, self.id), self._value, self.retained))
@@ -0,0 +1,111 @@
+from host.sim.clock import clock
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    # last Pin object created per id, the plant reads the motor and pump outputs from here
+    registry = {}
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = 0
+        self._on_us = 0
+        self._since_us = clock.now_us
+        Pin.registry[id] = self
+        if value is not None:
+            self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        value = 1 if value else 0
+        if value != self._value:
+            if self._value:
+                self._on_us += clock.now_us - self._since_us
+            self._since_us = clock.now_us
+            self._value = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on_time_us(self):
+        # total time this pin has been driven high so far
+        if self._value:
+            return self._on_us + clock.now_us - self._since_us
+        return self._on_us
+
+
+class ADC:
+    # pin id -> callable returning a read_u16() value, installed by the plant
+    sources = {}
+
+    def __init__(self, pin, *args, **kwargs):
+        self.pin_id = pin.id if isinstance(pin, Pin) else pin
+        # a source installed before the ADC is created is read directly, one call less per reading
+        source = ADC.sources.get(self.pin_id)
+        if source is not None:
+            self.read_u16 = source
+
+    def read_u16(self):
+        source = ADC.sources.get(self.pin_id)
+        return source() if source is not None else 0
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self._entry = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=-1):
+        self.deinit()
+        if freq > 0:
+            period = 1000 / freq
+        self._mode = mode
+        self._period_us = int(period * 1000)
+        self._callback = callback
+        self._next_us = clock.now_us + self._period_us
+        self._entry = clock.call_at_us(self._next_us, self._fire)
+
+    def _fire(self):
+        if self._mode == Timer.PERIODIC:
+            self._next_us += self._period_us
+            self._entry = clock.call_at_us(self._next_us, self._fire)
+        else:
+            self._entry = None
+        if self._callback is not None:
+            self._callback(self)
+
+    def deinit(self):
+        clock.cancel(self._entry)
+        self._entry = None
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def unique_id():
+    return b"\x00\x00\x00\x00\x00\x00\x00\x01"
+
+
+def freq(*args):
+    return 125000000
+
+
+def idle():
+    pass
@@ -0,0 +1,237 @@
+"""Just enough of uasyncio on top of the virtual clock.
+
+Coroutines talk to the loop by yielding what they wait for: a _Sleep, an Event or a
+Task. None means "yield to the others and come back right away".
+"""
+import sys
+import traceback
+
+from host.sim.clock import clock
+
+
+class CancelledError(BaseException):
+    pass
+
+
+class TimeoutError(Exception):
+    pass
+
+
+class _Sleep:
+    __slots__ = ("us",)
+
+    def __init__(self, us):
+        self.us = us
+
+    def __await__(self):
+        yield self
+
+
+def sleep_ms(ms):
+    return _Sleep(max(0, int(ms * 1000)))
+
+
+def sleep(seconds):
+    return _Sleep(max(0, int(seconds * 1000000)))
+
+
+def sleep_us(us):
+    return _Sleep(max(0, int(us)))
+
+
+class Event:
+
+    def __init__(self):
+        self.state = False
+        self.waiting = []
+
+    def is_set(self):
+        return self.state
+
+    def set(self):
+        self.state = True
+        waiting = self.waiting
+        self.waiting = []
+        for task in waiting:
+            task._waitingOn = None
+            task._entry = clock.call_soon(task._step)
+
+    def clear(self):
+        self.state = False
+
+    def __await__(self):
+        if not self.state:
+            yield self
+
+    async def wait(self):
+        await self
+
+
+class ThreadSafeFlag(Event):
+
+    async def wait(self):
+        await self
+        self.state = False
+
+
+class Task:
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.done_ = False
+        self.result = None
+        self.exception = None
+        self.waiters = []
+        self._entry = clock.call_soon(self._step)
+        self._waitingOn = None
+
+    def done(self):
+        return self.done_
+
+    def _step(self, exc=None):
+        self._entry = None
+        _current[0] = self
+        try:
+            if exc is not None:
+                request = self.coro.throw(exc)
+            else:
+                request = self.coro.send(None)
+        except StopIteration as e:
+            self._finish(e.value, None)
+            return
+        except CancelledError as e:
+            self._finish(None, e)
+            return
+        except Exception as e:
+            self._finish(None, e)
+            return
+        finally:
+            _current[0] = None
+
+        if request is None:
+            self._entry = clock.call_soon(self._step)
+        elif isinstance(request, _Sleep):
+            self._entry = clock.call_later_us(request.us, self._step)
+        elif isinstance(request, Event):
+            self._waitingOn = request
+            request.waiting.append(self)
+        elif isinstance(request, Task):
+            self._waitingOn = request
+            request.waiters.append(self)
+        else:
+            raise RuntimeError("unexpected yield %r" % (request,))
+
+    def _finish(self, result, exception):
+        self.done_ = True
+        self.result = result
+        self.exception = exception
+        for task in self.waiters:
+            task._waitingOn = None
+            task._entry = clock.call_soon(task._step)
+        if exception is not None and not self.waiters and not isinstance(exception, CancelledError):
+            # uasyncio's default exception handler
+            print("Task exception wasn't retrieved", file=sys.stderr)
+            traceback.print_exception(type(exception), exception, exception.__traceback__, file=sys.stderr)
+
+    def cancel(self):
+        if self.done_:
+            return False
+        clock.cancel(self._entry)
+        waitingOn = self._waitingOn
+        if waitingOn is not None:
+            waiting = waitingOn.waiting if isinstance(waitingOn, Event) else waitingOn.waiters
+            if self in waiting:
+                waiting.remove(self)
+            self._waitingOn = None
+        self._entry = clock.call_soon(self._step, CancelledError())
+        return True
+
+    def __await__(self):
+        if not self.done_:
+            yield self
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+_current = [None]
+
+
+def current_task():
+    return _current[0]
+
+
+def create_task(coro):
+    if isinstance(coro, Task):
+        return coro
+    return Task(coro)
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+async def wait_for_ms(awaitable, timeout_ms):
+    task = create_task(awaitable if hasattr(awaitable, "send") else _await(awaitable))
+    timedOut = [False]
+
+    def expire():
+        timedOut[0] = True
+        task.cancel()
+
+    entry = clock.call_later_us(int(timeout_ms * 1000), expire)
+    try:
+        return await task
+    except CancelledError:
+        if timedOut[0]:
+            raise TimeoutError()
+        raise
+    finally:
+        clock.cancel(entry)
+
+
+async def wait_for(awaitable, timeout):
+    return await wait_for_ms(awaitable, timeout * 1000)
+
+
+async def gather(*awaitables, return_exceptions=False):
+    tasks = [create_task(a) for a in awaitables]
+    results = []
+    for task in tasks:
+        try:
+            results.append(await task)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+class Loop:
+
+    def create_task(self, coro):
+        return create_task(coro)
+
+    def run_until_complete(self, coro):
+        task = create_task(coro)
+        while not task.done_ and clock._heap:
+            clock.run_until(clock._heap[0][0])
+        return task.result
+
+    def run_forever(self):
+        raise RuntimeError("the simulation drives the loop through host.sim.clock")
+
+
+_loop = Loop()
+
+
+def get_event_loop(*args):
+    return _loop
+
+
+def new_event_loop():
+    return _loop
+
+
+def run(coro):
+    return _loop.run_until_complete(coro)
@@ -0,0 +1,51 @@
+from host.sim.clock import clock
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+
+def ticks_ms():
+    return (clock.now_us // 1000) & _TICKS_MAX
+
+
+def ticks_us():
+    return clock.now_us & _TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_diff(end, start):
+    return ((end - start + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def time():
+    return clock.epoch + clock.now_us // 1000000
+
+
+def time_ns():
+    return (clock.epoch * 1000000 + clock.now_us) * 1000
+
+
+def localtime(secs=None):
+    import time as _time
+    t = _time.gmtime(time() if secs is None else secs)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+
+def sleep(seconds):
+    clock.advance_us(int(seconds * 1000000))
+
+
+def sleep_ms(ms):
+    clock.advance_us(int(ms) * 1000)
+
+
+def sleep_us(us):
+    clock.advance_us(int(us))
@@ -0,0 +1,328 @@
+"""Batch evaluation of PID and heating curve parameters against recorded traces.
+
+The recorded outside, return (and optionally supply) temperatures drive a surrogate
+of the mixing circuit, and every parameter combination runs its own closed loop
+through a NumPy version of the firmware control path:
+
+    TargetFlowTemperatureCalculatorNode   the firmware's compiled curve table of every
+                                          combination (compile(), slope, origin,
+                                          maxFlowTemp, shift or --curve), interpolated
+                                          and quantized like calculateTargetFlowTemperature
+    FlowTemperatureRegulatorNode / PID    P + I with kI = kP / tN, sample_time gating,
+                                          integral and output clamped to 0..100
+    ValveControllerNode                   int() of the PID output, 1 % per 0.55 s motor
+    TemperatureReaderNode                 the measurement filter (--filter, lowpass with
+                                          --k2 by default) as a linear map over one
+                                          control period, identified by running
+                                          fixed_filter.filterChannels
+
+All combinations advance in lockstep, one array element each; the grid is split into
+chunks that are spread over a ProcessPoolExecutor. The result is ranked by the sum of
+the ranks for overshoot, settling time (time outside the band) and valve travel.
+
+The trace is a CSV file with a header and the columns time (s), outside, flow, return
+and optionally supply and openValves; `python -m host.sim --trace FILE` writes one.
+Parameter values the firmware would reject are an error. tests/test_sweep.py checks
+the curve and the filter model against the firmware modules.
+
+    python -m host.sweep trace.csv --kP 1:6:11 --tN 300:3000:10 --sampleTime 10000,30000,59000
+"""
+import argparse
+import csv
+import itertools
+import math
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+CONTROL_PERIOD_S = 10.0
+VALVE_PERCENT_S = 0.55
+PARAMETERS = ("kP", "tN", "sampleTime", "slope", "origin", "maxFlowTemp", "shift")
+CURVE_PARAMETERS = ("slope", "origin", "maxFlowTemp", "shift")
+DEFAULTS = {"kP": "2.6", "tN": "1000", "sampleTime": "59000", "slope": "-0.3", "origin": "35.0", "maxFlowTemp": "40.0", "shift": "0.0"}
+# input and memory amplitudes of the filter identification, in ADC codes (per sample),
+# within the Kalman filter's VELOCITY_MAX
+IDENTIFY_LEVEL = 2000
+IDENTIFY_STEP = 500
+IDENTIFY_VELOCITY = 4
+
+
+def firmware():
+    from host.sim import install
+    install()
+
+
+def compileTables(params, curve=""):
+    # the firmware's curve table of every combination, (combinations, TABLE_SIZE) deci-degrees
+    firmware()
+    from target_flow_temperature_calculator_node import TargetFlowTemperatureCalculatorNode
+    calculator = TargetFlowTemperatureCalculatorNode()
+    calculator.curve = calculator.parseCurve(curve)
+    if calculator.curve is None:
+        raise ValueError("invalid heating curve %s" % curve)
+    for name in CURVE_PARAMETERS:
+        for value in np.unique(params[name]):
+            if not calculator.validParameter(name, float(value)):
+                raise ValueError("%s %g is out of the firmware's range" % (name, value))
+    keys = np.stack([params[name] for name in CURVE_PARAMETERS], axis=1)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    tables = np.empty((len(unique), calculator.TABLE_SIZE), dtype=np.int32)
+    for i, (calculator.slope, calculator.origin, calculator.maxFlowTemp, calculator.shift) in enumerate(unique.tolist()):
+        calculator.compile()
+        tables[i] = calculator.table
+    return tables[inverse.reshape(-1)], calculator.TABLE_MIN, calculator.TABLE_STEPS_PER_DEGREE
+
+
+def targets(tables, tableMin, stepsPerDegree, outside):
+    # calculateTargetFlowTemperature of all tables at one outside temperature, in °C
+    position = (outside - tableMin) * stepsPerDegree
+    size = tables.shape[1]
+    if position <= 0:
+        deciDegrees = tables[:, 0]
+    elif position >= size - 1:
+        deciDegrees = tables[:, size - 1]
+    else:
+        index = int(position)
+        low = tables[:, index]
+        deciDegrees = low + np.round((tables[:, index + 1] - low) * (position - index))
+    return deciDegrees / 10
+
+
+def filterModel(kind="lowpass", timeConstant=20.0, k2=0.0005, samplePeriodMs=100):
+    # 2x3 matrix A of the firmware filter over one control period with the input x held:
+    # (y - x, memory) <- A (y - x, memory, previous x - x), y and x in ADC codes and the
+    # memory (band pass state or velocity) in codes per sample. The previous input is what
+    # the median window holds at the start of the period. The filters are linear apart
+    # from rounding, so three runs of fixed_filter.filterChannels identify A.
+    firmware()
+    import fixed_filter
+    kind = fixed_filter.FILTERS.index(kind)
+    params = array("i", fixed_filter.filterParameters(kind, timeConstant, samplePeriodMs))
+    coefficients = array("i", [fixed_filter.coefficient(k2) if kind == fixed_filter.LOWPASS else params[0]])
+    memoryScale = (1 << fixed_filter.STATE_FRACTION_BITS) * ((1 << fixed_filter.VELOCITY_BITS) if kind == fixed_filter.KALMAN else 1)
+    samples = round(CONTROL_PERIOD_S * 1000 / samplePeriodMs)
+
+    def run(error, memory, change):
+        state = array("i", [(IDENTIFY_LEVEL + error) << fixed_filter.STATE_FRACTION_BITS])
+        memories = array("i", [0] * fixed_filter.MEMORY_SIZE)
+        if kind == fixed_filter.MEDIAN:
+            for i in range(fixed_filter.MEDIAN_WINDOW):
+                memories[i] = (IDENTIFY_LEVEL + change) << 4
+        else:
+            memories[0] = int(memory * memoryScale)
+        reading = array("H", [IDENTIFY_LEVEL << 4])
+        for _ in range(samples):
+            fixed_filter.filterChannels(bytearray([kind]), state, reading, coefficients, params, memories, 1)
+        if kind == fixed_filter.MEDIAN:
+            return (state[0] / (1 << fixed_filter.STATE_FRACTION_BITS) - IDENTIFY_LEVEL, 0.0)
+        return (state[0] / (1 << fixed_filter.STATE_FRACTION_BITS) - IDENTIFY_LEVEL, memories[0] / memoryScale)
+
+    columns = (run(IDENTIFY_STEP, 0, 0), run(0, IDENTIFY_VELOCITY, 0), run(0, 0, IDENTIFY_STEP))
+    amplitudes = (IDENTIFY_STEP, IDENTIFY_VELOCITY, IDENTIFY_STEP)
+    return np.array([[column[row] / amplitude for column, amplitude in zip(columns, amplitudes)] for row in range(2)])
+
+
+class Trace:
+
+    def __init__(self, outside, flow, returnTemperature, supply, openValves):
+        self.outside = outside
+        self.flow = flow
+        self.returnTemperature = returnTemperature
+        self.supply = supply
+        self.openValves = openValves
+
+    @classmethod
+    def load(cls, path, supply=50.0):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        if not rows:
+            raise ValueError("empty trace %s" % path)
+        time = np.array([float(r["time"]) for r in rows])
+
+        def column(name, default=None):
+            if name in rows[0] and rows[0][name] != "":
+                return np.array([float(r[name]) for r in rows])
+            return np.full(len(rows), default, dtype=float)
+
+        # resample to the controller period
+        grid = np.arange(time[0], time[-1], CONTROL_PERIOD_S)
+
+        def resample(values):
+            return np.interp(grid, time, values)
+
+        return cls(
+            resample(column("outside")),
+            resample(column("flow")),
+            resample(column("return")),
+            resample(column("supply", supply)),
+            np.round(resample(column("openValves", 1.0))),
+        )
+
+
+def simulate(trace, params, flowTau=20.0, measurement=None, table=None, band=0.5, warmup=3600.0):
+    """Run all parameter sets in params (dict of equally long arrays) through the trace.
+
+    measurement is the filterModel() of the measured flow. table is (TABLE_MIN,
+    TABLE_STEPS_PER_DEGREE) of the curve tables in params["tables"], see compileTables();
+    without it the tables of the straight lines are compiled here.
+    """
+    kP = params["kP"]
+    tN = params["tN"]
+    kI = np.where(tN > 0, kP / np.where(tN > 0, tN, 1.0), 0.0)
+    sampleTime = params["sampleTime"]
+    if table is None:
+        tables, tableMin, stepsPerDegree = compileTables(params)
+    else:
+        tables = params["tables"]
+        tableMin, stepsPerDegree = table
+    if measurement is None:
+        measurement = filterModel()
+    n = len(kP)
+
+    dtMs = CONTROL_PERIOD_S * 1000.0
+    flowLag = 1.0 - math.exp(-CONTROL_PERIOD_S / flowTau)
+    maxMove = CONTROL_PERIOD_S / VALVE_PERCENT_S
+
+    flow = np.full(n, trace.flow[0])
+    measured = flow.copy()
+    filterMemory = np.zeros(n)
+    valve = np.zeros(n)
+    integral = np.zeros(n)
+    output = np.zeros(n)
+    sinceLast = np.zeros(n)
+    hasOutput = np.zeros(n, dtype=bool)
+
+    overshoot = np.zeros(n)
+    outsideBand = np.zeros(n)
+    travel = np.zeros(n)
+    warmupSteps = int(warmup / CONTROL_PERIOD_S)
+
+    for step in range(len(trace.outside)):
+        target = targets(tables, tableMin, stepsPerDegree, trace.outside[step])
+
+        # PID.__call__ with scale 'ms': recompute only once sample_time has passed,
+        # the controller skips the PID while all floor valves are closed
+        sinceLast += dtMs
+        running = trace.openValves[step] > 0
+        due = (~hasOutput | (sinceLast >= sampleTime)) & running
+        error = target - measured
+        newIntegral = np.clip(integral + kI * 1e-3 * error * sinceLast, 0.0, 100.0)
+        newOutput = np.clip(kP * error + newIntegral, 0.0, 100.0)
+        integral = np.where(due, newIntegral, integral)
+        output = np.where(due, newOutput, output)
+        sinceLast = np.where(due, 0.0, sinceLast)
+        hasOutput |= due
+
+        valveTarget = np.trunc(output) if running else np.zeros(n)
+        move = np.clip(valveTarget - valve, -maxMove, maxMove)
+        valve += move
+        travel += np.abs(move)
+
+        mix = trace.returnTemperature[step] + valve / 100.0 * (trace.supply[step] - trace.returnTemperature[step])
+        previous = flow.copy()
+        flow += (mix - flow) * flowLag
+        error = measured - flow
+        change = previous - flow
+        error, filterMemory = (measurement[0, 0] * error + measurement[0, 1] * filterMemory + measurement[0, 2] * change,
+                               measurement[1, 0] * error + measurement[1, 1] * filterMemory + measurement[1, 2] * change)
+        measured = flow + error
+
+        if step >= warmupSteps:
+            deviation = flow - target
+            np.maximum(overshoot, deviation, out=overshoot)
+            outsideBand += np.abs(deviation) > band
+
+    return overshoot, outsideBand * CONTROL_PERIOD_S, travel
+
+
+_trace = None
+_options = None
+
+
+def _init(trace, options):
+    global _trace, _options
+    _trace = trace
+    _options = options
+
+
+def _run(chunk):
+    return simulate(_trace, chunk, **_options)
+
+
+def parseValues(spec):
+    # "a,b,c" or "start:stop:count"
+    if ":" in spec:
+        start, stop, count = spec.split(":")
+        return np.linspace(float(start), float(stop), int(count))
+    return np.array([float(v) for v in spec.split(",")])
+
+
+def grid(specs):
+    axes = [parseValues(specs[name]) for name in PARAMETERS]
+    combinations = np.array(list(itertools.product(*axes)), dtype=float)
+    return {name: combinations[:, i] for i, name in enumerate(PARAMETERS)}
+
+
+def rank(values):
+    order = np.argsort(values, kind="stable")
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(len(values))
+    return ranks
+
+
+def sweep(trace, params, workers=None, chunkSize=2048, curve="", filter=("lowpass", 20.0, 0.0005, 100), **options):
+    # the firmware modules are only needed here, the workers get the compiled tables and filter model
+    params = dict(params)
+    params["tables"], tableMin, stepsPerDegree = compileTables(params, curve)
+    options["table"] = (tableMin, stepsPerDegree)
+    options["measurement"] = filterModel(*filter)
+    total = len(params["kP"])
+    chunks = [{name: values[i:i + chunkSize] for name, values in params.items()} for i in range(0, total, chunkSize)]
+    if workers == 1 or len(chunks) == 1:
+        results = [simulate(trace, chunk, **options) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init, initargs=(trace, options)) as pool:
+            results = list(pool.map(_run, chunks))
+    overshoot = np.concatenate([r[0] for r in results])
+    settling = np.concatenate([r[1] for r in results])
+    travel = np.concatenate([r[2] for r in results])
+    score = rank(overshoot) + rank(settling) + rank(travel)
+    return overshoot, settling, travel, np.argsort(score, kind="stable")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m host.sweep", description="Rank PID and heating curve parameters against a recorded trace.")
+    parser.add_argument("trace", help="CSV trace with time, outside, flow, return[, supply, openValves]")
+    for name in PARAMETERS:
+        parser.add_argument("--" + name, default=DEFAULTS[name], help="values as a,b,c or start:stop:count (default %s)" % DEFAULTS[name])
+    parser.add_argument("--supply", type=float, default=50.0, help="supply temperature if the trace has none")
+    parser.add_argument("--flow-tau", type=float, default=20.0, help="time constant of the mixing circuit in s")
+    parser.add_argument("--curve", default="", help="heating curve <outside>:<flow>,... instead of slope and origin")
+    parser.add_argument("--filter", default="lowpass", metavar="KIND[,SECONDS]", help="filter of the flow temperature, lowpass (default), median, butterworth or kalman with a time constant (default 20 s)")
+    parser.add_argument("--k2", type=float, default=0.0005, help="coefficient of the lowpass filter")
+    parser.add_argument("--sample-period", type=int, default=100, metavar="MS", help="temperature sample period of the firmware")
+    parser.add_argument("--band", type=float, default=0.5, help="settling band in K")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    trace = Trace.load(args.trace, supply=args.supply)
+    params = grid({name: getattr(args, name) for name in PARAMETERS})
+    kind, _, timeConstant = args.filter.partition(",")
+    filter = (kind, float(timeConstant or 20.0), args.k2, args.sample_period)
+    try:
+        overshoot, settling, travel, order = sweep(trace, params, workers=args.workers, curve=args.curve, filter=filter, flowTau=args.flow_tau, band=args.band)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print("%d combinations, %d steps of %.0f s" % (len(order), len(trace.outside), CONTROL_PERIOD_S))
+    print("%8s %8s %10s %7s %7s %11s %6s | %9s %10s %9s" % (PARAMETERS + ("overshoot", "settling", "travel")))
+    for i in order[:args.top]:
+        print("%8.3f %8.1f %10.0f %7.3f %7.2f %11.1f %6.1f | %8.2fK %9.0fs %8.0f%%" % (
+            tuple(params[name][i] for name in PARAMETERS) + (overshoot[i], settling[i], travel[i])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Decoding of the binary $telemetry frames published by the firmware.
+
+The layout is documented in app/telemetry.py. decode() unpacks a single frame into a
+dict shaped like the JSON frame, frames() views a buffer of concatenated frames with a
+common circuit count as a NumPy structured array without copying:
+
+    data = np.fromfile("telemetry.bin", dtype=np.uint8)
+    f = frames(data, circuits=1)
+    f["circuit"]["flow"][:, 0] / 100
+"""
+import struct
+
+import numpy as np
+
+VERSION = 1
+HEADER = "<BBBxIhh"
+HEADER_SIZE = struct.calcsize(HEADER)
+CIRCUIT = "<hhhBB"
+CIRCUIT_SIZE = struct.calcsize(CIRCUIT)
+HEAT_PUMP_ON = 1
+
+
+def decode(buffer):
+    view = memoryview(buffer)
+    version, circuits, flags, time, outside, returnTemperature = struct.unpack_from(HEADER, view, 0)
+    if version != VERSION:
+        raise ValueError("unsupported telemetry version %d" % version)
+    if len(view) != HEADER_SIZE + circuits * CIRCUIT_SIZE:
+        raise ValueError("telemetry frame of %d bytes for %d circuits" % (len(view), circuits))
+    frame = {"version": version, "time": time, "heatPump": flags & HEAT_PUMP_ON,
+             "outside": outside / 100, "return": returnTemperature / 100, "circuits": []}
+    for circuit in range(circuits):
+        flow, rawFlow, target, valveTarget, valveCurrent = struct.unpack_from(CIRCUIT, view, HEADER_SIZE + circuit * CIRCUIT_SIZE)
+        frame["circuits"].append({"flow": flow / 100, "rawFlow": rawFlow / 100, "target": target / 100,
+                                  "valveTarget": valveTarget, "valveCurrent": valveCurrent})
+    return frame
+
+
+def dtype(circuits):
+    circuit = np.dtype([("flow", "<i2"), ("rawFlow", "<i2"), ("target", "<i2"), ("valveTarget", "u1"), ("valveCurrent", "u1")])
+    return np.dtype([("version", "u1"), ("circuits", "u1"), ("flags", "u1"), ("pad", "u1"), ("time", "<u4"),
+                     ("outside", "<i2"), ("return", "<i2"), ("circuit", circuit, (circuits,))])
+
+
+def frames(buffer, circuits):
+    return np.frombuffer(buffer, dtype=dtype(circuits))
@@ -1,12 +1,15 @@
 import sys
-import time, machine, network, gc
-import os
 
 sys.path.append('/app')
 sys.path.append('/app/lib')
 
+# first, so the boot phases are timed from here
+import boot_timing
+
 from main_controller import MainController
 
+boot_timing.mark(boot_timing.IMPORTS)
+
 def main():
     # start application controller
     controller = MainController()
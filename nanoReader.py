@@ -1,36 +1,35 @@
-# main.py -- put your code here!
+# Standalone test of the Nano Leser 9 tag reader: prints every scan. In the heating
+# controller the reader runs as the nfc node, see NANO_READER in settings.py.
 
-from machine import Pin,SoftI2C,I2C
-from time import sleep_ms, sleep
+import sys
 
-i2c = I2C(0, sda=Pin(8), scl=Pin(9), freq=100_000)
+sys.path.append('/app')
 
-# detect Nano Leser 9 and read firmware and hardware version
-firmwareVersion = int.from_bytes(i2c.readfrom_mem(0x0C, 0xA0, 1), "big")
-if (firmwareVersion > 0 and firmwareVersion < 256):
-    hardwareVersion = int.from_bytes(i2c.readfrom_mem(0x0C, 0xA2, 1), "big")
-    if (hardwareVersion > 0 and hardwareVersion < 256):
+import uasyncio
+from machine import Pin, I2C
+from nano_reader import NanoReader
+
+
+async def main():
+    reader = NanoReader(I2C(0, sda=Pin(8), scl=Pin(9), freq=100_000))
+
+    # detect Nano Leser 9 and read firmware and hardware version
+    versions = reader.detect()
+    if (versions is not None):
         print("Nano Leser 9 detected!")
-        print("Hardware version: %d" % hardwareVersion)
-        print("Firmware version: %d" % firmwareVersion)
-
-# initiate tag reading
-while True:
-    i2c.readfrom_mem(0x0C, 0xA6, 1)
-    tagUUIDLen = int.from_bytes(i2c.readfrom_mem(0x0C, 0xBF, 1), "big")
-    while tagUUIDLen == 0xFF and not tagUUIDLen == 0x00:
-        sleep_ms(2)
-        tagUUIDLen = int.from_bytes(i2c.readfrom_mem(0x0C, 0xBF, 1), "big")
-    if tagUUIDLen == 0:
-        print("No tag detected!")
-    else: 
-        print("Tag detected! Length: %d" % tagUUIDLen)
-
-        uuid=[]
-        for i in range(tagUUIDLen):
-            uuid.append(int.from_bytes(i2c.readfrom_mem(0x0C, 0xB0 + i, 1), "big"))
-        
-        tagID = ''.join("%02x" % x for x in uuid)
-        print("detected tag: " + tagID)
-    
-    sleep(1)
\ No newline at end of file
+        print("Hardware version: %d" % versions[1])
+        print("Firmware version: %d" % versions[0])
+
+    while True:
+        length = await reader.scan()
+        if length < 0:
+            print("Scan timed out!")
+        elif length == 0:
+            print("No tag detected!")
+        else:
+            print("Tag detected! Length: %d" % length)
+            print("detected tag: " + reader.tagId(length))
+        await uasyncio.sleep_ms(1000)
+
+
+uasyncio.run(main())
@@ -1,6 +1,11 @@
 # Debug mode disables WDT, print mqtt messages
 DEBUG = True
 
+# Initial log level (10 debug, 20 info, 30 warning, 40 error), defaults to debug
+# in debug mode and to warning otherwise. Can be changed at runtime through the
+# Floors/logLevel property.
+# LOG_LEVEL = 20
+
 ###
 # MQTT settings
 ###
@@ -41,6 +46,35 @@ DEVICE_NAME = "espMicro"
 # messages set BROADCAST to False
 # BROADCAST = True
 
+###
+# Heating circuits
+###
+
+# One entry per heating circuit driven by this board:
+# (valve open pin, valve close pin, flow temperature ADC pin). The outside and
+# return temperature sensors and the heat pump are shared. Defaults to the single
+# circuit ((0, 1, 27),).
+# HEATING_CIRCUITS = (
+#     (0, 1, 27),
+#     (3, 4, 29),
+# )
+
+# Nano Leser 9 NFC tag reader on I2C: (I2C bus, SDA pin, SCL pin). Tag presence
+# and ID are published by the nfc node. Disabled by default.
+# NANO_READER = (0, 8, 9)
+
+# Telemetry frame published to $telemetry once per control cycle: "json",
+# "binary" (layout in app/telemetry.py) or None. Defaults to "json".
+# TELEMETRY_FORMAT = "binary"
+
+# Temperature sample period in ms. The lowpass filter coefficients are scaled
+# to keep their time constants. Defaults to 100.
+# SAMPLE_PERIOD = 100
+
+# Publish measured values to their own Homie property topics as well. With
+# False they are only published with the initial property announcement.
+# PROPERTY_UPDATES = True
+
 # Enable build-in extensions
 from homie.constants import EXT_MPY, EXT_FW, EXT_STATS
 EXTENSIONS = [
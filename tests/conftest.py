@@ -0,0 +1,51 @@
+"""Host tests of the firmware and the host tools.
+
+The firmware modules under app/ run on the stand-ins of host/sim (virtual clock,
+uasyncio, machine, homie). Most firmware modules keep their state at module level,
+the firmware fixture therefore imports them afresh for every test.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from host.sim import APP, install  # noqa: E402
+
+
+def forgetFirmware():
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if path.startswith(APP + os.sep) or name == "settings":
+            del sys.modules[name]
+
+
+@pytest.fixture
+def firmware(tmp_path, monkeypatch):
+    # the virtual clock, reset, with fresh firmware modules and the flash in tmp_path
+    install()
+    from host.sim.clock import clock
+    clock.reset()
+    forgetFirmware()
+    monkeypatch.chdir(tmp_path)
+    yield clock
+    forgetFirmware()
+
+
+@pytest.fixture
+def runFor(firmware):
+    # runs the scheduler for ms of virtual time
+    import uasyncio
+    import scheduler
+
+    def runFor(ms):
+        async def main():
+            uasyncio.create_task(scheduler.run())
+            await uasyncio.sleep_ms(ms)
+        uasyncio.run(main())
+    return runFor
@@ -0,0 +1,53 @@
+import pytest
+
+
+@pytest.fixture
+def calculator(firmware):
+    from target_flow_temperature_calculator_node import TargetFlowTemperatureCalculatorNode
+    return TargetFlowTemperatureCalculatorNode()
+
+
+@pytest.fixture
+def regulator(firmware):
+    from flow_temperature_regulator_node import FlowTemperatureRegulatorNode
+    return FlowTemperatureRegulatorNode()
+
+
+@pytest.mark.parametrize("config, invalid", [
+    ({"slope": -0.4, "origin": 36, "maxFlowTemp": 45, "shift": -1.5, "curve": "-10:40,15:28"}, None),
+    ({"slope": 1}, "slope"),
+    ({"slope": True}, "slope"),
+    ({"origin": 51}, "origin"),
+    ({"origin": "35"}, "origin"),
+    ({"maxFlowTemp": 19.9}, "maxFlowTemp"),
+    ({"shift": float("nan")}, "shift"),
+    ({"curve": "15:28,-10:40"}, "curve"),
+    ({"slope": -0.4, "offset": 1}, "offset"),
+])
+def test_calculator_config(calculator, config, invalid):
+    assert calculator.checkConfig(config) == invalid
+
+
+@pytest.mark.parametrize("config, invalid", [
+    ({"kP": 3, "tN": 900.5, "sampleTime": 30000}, None),
+    ({"kP": 100}, "kP"),
+    ({"kP": False}, "kP"),
+    ({"tN": -1}, "tN"),
+    ({"sampleTime": 30000.0}, "sampleTime"),
+    ({"sampleTime": True}, "sampleTime"),
+    ({"kD": 1}, "kD"),
+])
+def test_regulator_config(regulator, config, invalid):
+    assert regulator.checkConfig(config) == invalid
+
+
+def test_setters_apply_the_same_ranges(calculator, regulator):
+    calculator.setSlope(1.5)
+    calculator.setMaxFlowTemp(55)
+    calculator.maxFlowTemp_msg(None, "19", False)
+    calculator.setShift(-2)
+    assert (calculator.slope, calculator.maxFlowTemp, calculator.shift) == (-0.3, 40.0, -2)
+    regulator.kPPropertyMessage(None, "120", False)
+    regulator.tNPropertyMessage(None, "500", False)
+    regulator.setSampleTime(100000)
+    assert (regulator.kP, regulator.tN, regulator.sampleTime) == (2.6, 500.0, 59000)
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from host.fleet import Collector, Store
+
+
+@pytest.mark.parametrize("device, property", [
+    ("..", "Temperatures/flowTemperature"),
+    (".", "Temperatures/flowTemperature"),
+    ("", "Temperatures/flowTemperature"),
+    ("board", "../../outside"),
+    ("board", "Temperatures//flowTemperature"),
+    ("board", "/etc/flowTemperature"),
+    ("board", "Temperatures/."),
+    ("board", "Temperatures/.."),
+])
+def test_store_rejects_names_outside_its_root(tmp_path, device, property):
+    store = Store(str(tmp_path / "store"))
+    with pytest.raises(ValueError):
+        store.add(device, property, 0, 1.0)
+    assert os.listdir(tmp_path) == ["store"]
+
+
+def test_collector_skips_unsafe_topics(tmp_path):
+    store = Store(str(tmp_path))
+    collector = Collector(store, clock=lambda: 1000)
+    collector.message("devices/../Temperatures/flowTemperature", b"31.5")
+    collector.message("devices/board/../flowTemperature", b"31.5")
+    collector.message("devices/../$telemetry", b'{"outside": 1, "return": 2, "heatPump": 0, "circuits": []}')
+    collector.message("devices/board/Temperatures/flowTemperature", b"31.5")
+    assert (collector.values, collector.skipped) == (1, 3)
+    assert store.devices() == ["board"]
+
+
+@pytest.mark.parametrize("payload", [b"\x01\x01", b"", b"{not json", b'{"outside": 1}', b'{"outside": 1, "return": 2, "heatPump": 0, "circuits": [{}]}'])
+def test_collector_skips_broken_telemetry(tmp_path, payload):
+    collector = Collector(Store(str(tmp_path)), clock=lambda: 1000)
+    collector.message("devices/board/$telemetry", payload)
+    assert (collector.values, collector.skipped) == (0, 1)
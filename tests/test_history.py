@@ -0,0 +1,40 @@
+import os
+
+
+def history(channels=2):
+    from temperature_history import TemperatureHistory
+    TemperatureHistory.FILES = ("history0.bin", "history1.bin")
+    return TemperatureHistory(channels)
+
+
+def fill(h, start, hours):
+    for t in range(start, start + hours * 3600 + 120, 10):
+        h.record([2000 + t % 600, -150], t)
+
+
+def test_completed_hours_are_read_back_from_flash(firmware):
+    from temperature_history import HOUR, MINUTE
+    h = history()
+    fill(h, 36000, 3)
+    assert [t for t, *_ in h.readRecords(3600, 0, 1 << 31)] == [36000, 39600, 43200]
+    minutes = list(h.query(0, 1 << 31, MINUTE))
+    assert minutes[0][0] == 36000 and len(minutes) == 3 * 60 + 1
+    hours = list(h.query(0, 1 << 31, HOUR))
+    assert [t for t, *_ in hours] == [36000, 39600, 43200]
+    assert list(hours[0][1]) == [2000, -150] and list(hours[0][3]) == [2590, -150]
+
+
+def test_torn_record_is_skipped_and_writing_continues_in_the_other_file(firmware):
+    from temperature_history import HOUR
+    h = history()
+    fill(h, 36000, 3)
+    size = os.path.getsize(h.FILES[0])
+    with open(h.FILES[0], "r+b") as f:
+        f.truncate(size - 3)
+    assert [t for t, *_ in h.readRecords(3600, 0, 1 << 31)] == [36000, 39600]
+
+    h = history()
+    assert h.spill.activeFile == 0 and h.spill.activeFileSize == h.MAX_FILE_SIZE
+    fill(h, 46800, 2)
+    assert h.spill.activeFile == 1
+    assert [t for t, *_ in h.query(0, 1 << 31, HOUR)] == [36000, 39600, 46800, 50400]
@@ -0,0 +1,52 @@
+import pytest
+
+
+@pytest.fixture
+def files(firmware):
+    from record_files import RecordFiles
+    return lambda version=1: RecordFiles(["records0.bin", "records1.bin"], 100, 0x42, version)
+
+
+def payloads(records):
+    return [bytes(payload) for _, payload in records.records()]
+
+
+def test_records_switch_files_when_full(files):
+    records = files()
+    for i in range(10):
+        records.append(bytes([i]) * 10)
+    assert records.activeFile == 0
+    assert payloads(files()) == [bytes([i]) * 10 for i in range(4, 10)]
+    assert files().sequence == 10
+
+
+def test_torn_record_ends_the_file(files):
+    records = files()
+    for i in range(3):
+        records.append(bytes([i]) * 10)
+    with open("records0.bin", "r+b") as f:
+        f.truncate(60)
+    records = files()
+    assert payloads(records) == [bytes([0]) * 10, bytes([1]) * 10]
+    assert records.activeFileSize == 100
+    records.append(b"next")
+    assert records.activeFile == 1
+    assert payloads(files())[-1] == b"next"
+
+
+def test_corrupted_record_ends_the_file(files):
+    records = files()
+    for i in range(3):
+        records.append(bytes([i]) * 10)
+    with open("records0.bin", "r+b") as f:
+        f.seek(22 + 12)
+        f.write(b"x")
+    assert payloads(files()) == [bytes([0]) * 10]
+
+
+def test_records_of_another_version_are_skipped(files):
+    files(1).append(b"one")
+    records = files(2)
+    records.append(b"two")
+    assert payloads(records) == [b"two"]
+    assert payloads(files(1)) == [b"one"]
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from host import replay
+
+
+@pytest.fixture
+def recorded(firmware, tmp_path):
+    # an hour of the firmware in host.sim with the flow channel on the Kalman filter
+    from host.sim import Simulation
+    import fixed_filter
+    path = tmp_path / "trace.bin"
+    with open(path, "wb") as file:
+        simulation = Simulation(samplePeriodMs=2000, logLevel=40, adcTrace=file)
+        reader = next(node for node in simulation.device.nodes if node.id == "Temperatures")
+        reader.setFilter(reader.FLOW, fixed_filter.KALMAN, 20.0)
+        simulation.run(3600)
+    return reader, replay.Trace(str(path))
+
+
+def test_constants_match_the_firmware(firmware):
+    import fixed_filter
+    assert replay.STATE_FRACTION_BITS == fixed_filter.STATE_FRACTION_BITS
+    assert replay.COEFFICIENT_ONE == fixed_filter.COEFFICIENT_ONE
+
+
+def test_lowpass_matches_the_firmware_kernel(firmware):
+    readings = replay.synthetic(5000, channels=1)
+    for k in (33, 655, 20000):
+        expected = replay.lowpassReference(readings[1:, 0], readings[0, 0], k)
+        actual = replay.lowpass(readings[1:], [readings[0, 0]], [k], lanes=8, laneLength=512)
+        assert np.array_equal(actual[0], expected)
+
+
+def test_replay_reproduces_the_firmware(recorded):
+    import fixed_filter
+    reader, trace = recorded
+    assert trace.samples == 1800
+    table = replay.lookupTable()
+    assert np.array_equal(table, np.array(reader.lookupTables[0]))
+    results = replay.replay(trace.readings, trace.coefficient, trace.rawCoefficient, table,
+                            filters={reader.FLOW: (fixed_filter.KALMAN, 20.0)}, samplePeriodMs=trace.samplePeriodMs)
+    for channel, (filtered, raw, _, _) in enumerate(results):
+        assert filtered == reader.lookupTemperature(channel, reader.states[channel])
+        assert raw == reader.lookupTemperature(channel, reader.rawStates[channel])
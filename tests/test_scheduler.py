@@ -0,0 +1,65 @@
+def test_periodic_job_runs_every_period(runFor):
+    import scheduler
+    job = scheduler.every(100, lambda: None)
+    runFor(1050)
+    assert job.runs == 10
+    assert job.overruns == 0
+
+
+def test_failing_job_does_not_stop_the_others(runFor):
+    import scheduler
+    scheduler.after(10, lambda: 1 / 0)
+    sampling = scheduler.every(100, lambda: None, scheduler.HIGH)
+    runFor(2050)
+    assert sampling.runs == 20
+
+
+def test_failing_periodic_job_keeps_its_schedule(runFor):
+    import scheduler
+    job = scheduler.every(100, lambda: [][0])
+    runFor(1050)
+    assert job.runs == 10
+
+
+def test_failing_coroutine_job_keeps_its_schedule(runFor):
+    import scheduler
+
+    async def fail():
+        raise OSError(5)
+    job = scheduler.every(100, fail)
+    runFor(1050)
+    assert job.runs == 10
+    assert not job.busy
+
+
+def test_slow_coroutine_does_not_delay_other_jobs(runFor):
+    import scheduler
+    import uasyncio
+
+    async def publish():
+        await uasyncio.sleep_ms(250)
+    slow = scheduler.every(100, publish)
+    fast = scheduler.every(100, lambda: None, scheduler.HIGH)
+    runFor(1050)
+    assert fast.runs == 10
+    assert fast.overruns == 0
+    # not started again while the previous run is still waiting
+    assert slow.runs < 10
+    assert slow.overruns > 0
+
+
+def test_rebase_keeps_the_running_job_on_time(runFor):
+    import scheduler
+    scheduler.REBASE_LIMIT = 1000
+    job = scheduler.every(100, lambda: None, delay=50)
+    runFor(5000)
+    assert job.runs == 50
+    assert scheduler.overruns == 0
+
+
+def test_finishing_on_the_deadline_is_no_overrun(runFor, firmware):
+    import scheduler
+    # the callback takes exactly one period of virtual time
+    job = scheduler.every(100, lambda: firmware.advance_us(100000))
+    runFor(1000)
+    assert job.overruns == 0
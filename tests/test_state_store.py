@@ -0,0 +1,34 @@
+import sys
+
+
+def restart():
+    sys.modules.pop("state_store", None)
+    import state_store
+    state_store.FILES = ["state0.bin", "state1.bin"]
+    return state_store
+
+
+def test_snapshot_is_restored(firmware):
+    store = restart()
+    assert not store.load()
+    store.register("valve/position", lambda: 42, True)
+    store.register("curve/slope", lambda: 0.6)
+    store.snapshot()
+    store = restart()
+    assert store.load()
+    assert store.register("valve/position", lambda: 0, True) == 42
+    assert store.register("curve/slope", lambda: 0.0) == 0.6
+
+
+def test_failed_write_is_logged_and_retried_in_the_other_file(firmware):
+    import log
+    store = restart()
+    store.FILES = ["missing/state0.bin", "state1.bin"]
+    store.load()
+    store.register("valve/position", lambda: 42, True)
+    store.snapshot()
+    assert log.pending()
+    store.snapshot()
+    store = restart()
+    assert store.load()
+    assert store.register("valve/position", lambda: 0, True) == 42
@@ -0,0 +1,59 @@
+from array import array
+
+import numpy as np
+import pytest
+
+from host import sweep
+
+
+def test_targets_match_the_firmware_calculator(firmware):
+    from target_flow_temperature_calculator_node import TargetFlowTemperatureCalculatorNode
+    params = {"slope": np.array([-0.3, -0.45, -0.3]), "origin": np.array([35.0, 38.0, 35.0]),
+              "maxFlowTemp": np.array([40.0, 45.0, 50.0]), "shift": np.array([0.0, -1.5, 2.0])}
+    for curve in ("", "-15:45,-5:38,10:30,20:22"):
+        tables, tableMin, stepsPerDegree = sweep.compileTables(params, curve)
+        for combination in range(3):
+            calculator = TargetFlowTemperatureCalculatorNode()
+            calculator.setCurve(calculator.parseCurve(curve))
+            calculator.setSlope(params["slope"][combination])
+            calculator.setOrigin(params["origin"][combination])
+            calculator.setMaxFlowTemp(params["maxFlowTemp"][combination])
+            calculator.setShift(params["shift"][combination])
+            for outside in np.arange(-35.0, 35.0, 0.37):
+                target = sweep.targets(tables, tableMin, stepsPerDegree, outside)[combination]
+                assert target == calculator.calculateTargetFlowTemperature(outside)
+
+
+def test_out_of_range_parameters_are_rejected(firmware):
+    with pytest.raises(ValueError):
+        sweep.compileTables({"slope": np.array([-0.3]), "origin": np.array([35.0]), "maxFlowTemp": np.array([60.0]), "shift": np.array([0.0])})
+
+
+@pytest.mark.parametrize("kind", ["lowpass", "median", "butterworth", "kalman"])
+def test_filter_model_follows_the_firmware_kernel(firmware, kind):
+    import fixed_filter
+    samplePeriodMs = 1000
+    measurement = sweep.filterModel(kind, 30.0, 0.02, samplePeriodMs)
+    index = fixed_filter.FILTERS.index(kind)
+    params = array("i", fixed_filter.filterParameters(index, 30.0, samplePeriodMs))
+    coefficients = array("i", [fixed_filter.coefficient(0.02) if index == fixed_filter.LOWPASS else params[0]])
+    state = array("i", [2000 << fixed_filter.STATE_FRACTION_BITS])
+    memory = array("i", [0] * fixed_filter.MEMORY_SIZE)
+    fixed_filter.resetMemory(index, memory, 0, state[0])
+    reading = array("H", [0])
+
+    rng = np.random.default_rng(1)
+    inputs = 2000 + np.cumsum(rng.integers(-40, 41, 200))
+    measured = previous = 2000.0
+    filterMemory = 0.0
+    for x in inputs:
+        reading[0] = int(x) << 4
+        for _ in range(10):
+            fixed_filter.filterChannels(bytearray([index]), state, reading, coefficients, params, memory, 1)
+        error = measured - x
+        change = previous - x
+        error, filterMemory = (measurement[0, 0] * error + measurement[0, 1] * filterMemory + measurement[0, 2] * change,
+                               measurement[1, 0] * error + measurement[1, 1] * filterMemory + measurement[1, 2] * change)
+        measured = x + error
+        previous = x
+        assert measured == pytest.approx(state[0] / (1 << fixed_filter.STATE_FRACTION_BITS), abs=0.05)
@@ -0,0 +1,46 @@
+import pytest
+
+
+@pytest.fixture
+def reader(firmware):
+    from temperature_reader_node import TemperatureReaderNode
+    reader = TemperatureReaderNode()
+    for channel in range(len(reader.states)):
+        reader.states[channel] = 2000 << 14
+    return reader
+
+
+def sample(reader, residual, samples=1):
+    # readings off the filter state by residual read_u16 units, returns the changes of readiness
+    changes = []
+    for _ in range(samples):
+        for channel in range(len(reader.readings)):
+            reader.readings[channel] = (2000 << 4) + residual
+        ready = reader.ready
+        reader.updateReadiness()
+        reader.samples = getattr(reader, "samples", 0) + 1
+        if reader.ready != ready:
+            changes.append((reader.samples, reader.ready))
+    return changes
+
+
+def test_ready_after_converging(reader):
+    assert [ready for _, ready in sample(reader, 0, 30)] == [True]
+
+
+def test_readiness_holds_while_the_residual_crosses_the_threshold(reader):
+    # a ramp of the flow temperature through the threshold, about 6 codes rms either side
+    changes = sample(reader, 0, 30)
+    for _ in range(reader.readyHoldSamples // 20):
+        changes += sample(reader, 120, 40) + sample(reader, 0, 40)
+    assert [ready for _, ready in changes] == [True, False, True, False, True][:len(changes)]
+    assert len(changes) >= 3
+    for (previous, _), (t, _) in zip(changes, changes[1:]):
+        assert t - previous >= reader.readyHoldSamples
+
+
+def test_unready_after_staying_above_the_threshold(reader):
+    sample(reader, 0, 30 + reader.readyHoldSamples)
+    assert [ready for _, ready in sample(reader, 200, reader.READY_SAMPLES + 1)] == [False]
+    assert sample(reader, 0, reader.readyHoldSamples) == []
+    assert [ready for _, ready in sample(reader, 0, 1)] == [True]